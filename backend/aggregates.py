@@ -0,0 +1,57 @@
+import threading
+from typing import Any, Dict
+
+
+class Aggregates:
+    """
+    Named counters and running means, updated as events happen.
+
+    Statistics endpoints read these instead of rescanning their stores, so a
+    read costs the same however much history has accumulated. Anything added
+    must be removed again when the underlying record is deleted.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, float] = {}
+        self._sums: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, by: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + by
+
+    def decr(self, name: str, by: float = 1):
+        self.incr(name, -by)
+
+    def observe(self, name: str, value: float, count: int = 1):
+        """Add value (the sum of count observations) to the running mean `name`"""
+        with self._lock:
+            entry = self._sums.setdefault(name, [0, 0.0])
+            entry[0] += count
+            entry[1] += value
+
+    def unobserve(self, name: str, value: float, count: int = 1):
+        """Remove previously observed values"""
+        with self._lock:
+            entry = self._sums.setdefault(name, [0, 0.0])
+            entry[0] -= count
+            entry[1] -= value
+            if entry[0] <= 0:
+                entry[0], entry[1] = 0, 0.0
+
+    def count(self, name: str) -> float:
+        return self._counters.get(name, 0)
+
+    def mean(self, name: str) -> float:
+        observations, total = self._sums.get(name, (0, 0.0))
+        return total / observations if observations else 0
+
+    def observations(self, name: str) -> int:
+        return self._sums.get(name, (0, 0.0))[0]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "means": {name: (total / n if n else 0) for name, (n, total) in self._sums.items()}
+            }
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from typing import Dict, Any, List, Optional
 import uuid
 from datetime import datetime
@@ -8,11 +8,27 @@ from graph.utils.conversational_detector import detect_conversational_query
 from graph.utils.conversational_responses import generate_conversational_response
 from graph.state import GraphState
 from graph.utils.source_extractor import format_sources_for_display
+from concurrency import run_blocking
+from api.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from api.responses import fast_json
+from storage import open_store, run_storage, off_loop, ConflictError
 
 router = APIRouter()
 
-# In-memory session storage (use Redis or database in production)
-chat_sessions: Dict[str, ChatSession] = {}
+# Session storage (in-memory by default, SQLite with STORAGE_BACKEND=sqlite)
+chat_sessions = open_store(
+    "chat_sessions", codec=(lambda s: s.dict(), lambda d: ChatSession(**d)), order_by="created_at"
+)
+
+def append_message(session_id: str, message: Dict[str, Any]) -> bool:
+    """Append a message to a stored session atomically; False if the session is gone"""
+    try:
+        chat_sessions.update(session_id, lambda session: session.messages.append(message))
+        return True
+    except KeyError:
+        return False
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 def get_rag_app():
     from main import rag_app
@@ -33,7 +49,10 @@ async def send_message(request: ChatRequest, rag_app=Depends(get_rag_app)):
             )
 
         # Enhanced query detection with intent analysis
-        detection = detect_conversational_query(
+        # LLM-backed steps run on the worker pool so the event loop stays free
+        detection = await run_blocking(
+            "chat",
+            detect_conversational_query,
             request.question,
             request.subject or "general topics"
         )
@@ -70,7 +89,7 @@ async def send_message(request: ChatRequest, rag_app=Depends(get_rag_app)):
         
         # Invoke RAG system
         print(f"Invoking RAG system for: {request.question[:50]}...")
-        result = rag_app.invoke(input=input_data)
+        result = await run_blocking("chat", rag_app.invoke, input=input_data)
         
         # Extract response data
         generation = result.get("generation", "I couldn't generate an answer. Could you rephrase your question?")
@@ -95,14 +114,16 @@ async def send_message(request: ChatRequest, rag_app=Depends(get_rag_app)):
         )
 
 @router.post("/session", response_model=Dict[str, str])
-async def create_chat_session():
+@off_loop
+def create_chat_session():
     """
     Create a new chat session with conversation tracking
     """
     session_id = str(uuid.uuid4())
     session = ChatSession(
         session_id=session_id,
-        messages=[]
+        messages=[],
+        created_at=datetime.now().isoformat()
     )
     chat_sessions[session_id] = session
     
@@ -112,14 +133,15 @@ async def create_chat_session():
     }
 
 @router.get("/session/{session_id}", response_model=ChatSession)
-async def get_chat_session(session_id: str):
+@off_loop
+def get_chat_session(session_id: str):
     """
     Get chat session by ID with full conversation history
     """
     if session_id not in chat_sessions:
         raise HTTPException(status_code=404, detail="Chat session not found")
     
-    return chat_sessions[session_id]
+    return fast_json(chat_sessions[session_id].dict())
 
 @router.post("/session/{session_id}/message", response_model=ChatResponse)
 async def send_session_message(
@@ -130,24 +152,20 @@ async def send_session_message(
     """
     Send a message within a specific chat session with context tracking
     """
-    if session_id not in chat_sessions:
-        raise HTTPException(status_code=404, detail="Chat session not found")
-    
-    session = chat_sessions[session_id]
-    
-    # Add user message to session
-    session.messages.append({
+    # Add user message to session (other workers may be appending to it too)
+    if not await run_storage(append_message, session_id, {
         "role": "user",
         "content": request.question,
         "timestamp": datetime.now().isoformat(),
         "subject": request.subject
-    })
+    }):
+        raise HTTPException(status_code=404, detail="Chat session not found")
     
     # Get response from RAG system
     response = await send_message(request, rag_app)
     
-    # Add assistant message to session
-    session.messages.append({
+    # Add assistant message (skipped if the session was deleted meanwhile)
+    await run_storage(append_message, session_id, {
         "role": "assistant",
         "content": response.generation,
         "timestamp": datetime.now().isoformat(),
@@ -158,7 +176,8 @@ async def send_session_message(
     return response
 
 @router.delete("/session/{session_id}")
-async def delete_chat_session(session_id: str):
+@off_loop
+def delete_chat_session(session_id: str):
     """
     Delete a chat session
     """
@@ -168,23 +187,37 @@ async def delete_chat_session(session_id: str):
     del chat_sessions[session_id]
     return {"message": "Chat session deleted successfully"}
 
+def chat_session_listing(session_id: str, session: ChatSession) -> Dict[str, Any]:
+    return {
+        "session_id": session_id,
+        "message_count": len(session.messages),
+        "created": session.created_at or (session.messages[0]["timestamp"] if session.messages else None),
+        "last_updated": session.messages[-1]["timestamp"] if session.messages else None
+    }
+
 @router.get("/sessions")
-async def list_chat_sessions():
+@off_loop
+def list_chat_sessions(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    created_after: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    created_before: Optional[str] = Query(None, description="ISO timestamp, exclusive"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return")
+):
     """
-    List all chat sessions with metadata
+    List chat sessions with metadata, oldest first, one page at a time
+    
+    Follow **next_cursor** until it is null to get every session.
     """
-    return {
-        "sessions": [
-            {
-                "session_id": session_id,
-                "message_count": len(session.messages),
-                "created": session.messages[0]["timestamp"] if session.messages else None,
-                "last_updated": session.messages[-1]["timestamp"] if session.messages else None
-            }
-            for session_id, session in chat_sessions.items()
-        ],
+    page = paginate(
+        chat_sessions, chat_session_listing, "session_id", cursor, limit,
+        since=created_after, until=created_before, fields=fields
+    )
+    return fast_json({
+        "sessions": page["items"],
+        "next_cursor": page["next_cursor"],
         "total_sessions": len(chat_sessions)
-    }
+    })
 
 @router.get("/subjects")
 async def get_available_subjects():
@@ -197,7 +230,8 @@ async def get_available_subjects():
     }
 
 @router.post("/feedback")
-async def submit_feedback(
+@off_loop
+def submit_feedback(
     session_id: str,
     message_index: int,
     rating: int,
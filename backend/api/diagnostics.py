@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+
+from storage import storage_info, store_stats, off_loop
+
+router = APIRouter()
+
+@router.get("/storage")
+@off_loop
+def get_storage_diagnostics():
+    """
+    Live record counts and estimated sizes of every store in this worker
+
+    - **estimated_bytes**: encoded size (sampled for in-memory stores)
+    - **evicted**: records dropped by TTL or cap since this worker started
+    """
+    stores = store_stats()
+    return {
+        "storage": storage_info(),
+        "stores": stores,
+        "total_items": sum(s["items"] for s in stores),
+        "total_estimated_bytes": sum(s["estimated_bytes"] for s in stores)
+    }
@@ -1,19 +1,99 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
-from typing import Dict, Any, List
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, List, Optional
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
+import os
+import time
 
 from api.models import ErrorResponse
 from pydantic import BaseModel, Field
 from exam import ExamSystem
+from concurrency import run_blocking, llm_gate
+from api.streaming import stream_from_producer, sse_event
+from api.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from api.responses import fast_json
+from evaluation_jobs import EvaluationJobQueue, QueueFullError, public_job
+from bulk_grading import BulkGradingCheckpoint, load_graded, drop_progress
+from storage import (
+    open_store, open_aggregates, storage_info, run_storage, off_loop, ConflictError, WORKER_ID
+)
+from topic_catalog import topic_catalog, unknown_topic_message, has_material, topic_suggestions
 
 router = APIRouter()
 
-# In-memory exam storage (use Redis or database in production)
-active_exams: Dict[str, Dict[str, Any]] = {}
-exam_sessions: Dict[str, Dict[str, Any]] = {}
-evaluation_results: Dict[str, Dict[str, Any]] = {}
+# Exam storage (in-memory by default, SQLite with STORAGE_BACKEND=sqlite).
+# Sessions are indexed by exam_id and evaluations by session_id.
+active_exams = open_store("exams", indexes=("subject",), order_by="created_at")
+exam_sessions = open_store("exam_sessions", indexes=("exam_id",))
+evaluation_results = open_store("evaluation_results", indexes=("session_id",))
+# Grading job records (progress and partial results), kept for a retention period.
+# Workers heartbeat their unfinished jobs; jobs whose worker stopped are recovered.
+evaluation_jobs = open_store("evaluation_jobs", indexes=("status",))
+# Per-question results of unfinished jobs, a record per question
+evaluation_progress = open_store("evaluation_progress", indexes=("job_id",))
+bulk_grading_jobs = open_store("bulk_grading_jobs", indexes=("status",))
+# Answers graded by unfinished bulk jobs, a record per checkpoint
+bulk_grading_progress = open_store("bulk_grading_progress", indexes=("job_id",))
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+# How often a stream polls the store for a job running on another worker
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+# Bulk jobs running on this worker (also checkpointed to bulk_grading_jobs)
+running_bulk_jobs: Dict[str, Dict[str, Any]] = {}
+
+# Running statistics, updated as sessions are submitted and evaluated
+exam_stats = open_aggregates("exam")
+
+def update_session(session_id: str, mutate) -> Optional[Dict[str, Any]]:
+    """Apply mutate to a stored session atomically (safe across workers); None if it is gone"""
+    try:
+        return exam_sessions.update(session_id, mutate)
+    except KeyError:
+        return None
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+def set_submitted(session_id: str, submitted: bool, **fields) -> Optional[Dict[str, Any]]:
+    """
+    Set a session's submitted flag (and other fields) atomically, keeping the
+    submitted-session count in step
+    
+    Submitting an already submitted session is rejected, so of two concurrent
+    submissions (on any workers) only one wins.
+    """
+    flipped = False
+    def mutate(session):
+        nonlocal flipped
+        if submitted and session["submitted"]:
+            raise HTTPException(status_code=400, detail="Exam already submitted")
+        flipped = session["submitted"] != submitted
+        session["submitted"] = submitted
+        session.update(fields)
+    session = update_session(session_id, mutate)
+    if session and flipped:
+        exam_stats.incr("submitted_sessions", 1 if submitted else -1)
+    return session
+
+def evaluation_for_session(session_id: str) -> Optional[str]:
+    eval_ids = evaluation_results.keys_where("session_id", session_id)
+    return eval_ids[0] if eval_ids else None
+
+def store_evaluation(entry: Dict[str, Any], writer: Dict[str, Any] = None) -> str:
+    """Save a session's evaluation, replacing any earlier one (writer: a store batch)"""
+    previous = evaluation_for_session(entry["session_id"])
+    if previous:
+        drop_evaluation(previous)
+    eval_id = str(uuid.uuid4())
+    (evaluation_results if writer is None else writer)[eval_id] = entry
+    exam_stats.observe("percentage", entry["percentage"])
+    exam_stats.incr("llm_calls_avoided", entry.get("llm_calls_avoided", 0))
+    return eval_id
+
+def drop_evaluation(eval_id: str):
+    entry = evaluation_results.pop(eval_id)
+    exam_stats.unobserve("percentage", entry["percentage"])
+    exam_stats.decr("llm_calls_avoided", entry.get("llm_calls_avoided", 0))
 
 # Pydantic Models for Exam API
 class ExamGenerateRequest(BaseModel):
@@ -56,6 +136,15 @@ class ExamSubmissionRequest(BaseModel):
     session_id: str = Field(..., description="Exam session ID")
     answers: List[AnswerSubmission] = Field(..., description="List of answers")
 
+class SaveAnswersRequest(BaseModel):
+    answers: List[AnswerSubmission] = Field(..., description="Answers to save (replaces earlier drafts per question)")
+
+class BulkGradeRequest(BaseModel):
+    submissions: Optional[List[ExamSubmissionRequest]] = Field(
+        None, description="Submissions to grade; omit to collect every pending session with saved answers"
+    )
+    batch_mode: Optional[bool] = Field(None, description="Grade several answers per LLM call (server default if omitted)")
+
 class QuestionEvaluation(BaseModel):
     question_number: int
     score: float
@@ -78,6 +167,7 @@ class ExamEvaluationResponse(BaseModel):
     percentage: float
     overall_feedback: str
     questions_evaluated: int
+    llm_calls_avoided: int = 0
     evaluated_at: str
 
 # Dependency
@@ -108,8 +198,15 @@ async def generate_exam(
                 detail=f"Invalid subject. Must be one of: {valid_subjects}"
             )
         
+        # Reject topics with no indexed material before spending an LLM call
+        coverage = topic_catalog.match(request.topic, request.subject)
+        if not has_material(coverage):
+            raise HTTPException(status_code=400, detail=unknown_topic_message(request.topic, coverage))
+        
         # Generate exam
-        result = exam_system.generate_exam(
+        result = await run_blocking(
+            "exam",
+            exam_system.generate_exam,
             topic=request.topic,
             subject=request.subject,
             num_hard=request.num_hard,
@@ -130,58 +227,202 @@ async def generate_exam(
                 question_type=q["question_type"],
                 difficulty=q["difficulty"],
                 marks=q["marks"]
-            )
+            ).dict()
             for q in result["exam_data"]
         ]
         
         # Store full data internally for evaluation
-        active_exams[exam_id] = {
+        await run_storage(active_exams.__setitem__, exam_id, {
             "exam_id": exam_id,
             "topic": request.topic,
             "subject": request.subject,
             "questions_full": result["exam_data"],  # Full data with answers
-            "questions_public": [q.dict() for q in exam_questions_public],  # Public data
+            "questions_public": exam_questions_public,  # Public data
             "created_at": datetime.now().isoformat(),
             "total_questions": len(result["exam_data"]),
-            "total_marks": result["total_marks"]
-        }
+            "total_marks": result["total_marks"],
+            "status": "complete"
+        })
         
-        return ExamGenerateResponse(
-            success=True,
-            message=result["message"],
-            exam_id=exam_id,
-            exam_data=exam_questions_public,
-            topic=request.topic,
-            subject=request.subject,
-            total_marks=result["total_marks"],
-            total_questions=len(result["exam_data"])
-        )
+        return fast_json({
+            "success": True,
+            "message": result["message"],
+            "exam_id": exam_id,
+            "exam_data": exam_questions_public,
+            "topic": request.topic,
+            "subject": request.subject,
+            "total_marks": result["total_marks"],
+            "total_questions": len(result["exam_data"]),
+            "topic_suggestions": topic_suggestions(coverage)
+        })
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating exam: {str(e)}")
 
-@router.get("/list")
-async def list_available_exams():
+@router.post("/generate/stream")
+async def generate_exam_stream(
+    request: ExamGenerateRequest,
+    exam_system: ExamSystem = Depends(get_exam_system)
+):
     """
-    List all available exams
+    Generate an exam and stream questions as server-sent events
+    
+    Events:
+    - **exam**: exam_id allocated up front (sessions can start immediately)
+    - **question**: one public question as soon as it is generated
+    - **complete**: generation finished, the stored exam is marked complete
+    - **error**: generation failed
     """
-    exam_list = []
-    for exam_id, exam_data in active_exams.items():
-        exam_list.append({
+    valid_subjects = ["DataMining", "Network", "Distributed", "Energy"]
+    if request.subject not in valid_subjects:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid subject. Must be one of: {valid_subjects}"
+        )
+    
+    coverage = topic_catalog.match(request.topic, request.subject)
+    if not has_material(coverage):
+        raise HTTPException(status_code=400, detail=unknown_topic_message(request.topic, coverage))
+    
+    exam_id = str(uuid.uuid4())
+    requested = request.num_hard + request.num_medium
+    exam = {
+        "exam_id": exam_id,
+        "topic": request.topic,
+        "subject": request.subject,
+        "questions_full": [],
+        "questions_public": [],
+        "created_at": datetime.now().isoformat(),
+        "total_questions": requested,
+        "total_marks": request.num_hard * 10 + request.num_medium * 5,
+        "status": "generating"
+    }
+    await run_storage(active_exams.__setitem__, exam_id, exam)
+    
+    def produce(emit):
+        emit("exam", {
+            "exam_id": exam_id,
+            "topic": request.topic,
+            "subject": request.subject,
+            "requested_questions": requested,
+            "topic_suggestions": topic_suggestions(coverage)
+        })
+        try:
+            for q in exam_system.generate_exam_stream(
+                topic=request.topic,
+                subject=request.subject,
+                num_hard=request.num_hard,
+                num_medium=request.num_medium
+            ):
+                public = ExamQuestion(
+                    question_number=q["question_number"],
+                    question=q["question"],
+                    question_type=q["question_type"],
+                    difficulty=q["difficulty"],
+                    marks=q["marks"]
+                ).dict()
+                exam["questions_full"].append(q)
+                exam["questions_public"].append(public)
+                active_exams[exam_id] = exam
+                emit("question", public)
+        except Exception as e:
+            exam["status"] = "failed"
+            active_exams[exam_id] = exam
+            emit("error", {"exam_id": exam_id, "message": str(e)})
+            return
+        
+        # Final counts reflect what was actually generated
+        exam["total_questions"] = len(exam["questions_full"])
+        exam["total_marks"] = sum(q["marks"] for q in exam["questions_full"])
+        exam["status"] = "complete" if exam["questions_full"] else "failed"
+        active_exams[exam_id] = exam
+        emit("complete", {
             "exam_id": exam_id,
-            "topic": exam_data["topic"],
-            "subject": exam_data["subject"],
-            "total_questions": exam_data["total_questions"],
-            "total_marks": exam_data["total_marks"],
-            "created_at": exam_data["created_at"]
+            "status": exam["status"],
+            "total_questions": exam["total_questions"],
+            "total_marks": exam["total_marks"]
         })
     
-    return {"exams": exam_list}
+    return StreamingResponse(await stream_from_producer("exam", produce), media_type="text/event-stream")
+
+def exam_listing(exam_id: str, exam_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "exam_id": exam_id,
+        "topic": exam_data["topic"],
+        "subject": exam_data["subject"],
+        "total_questions": exam_data["total_questions"],
+        "total_marks": exam_data["total_marks"],
+        "created_at": exam_data["created_at"],
+        "status": exam_data.get("status", "complete")
+    }
+
+@router.get("/list")
+@off_loop
+def list_available_exams(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    subject: Optional[str] = Query(None),
+    created_after: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    created_before: Optional[str] = Query(None, description="ISO timestamp, exclusive"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return")
+):
+    """
+    List available exams, oldest first, one page at a time
+    
+    Follow **next_cursor** until it is null to get every exam.
+    """
+    page = paginate(
+        active_exams, exam_listing, "exam_id", cursor, limit,
+        where={"subject": subject}, since=created_after, until=created_before, fields=fields
+    )
+    return fast_json({"exams": page["items"], "next_cursor": page["next_cursor"]})
+
+@router.get("/subjects/available")
+async def get_available_exam_subjects():
+    """
+    Get available subjects for exam generation
+    """
+    return {
+        "subjects": ["DataMining", "Network", "Distributed", "Energy"],
+        "description": "Available subjects for exam generation"
+    }
+
+@router.get("/statistics")
+@off_loop
+def get_exam_statistics(exam_system: ExamSystem = Depends(get_exam_system)):
+    """
+    Get overall exam statistics, including the evaluation cache hit rate
+    
+    Counts and averages are maintained as sessions are submitted and evaluated,
+    so this does not scan sessions or results.
+    """
+    total_exams = len(active_exams)
+    total_sessions = len(exam_sessions)
+    submitted_sessions = int(exam_stats.count("submitted_sessions"))
+    total_evaluations = len(evaluation_results)
+    avg_percentage = exam_stats.mean("percentage")
+    
+    return {
+        "total_exams_created": total_exams,
+        "total_sessions": total_sessions,
+        "submitted_sessions": submitted_sessions,
+        "pending_sessions": total_sessions - submitted_sessions,
+        "total_evaluations": total_evaluations,
+        "average_percentage": round(avg_percentage, 2),
+        "evaluation_queue": evaluation_queue.stats(),
+        "llm_gate": llm_gate.stats(),
+        "llm_calls_avoided": int(exam_stats.count("llm_calls_avoided")),
+        "bulk_grading_jobs": len(bulk_grading_jobs),
+        "bulk_grading_running": len(running_bulk_jobs),
+        "evaluation_cache": exam_system.evaluation_cache.stats(),
+        "storage": storage_info()
+    }
 
 @router.get("/{exam_id}")
-async def get_exam(exam_id: str):
+@off_loop
+def get_exam(exam_id: str):
     """
     Get exam details by ID (returns questions without answers)
     """
@@ -190,34 +431,42 @@ async def get_exam(exam_id: str):
     
     exam_data = active_exams[exam_id]
     
-    return {
+    return fast_json({
         "exam_id": exam_id,
         "topic": exam_data["topic"],
         "subject": exam_data["subject"],
         "questions": exam_data["questions_public"],
         "total_questions": exam_data["total_questions"],
         "total_marks": exam_data["total_marks"],
-        "created_at": exam_data["created_at"]
-    }
+        "created_at": exam_data["created_at"],
+        "status": exam_data.get("status", "complete"),
+        "questions_available": len(exam_data["questions_public"])
+    })
 
 @router.post("/session/{exam_id}/start", response_model=ExamSessionResponse)
-async def start_exam_session(exam_id: str):
+@off_loop
+def start_exam_session(exam_id: str):
     """
     Start a new exam session for a student
+    
+    Sessions may start while a streamed exam is still being generated.
     """
     if exam_id not in active_exams:
         raise HTTPException(status_code=404, detail="Exam not found")
     
     exam_data = active_exams[exam_id]
+    if exam_data.get("status") == "failed":
+        raise HTTPException(status_code=400, detail="Exam generation failed")
     session_id = str(uuid.uuid4())
     
-    exam_sessions[session_id] = {
+    session = {
         "session_id": session_id,
         "exam_id": exam_id,
         "started_at": datetime.now().isoformat(),
         "submitted": False,
         "answers": []
     }
+    exam_sessions[session_id] = session
     
     return ExamSessionResponse(
         session_id=session_id,
@@ -226,105 +475,339 @@ async def start_exam_session(exam_id: str):
         subject=exam_data["subject"],
         total_questions=exam_data["total_questions"],
         total_marks=exam_data["total_marks"],
-        started_at=exam_sessions[session_id]["started_at"]
+        started_at=session["started_at"]
     )
 
+async def run_evaluation_job(job: Dict[str, Any], on_result) -> Dict[str, Any]:
+    """Queue runner: grade one submission and record the outcome on its session"""
+    exam_system = get_exam_system()
+    print(f"---STARTING ASYNC EVALUATION FOR SESSION {job['session_id']}---")
+    try:
+        result = await exam_system.evaluate_exam_async(
+            job["exam_id"], job["_exam"], job["_answers"], on_result=on_result
+        )
+        if not result["success"]:
+            raise RuntimeError(result.get("message", "Evaluation failed"))
+    except Exception:
+        # Let the student resubmit after a failed evaluation
+        await run_storage(set_submitted, job["session_id"], False)
+        raise
+    
+    # Store evaluation results
+    evaluated_at = datetime.now().isoformat()
+    eval_id = await run_storage(store_evaluation, {
+        **result,
+        "session_id": job["session_id"],
+        "evaluated_at": evaluated_at
+    })
+    return {**result, "eval_id": eval_id, "evaluated_at": evaluated_at}
+
+evaluation_queue = EvaluationJobQueue(run_evaluation_job, evaluation_jobs, evaluation_progress, worker_id=WORKER_ID)
+
+def exam_definition(exam_data: Dict[str, Any]) -> Dict[str, Any]:
+    """What the exam system needs to grade against"""
+    return {
+        "exam_data": exam_data["questions_full"],
+        "topic": exam_data["topic"],
+        "subject": exam_data["subject"],
+        "total_marks": exam_data["total_marks"]
+    }
+
+def missing_questions(exam_data: Dict[str, Any], answers: List[Dict[str, Any]]) -> List[int]:
+    expected_questions = set(range(1, exam_data["total_questions"] + 1))
+    return sorted(expected_questions - set(a["question_number"] for a in answers))
+
+def claim_submission(request: ExamSubmissionRequest) -> tuple:
+    """Validate a submission and mark the session submitted; returns (exam_id, exam_data, answers)"""
+    # Validate session
+    if request.session_id not in exam_sessions:
+        raise HTTPException(status_code=404, detail="Exam session not found")
+    
+    session = exam_sessions[request.session_id]
+    
+    if session["submitted"]:
+        raise HTTPException(status_code=400, detail="Exam already submitted")
+    
+    exam_id = session["exam_id"]
+    
+    if exam_id not in active_exams:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    
+    exam_data = active_exams[exam_id]
+    
+    if exam_data.get("status", "complete") != "complete":
+        raise HTTPException(status_code=409, detail="Exam is still being generated")
+    
+    # Validate all questions are answered
+    answers = [a.dict() for a in request.answers]
+    missing = missing_questions(exam_data, answers)
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Missing answers for questions: {missing}"
+        )
+    
+    # Mark session as submitted first, so a concurrent submission is rejected
+    if not set_submitted(request.session_id, True, submitted_at=datetime.now().isoformat(), answers=answers):
+        raise HTTPException(status_code=404, detail="Exam session not found")
+    return exam_id, exam_data, answers
+
+async def enqueue_evaluation(request: ExamSubmissionRequest) -> Dict[str, Any]:
+    """Validate a submission, mark the session submitted and queue its evaluation job"""
+    exam_id, exam_data, answers = await run_storage(claim_submission, request)
+    try:
+        return await queue_evaluation_job(request.session_id, exam_id, exam_data, answers)
+    except QueueFullError as e:
+        await run_storage(set_submitted, request.session_id, False)
+        raise HTTPException(status_code=503, detail=str(e))
+
+async def queue_evaluation_job(session_id: str, exam_id: str, exam_data: Dict[str, Any],
+                               answers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Queue grading for a submitted session and point the session at the job"""
+    job = evaluation_queue.submit({
+        "session_id": session_id,
+        "exam_id": exam_id,
+        "questions_total": exam_data["total_questions"],
+        # Exam definition for this submission only (nothing shared on the exam system)
+        "_exam": exam_definition(exam_data),
+        "_answers": [
+            {"question_number": a["question_number"], "answer": a["answer"]}
+            for a in answers
+        ]
+    })
+    await run_storage(update_session, session_id, lambda s: s.update(job_id=job["job_id"]))
+    return job
+
+def job_is_stale(job: Dict[str, Any]) -> bool:
+    """Unfinished, and its worker has stopped heartbeating (crashed or restarted)"""
+    return job["status"] in ("queued", "running") \
+        and time.time() - job.get("heartbeat_at", 0) > 3 * JOB_HEARTBEAT_SECONDS
+
+def claim_stale_job(store, job_id: str) -> bool:
+    """Mark a stale job failed; True for the one worker whose update wins"""
+    outcome = {}
+    def interrupt(job):
+        if not job_is_stale(job):
+            return
+        outcome["claimed"] = True
+        job.update(status="failed", error="Interrupted: the worker grading it stopped",
+                   completed_at=datetime.now().isoformat())
+    try:
+        store.update(job_id, interrupt)
+    except (KeyError, ConflictError):
+        return False
+    return outcome.get("claimed", False)
+
+def resubmission(session_id: str, job_id: Optional[str], bulk: bool = False) -> Optional[tuple]:
+    """
+    (exam_id, exam_data, answers) to grade a session whose job was lost again,
+    or None after resetting it so it can be resubmitted (or if it moved on)
+    
+    Sessions from a bulk job that cannot be resumed are reset (re-running
+    grade-all is cheap: graded answers are in the evaluation cache).
+    """
+    session = exam_sessions.get(session_id)
+    if not session or not session["submitted"] or evaluation_for_session(session_id):
+        return None
+    if session.get("bulk_job_id" if bulk else "job_id") != job_id:
+        return None  # Already moved on to another job
+    exam_data = active_exams.get(session["exam_id"])
+    answers = session.get("answers", [])
+    if bulk or not exam_data or missing_questions(exam_data, answers):
+        set_submitted(session_id, False)
+        print(f"---RESET SUBMISSION {session_id} AFTER LOST GRADING JOB---")
+        return None
+    return session["exam_id"], exam_data, answers
+
+async def recover_session(session_id: str, job_id: Optional[str], bulk: bool = False):
+    """Grade a submitted session whose job was lost again, or let it be resubmitted"""
+    resubmit = await run_storage(resubmission, session_id, job_id, bulk)
+    if not resubmit:
+        return
+    try:
+        job = await queue_evaluation_job(session_id, *resubmit)
+        print(f"---REQUEUED SUBMISSION {session_id} AS JOB {job['job_id']}---")
+    except QueueFullError:
+        await run_storage(set_submitted, session_id, False)
+
+def bulk_resumption(job_id: str, session_ids: List[str]) -> Optional[tuple]:
+    """
+    (job, exam_data, submissions) to finish a bulk job whose worker stopped,
+    or None if it cannot be resumed; the job carries the answers already graded
+    """
+    job = bulk_grading_jobs.get(job_id)
+    exam_data = job and active_exams.get(job["exam_id"])
+    if not exam_data:
+        return None
+    submissions = {}
+    for session_id in session_ids:
+        session = exam_sessions.get(session_id)
+        if session and session["submitted"] and session.get("bulk_job_id") == job_id \
+                and not evaluation_for_session(session_id):
+            submissions[session_id] = session["answers"]
+    if not submissions:
+        return None
+    graded = {s: answers for s, answers in load_graded(bulk_grading_progress, job_id).items() if s in submissions}
+    job.update({
+        "worker": WORKER_ID,
+        "status": "queued",
+        "session_ids": list(submissions),
+        "answers_total": sum(len(answers) for answers in submissions.values()),
+        "answers_graded": sum(len(answers) for answers in graded.values()),
+        "graded": graded,
+        "error": None,
+        "completed_at": None
+    })
+    return job, exam_data, submissions
+
+async def resume_bulk_job(job_id: str, session_ids: List[str]):
+    """Finish a bulk job whose worker stopped, skipping answers it already graded"""
+    resumed = await run_storage(bulk_resumption, job_id, session_ids)
+    if not resumed:
+        for session_id in session_ids:
+            await recover_session(session_id, job_id, bulk=True)
+        return
+    job, exam_data, submissions = resumed
+    await start_bulk_job(job, exam_data, submissions)
+    print(f"---RESUMED BULK GRADING {job_id}: {job['answers_graded']}/{job['answers_total']} ANSWERS ALREADY GRADED---")
+
+def find_lost_submissions(scan_sessions: bool = False) -> List[tuple]:
+    """
+    Claim jobs whose worker stopped; returns their (session_id, job_id, bulk)
+    
+    With scan_sessions (at startup) also finds submitted sessions whose job
+    record is missing altogether.
+    """
+    lost = []
+    for store, bulk in ((evaluation_jobs, False), (bulk_grading_jobs, True)):
+        for status in ("queued", "running"):
+            for job_id in store.keys_where("status", status):
+                job = store.get(job_id)
+                if job and job_is_stale(job) and claim_stale_job(store, job_id):
+                    lost.extend((session_id, job_id, bulk) for session_id in job.get("session_ids") or [job["session_id"]])
+    if not scan_sessions:
+        return lost
+    # Leave sessions submitted moments ago alone: their job may still be being queued
+    cutoff = (datetime.now() - timedelta(seconds=3 * JOB_HEARTBEAT_SECONDS)).isoformat()
+    for session_id, session in exam_sessions.items():
+        if not session["submitted"] or session.get("submitted_at", "") > cutoff:
+            continue
+        if session.get("job_id"):
+            missing = evaluation_jobs.get(session["job_id"]) is None
+        elif session.get("bulk_job_id"):
+            missing = find_bulk_job(session["bulk_job_id"]) is None
+        else:
+            missing = True
+        if missing:
+            bulk = not session.get("job_id") and bool(session.get("bulk_job_id"))
+            lost.append((session_id, session.get("bulk_job_id" if bulk else "job_id"), bulk))
+    return lost
+
+async def watch_evaluation_jobs(interval: int = JOB_HEARTBEAT_SECONDS):
+    """Background task: heartbeat this worker's jobs and recover jobs from stopped workers"""
+    loop = asyncio.get_running_loop()
+    scan_sessions = True
+    while True:
+        try:
+            evaluation_queue.heartbeat()
+            for job in list(running_bulk_jobs.values()):
+                job["_checkpoint"].save()
+            lost = await loop.run_in_executor(None, find_lost_submissions, scan_sessions)
+            scan_sessions = False
+            lost_bulk_jobs = {}
+            for session_id, job_id, bulk in lost:
+                if bulk and job_id:
+                    lost_bulk_jobs.setdefault(job_id, []).append(session_id)
+                else:
+                    await recover_session(session_id, job_id, bulk)
+            for job_id, session_ids in lost_bulk_jobs.items():
+                await resume_bulk_job(job_id, session_ids)
+        except Exception as e:
+            print(f"Error recovering evaluation jobs: {e}")
+        await asyncio.sleep(interval)
+
+@router.put("/session/{session_id}/answers")
+@off_loop
+def save_session_answers(session_id: str, request: SaveAnswersRequest):
+    """
+    Save draft answers for an exam session without submitting
+    
+    Saved sessions can later be graded together with **POST /{exam_id}/grade-all**.
+    """
+    def save(session):
+        if session["submitted"]:
+            raise HTTPException(status_code=400, detail="Exam already submitted")
+        answers = {a["question_number"]: a for a in session["answers"]}
+        for a in request.answers:
+            answers[a.question_number] = a.dict()
+        session["answers"] = [answers[n] for n in sorted(answers)]
+        session["saved_at"] = datetime.now().isoformat()
+    
+    session = update_session(session_id, save)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Exam session not found")
+    
+    return {
+        "success": True,
+        "session_id": session_id,
+        "answers_saved": len(session["answers"]),
+        "saved_at": session["saved_at"]
+    }
+
+@router.post("/evaluate/jobs")
+async def submit_exam_for_evaluation(request: ExamSubmissionRequest):
+    """
+    Queue an exam submission for evaluation and return immediately
+    
+    - Grading continues even if the client disconnects
+    - Poll **GET /evaluation/{session_id}** for partial and final results
+    - Or follow **GET /evaluation/{session_id}/stream** (server-sent events)
+    """
+    job = await enqueue_evaluation(request)
+    return {
+        "success": True,
+        "job_id": job["job_id"],
+        "session_id": request.session_id,
+        "status": job["status"],
+        "questions_total": job["questions_total"]
+    }
+
 @router.post("/evaluate", response_model=ExamEvaluationResponse)
-async def evaluate_exam_submission(
-    request: ExamSubmissionRequest,
-    exam_system: ExamSystem = Depends(get_exam_system)
-):
+async def evaluate_exam_submission(request: ExamSubmissionRequest):
     """
-    Evaluate exam submission asynchronously
+    Evaluate exam submission and wait for the result
     
     - Accepts session_id and list of answers
-    - Evaluates all answers concurrently using async processing
+    - Queues an evaluation job and waits for it to finish
     - Returns detailed evaluation with scores and feedback
     """
     try:
-        # Validate session
-        if request.session_id not in exam_sessions:
-            raise HTTPException(status_code=404, detail="Exam session not found")
-        
-        session = exam_sessions[request.session_id]
-        
-        if session["submitted"]:
-            raise HTTPException(status_code=400, detail="Exam already submitted")
+        job = await enqueue_evaluation(request)
+        job = await evaluation_queue.wait(job["job_id"])
         
-        exam_id = session["exam_id"]
-        
-        if exam_id not in active_exams:
-            raise HTTPException(status_code=404, detail="Exam not found")
-        
-        exam_data = active_exams[exam_id]
-        
-        # Validate all questions are answered
-        expected_questions = set(range(1, exam_data["total_questions"] + 1))
-        answered_questions = set(a.question_number for a in request.answers)
-        
-        if answered_questions != expected_questions:
-            missing = expected_questions - answered_questions
-            raise HTTPException(
-                status_code=400,
-                detail=f"Missing answers for questions: {sorted(missing)}"
-            )
-        
-        # Prepare answers for evaluation
-        answers_for_eval = [
-            {
-                "question_number": a.question_number,
-                "answer": a.answer
-            }
-            for a in request.answers
-        ]
-        
-        # Load exam data into exam system
-        exam_system.current_exam = {
-            "exam_data": exam_data["questions_full"],
-            "topic": exam_data["topic"],
-            "subject": exam_data["subject"],
-            "total_marks": exam_data["total_marks"]
-        }
-        
-        # Evaluate asynchronously
-        print(f"---STARTING ASYNC EVALUATION FOR SESSION {request.session_id}---")
-        evaluation_result = await exam_system.evaluate_exam_async(exam_id, answers_for_eval)
-        
-        if not evaluation_result["success"]:
+        if job["status"] != "complete":
             raise HTTPException(status_code=500, detail="Evaluation failed")
         
-        # Mark session as submitted
-        session["submitted"] = True
-        session["submitted_at"] = datetime.now().isoformat()
-        session["answers"] = [a.dict() for a in request.answers]
-        
-        # Store evaluation results
-        eval_id = str(uuid.uuid4())
-        evaluation_results[eval_id] = {
-            **evaluation_result,
-            "session_id": request.session_id,
-            "evaluated_at": datetime.now().isoformat()
-        }
-        
         # Convert evaluations to response model
         evaluations = [
-            QuestionEvaluation(**e) for e in evaluation_result["evaluations"]
+            QuestionEvaluation(**e) for e in job["evaluations"]
             if e["success"]
         ]
         
         return ExamEvaluationResponse(
             success=True,
-            exam_id=exam_id,
+            exam_id=job["exam_id"],
             session_id=request.session_id,
-            topic=evaluation_result["topic"],
-            subject=evaluation_result["subject"],
+            topic=job["topic"],
+            subject=job["subject"],
             evaluations=evaluations,
-            total_score=evaluation_result["total_score"],
-            total_max_marks=evaluation_result["total_max_marks"],
-            percentage=evaluation_result["percentage"],
-            overall_feedback=evaluation_result["overall_feedback"],
-            questions_evaluated=evaluation_result["questions_evaluated"],
-            evaluated_at=datetime.now().isoformat()
+            total_score=job["total_score"],
+            total_max_marks=job["total_max_marks"],
+            percentage=job["percentage"],
+            overall_feedback=job["overall_feedback"],
+            questions_evaluated=job["questions_evaluated"],
+            llm_calls_avoided=job["llm_calls_avoided"],
+            evaluated_at=job["evaluated_at"]
         )
         
     except HTTPException:
@@ -332,8 +815,181 @@ async def evaluate_exam_submission(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error evaluating exam: {str(e)}")
 
+async def run_bulk_grading(job: Dict[str, Any], exam: Dict[str, Any],
+                           submissions: Dict[str, List[Dict[str, Any]]]):
+    """Grade a class's submissions in the background, checkpointing as answers are graded"""
+    def store_results(result: Dict[str, Any]):
+        evaluated_at = datetime.now().isoformat()
+        with evaluation_results.batch() as batch:
+            for session_id, session_result in result["results"].items():
+                store_evaluation({
+                    **session_result,
+                    "exam_id": job["exam_id"],
+                    "topic": result["topic"],
+                    "subject": result["subject"],
+                    "bulk_job_id": job["job_id"],
+                    "evaluated_at": evaluated_at
+                }, batch)
+        exam_stats.incr("llm_calls_avoided", result["llm_calls_avoided"])
+    
+    def release_sessions():
+        # Let the students' sessions be submitted or bulk graded again
+        for session_id in submissions:
+            set_submitted(session_id, False)
+    
+    checkpoint = job["_checkpoint"]
+    job["status"] = "running"
+    job["started_at"] = datetime.now().isoformat()
+    checkpoint.save()
+    try:
+        result = await get_exam_system().grade_submissions_async(
+            job["exam_id"], exam, submissions, batch_mode=job.get("batch_mode"),
+            on_progress=checkpoint.record, graded={s: dict(answers) for s, answers in job["graded"].items()}
+        )
+        if not result["success"]:
+            raise RuntimeError(result.get("message", "Bulk grading failed"))
+        
+        await run_storage(store_results, result)
+        
+        job.update(result)
+        job["graded"] = {}
+        job["status"] = "complete"
+        print(f"---BULK GRADING {job['job_id']} COMPLETE: {result['answers_per_minute']} ANSWERS/MINUTE---")
+    except Exception as e:
+        print(f"---BULK GRADING {job['job_id']} FAILED: {e}---")
+        job["status"] = "failed"
+        job["error"] = str(e)
+        await run_storage(release_sessions)
+    finally:
+        job["completed_at"] = datetime.now().isoformat()
+        # The final record must be stored before find_bulk_job stops finding the job here
+        try:
+            await asyncio.wrap_future(checkpoint.save())
+            # Results are in the job record (or the sessions were released)
+            await run_storage(drop_progress, bulk_grading_progress, job["job_id"])
+        except Exception as e:
+            print(f"---CLEANUP OF BULK GRADING {job['job_id']} FAILED: {e}---")
+        running_bulk_jobs.pop(job["job_id"], None)
+
+async def start_bulk_job(job: Dict[str, Any], exam_data: Dict[str, Any],
+                         submissions: Dict[str, List[Dict[str, Any]]]):
+    """Store a bulk job's record and start grading it on this worker"""
+    job["_checkpoint"] = BulkGradingCheckpoint(job, bulk_grading_jobs, bulk_grading_progress)
+    running_bulk_jobs[job["job_id"]] = job
+    await asyncio.wrap_future(job["_checkpoint"].save())
+    
+    # Keep a reference so the task is not garbage collected mid-run
+    job["_task"] = asyncio.create_task(run_bulk_grading(job, exam_definition(exam_data), submissions))
+
+def claim_bulk_submissions(exam_id: str, request: BulkGradeRequest, job_id: str) -> tuple:
+    """Mark the sessions to grade in bulk as submitted; returns (exam_data, submissions, skipped)"""
+    if exam_id not in active_exams:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    
+    exam_data = active_exams[exam_id]
+    if exam_data.get("status", "complete") != "complete":
+        raise HTTPException(status_code=409, detail="Exam is still being generated")
+    
+    if request.submissions is not None:
+        candidates = []
+        for submission in request.submissions:
+            session = exam_sessions.get(submission.session_id)
+            if not session or session["exam_id"] != exam_id:
+                raise HTTPException(status_code=404, detail=f"Exam session not found: {submission.session_id}")
+            candidates.append((session, [a.dict() for a in submission.answers]))
+    else:
+        candidates = []
+        for session_id in exam_sessions.keys_where("exam_id", exam_id):
+            session = exam_sessions.get(session_id)
+            if session and not session["submitted"]:
+                candidates.append((session, session["answers"]))
+    
+    now = datetime.now().isoformat()
+    submissions = {}
+    skipped = []
+    for session, answers in candidates:
+        session_id = session["session_id"]
+        missing = missing_questions(exam_data, answers)
+        if session["submitted"]:
+            skipped.append({"session_id": session_id, "reason": "already submitted"})
+            continue
+        if missing:
+            skipped.append({"session_id": session_id, "reason": f"missing answers for questions: {missing}"})
+            continue
+        # Claim the session; it may have been submitted meanwhile (on any worker)
+        try:
+            claimed = set_submitted(session_id, True, submitted_at=now, answers=answers, bulk_job_id=job_id)
+        except HTTPException:
+            claimed = None
+        if claimed:
+            submissions[session_id] = answers
+        else:
+            skipped.append({"session_id": session_id, "reason": "already submitted"})
+    
+    if not submissions:
+        raise HTTPException(status_code=400, detail={"message": "No complete pending submissions to grade", "skipped": skipped})
+    return exam_data, submissions, skipped
+
+@router.post("/{exam_id}/grade-all")
+async def grade_all_submissions(exam_id: str, request: BulkGradeRequest = None):
+    """
+    Grade a whole class's submissions for one exam in a single background job
+    
+    - Pass **submissions** explicitly, or omit them to collect every unsubmitted
+      session of the exam whose saved answers cover all questions
+    - Identical answers across students are graded once
+    - Runs below interactive traffic in the LLM gate; progress is checkpointed
+    - Poll **GET /bulk/{job_id}** for progress and the consolidated results
+    """
+    request = request or BulkGradeRequest()
+    job_id = str(uuid.uuid4())
+    exam_data, submissions, skipped = await run_storage(claim_bulk_submissions, exam_id, request, job_id)
+    
+    job = {
+        "job_id": job_id,
+        "exam_id": exam_id,
+        "worker": WORKER_ID,
+        "heartbeat_at": time.time(),
+        "status": "queued",
+        "session_ids": list(submissions),
+        "skipped": skipped,
+        "answers_total": sum(len(answers) for answers in submissions.values()),
+        "answers_graded": 0,
+        "graded": {},
+        "batch_mode": request.batch_mode,
+        "created_at": datetime.now().isoformat(),
+        "started_at": None,
+        "completed_at": None,
+        "error": None
+    }
+    await start_bulk_job(job, exam_data, submissions)
+    
+    return {
+        "success": True,
+        "job_id": job_id,
+        "exam_id": exam_id,
+        "status": job["status"],
+        "submissions": len(submissions),
+        "answers_total": job["answers_total"],
+        "skipped": skipped
+    }
+
+@router.get("/bulk/{job_id}")
+@off_loop
+def get_bulk_grading_job(job_id: str):
+    """
+    Progress or consolidated results of a bulk grading job
+    
+    Jobs running on another worker report the answers checkpointed so far.
+    """
+    job = find_bulk_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Bulk grading job not found")
+    return public_job(job)
+
 @router.get("/session/{session_id}/status")
-async def get_session_status(session_id: str):
+@off_loop
+def get_session_status(session_id: str):
     """
     Get exam session status
     """
@@ -351,88 +1007,160 @@ async def get_session_status(session_id: str):
         "started_at": session["started_at"],
         "submitted": session["submitted"],
         "submitted_at": session.get("submitted_at"),
+        "evaluation_status": session_evaluation_status(session),
         "total_questions": exam_data["total_questions"],
         "answers_submitted": len(session.get("answers", []))
     }
 
+def find_bulk_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """A bulk job running here, or its stored record with the answers checkpointed so far"""
+    job = running_bulk_jobs.get(job_id)
+    if job:
+        return job
+    job = bulk_grading_jobs.get(job_id)
+    if job and job["status"] != "complete":
+        job = {**job, "graded": load_graded(bulk_grading_progress, job_id)}
+    return job
+
+def session_evaluation_status(session: Dict[str, Any]) -> Optional[str]:
+    job = None
+    if session.get("job_id"):
+        job = evaluation_queue.get(session["job_id"])
+    elif session.get("bulk_job_id"):
+        job = find_bulk_job(session["bulk_job_id"])
+    if job:
+        return job["status"]
+    if evaluation_for_session(session["session_id"]):
+        return "complete"
+    # Job record expired or lost; a lost job is requeued by the recovery task
+    return "unknown" if session["submitted"] else None
+
+def bulk_session_job(session_id: str, job_id: str) -> Dict[str, Any]:
+    """One session's slice of a bulk grading job, shaped like an evaluation job (None if unknown)"""
+    bulk_job = find_bulk_job(job_id)
+    if bulk_job is None:
+        return None
+    if bulk_job["status"] == "complete":
+        result = bulk_job["results"][session_id]
+    else:
+        graded = bulk_job["graded"].get(session_id, {})
+        result = {"evaluations": [graded[n] for n in sorted(graded, key=int)]}
+    return {
+        **result,
+        "job_id": job_id,
+        "session_id": session_id,
+        "exam_id": bulk_job["exam_id"],
+        "status": bulk_job["status"],
+        "questions_completed": len(result["evaluations"]),
+        "error": bulk_job["error"]
+    }
+
+def session_job(session_id: str) -> Dict[str, Any]:
+    session = exam_sessions.get(session_id)
+    job = None
+    if session and session.get("job_id"):
+        job = evaluation_queue.get(session["job_id"])
+    elif session and session.get("bulk_job_id"):
+        job = bulk_session_job(session_id, session["bulk_job_id"])
+    eval_id = None if job else evaluation_for_session(session_id)
+    if eval_id:
+        # Stored result, e.g. once the job record has expired
+        job = {
+            **evaluation_results[eval_id],
+            "job_id": session.get("job_id") or session.get("bulk_job_id") if session else None,
+            "status": "complete"
+        }
+    if not job:
+        raise HTTPException(status_code=404, detail="Evaluation not found for this session")
+    return job
+
 @router.get("/evaluation/{session_id}")
-async def get_evaluation_results(session_id: str):
+@off_loop
+def get_evaluation_results(session_id: str):
     """
     Get evaluation results for a submitted exam session
+    
+    While the job is queued or running, **evaluations** holds the questions graded
+    so far; once **status** is complete the full result (scores, feedback) is included.
+    """
+    return public_job(session_job(session_id))
+
+@router.get("/evaluation/{session_id}/stream")
+async def stream_evaluation_results(session_id: str):
     """
-    # Find evaluation by session_id
-    evaluation = None
-    for eval_id, eval_data in evaluation_results.items():
-        if eval_data.get("session_id") == session_id:
-            evaluation = eval_data
-            break
+    Follow an evaluation as server-sent events
     
-    if not evaluation:
-        raise HTTPException(status_code=404, detail="Evaluation not found for this session")
+    Events:
+    - **evaluation**: one graded question (already-graded ones are replayed first)
+    - **status**: the job started running
+    - **complete** / **failed**: final job state
+    """
+    job = await run_storage(session_job, session_id)
+    job_id = job["job_id"]
+    bulk_job_id = (await run_storage(exam_sessions.get, session_id) or {}).get("bulk_job_id")
+    if job_id == bulk_job_id and job["status"] not in ("complete", "failed"):
+        raise HTTPException(status_code=409, detail="Session is being graded in bulk; poll GET /evaluation/{session_id}")
+    
+    if not evaluation_queue.is_local(job_id) and job["status"] not in ("complete", "failed"):
+        # Graded by another worker: follow its job record in the store
+        return StreamingResponse(poll_job_events(job), media_type="text/event-stream")
     
-    return evaluation
+    async def events():
+        # Subscribe before replaying so no result falls between the two
+        listener = evaluation_queue.subscribe(job_id)
+        sent = set()
+        try:
+            for evaluation in list(job["evaluations"]):
+                sent.add(evaluation["question_number"])
+                yield sse_event("evaluation", evaluation)
+            if job["status"] in ("complete", "failed"):
+                yield sse_event(job["status"], public_job(job))
+                return
+            while True:
+                event, data = await listener.get()
+                if event == "evaluation":
+                    if data["question_number"] in sent:
+                        continue
+                    sent.add(data["question_number"])
+                yield sse_event(event, data)
+                if event in ("complete", "failed"):
+                    return
+        finally:
+            evaluation_queue.unsubscribe(job_id, listener)
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+async def poll_job_events(job: Dict[str, Any]):
+    """SSE frames for a job graded on another worker, read from its stored record"""
+    sent = set()
+    while True:
+        for evaluation in job["evaluations"]:
+            if evaluation["question_number"] not in sent:
+                sent.add(evaluation["question_number"])
+                yield sse_event("evaluation", evaluation)
+        if job["status"] in ("complete", "failed"):
+            yield sse_event(job["status"], public_job(job))
+            return
+        await asyncio.sleep(JOB_POLL_SECONDS)
+        job = await run_storage(evaluation_queue.get, job["job_id"]) or {**job, "status": "failed", "error": "Job record expired"}
 
 @router.delete("/{exam_id}")
-async def delete_exam(exam_id: str):
+@off_loop
+def delete_exam(exam_id: str):
     """
     Delete an exam and all associated sessions
     """
     if exam_id not in active_exams:
         raise HTTPException(status_code=404, detail="Exam not found")
     
-    # Delete associated sessions
-    sessions_to_delete = [
-        session_id for session_id, session in exam_sessions.items()
-        if session["exam_id"] == exam_id
-    ]
-    
-    for session_id in sessions_to_delete:
-        del exam_sessions[session_id]
-    
-    # Delete associated evaluations
-    evals_to_delete = [
-        eval_id for eval_id, eval_data in evaluation_results.items()
-        if exam_sessions.get(eval_data.get("session_id", ""), {}).get("exam_id") == exam_id
-    ]
-    
-    for eval_id in evals_to_delete:
-        del evaluation_results[eval_id]
+    # Delete associated sessions and their evaluations (via the indexes)
+    for session_id in exam_sessions.keys_where("exam_id", exam_id):
+        eval_id = evaluation_for_session(session_id)
+        if eval_id:
+            drop_evaluation(eval_id)
+        if exam_sessions.pop(session_id)["submitted"]:
+            exam_stats.decr("submitted_sessions")
     
     del active_exams[exam_id]
     
     return {"message": "Exam and associated data deleted successfully"}
-
-@router.get("/subjects/available")
-async def get_available_exam_subjects():
-    """
-    Get available subjects for exam generation
-    """
-    return {
-        "subjects": ["DataMining", "Network", "Distributed", "Energy"],
-        "description": "Available subjects for exam generation"
-    }
-
-@router.get("/statistics")
-async def get_exam_statistics():
-    """
-    Get overall exam statistics
-    """
-    total_exams = len(active_exams)
-    total_sessions = len(exam_sessions)
-    submitted_sessions = sum(1 for s in exam_sessions.values() if s["submitted"])
-    total_evaluations = len(evaluation_results)
-    
-    # Calculate average scores if evaluations exist
-    avg_percentage = 0
-    if evaluation_results:
-        percentages = [e["percentage"] for e in evaluation_results.values()]
-        avg_percentage = sum(percentages) / len(percentages)
-    
-    return {
-        "total_exams_created": total_exams,
-        "total_sessions": total_sessions,
-        "submitted_sessions": submitted_sessions,
-        "pending_sessions": total_sessions - submitted_sessions,
-        "total_evaluations": total_evaluations,
-        "average_percentage": round(avg_percentage, 2)
-    }
\ No newline at end of file
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import Dict, Any, List
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Dict, Any, List, Optional
 import uuid
 import random
+import time
+from array import array
 from datetime import datetime, timedelta
 
 from api.models import (
@@ -9,12 +11,26 @@ from api.models import (
     StudySessionRequest, StudySessionResponse, FlashcardReviewRequest
 )
 from flashcard import FlashcardSystem
+from concurrency import run_blocking
+from topic_catalog import topic_catalog, unknown_topic_message, has_material, topic_suggestions
+from spaced_repetition import scheduler
+from api.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from api.responses import fast_json, model_fields, pick
+from storage import open_store, open_aggregates, run_storage, off_loop, ConflictError
 
 router = APIRouter()
 
-# In-memory storage (use Redis or database in production)
-flashcard_sets: Dict[str, Dict[str, Any]] = {}
-study_sessions: Dict[str, Dict[str, Any]] = {}
+# Flashcard storage (in-memory by default, SQLite with STORAGE_BACKEND=sqlite);
+# study sessions are indexed by set_id, and evicted ones leave the running totals
+flashcard_sets = open_store("flashcard_sets", indexes=("subject",), order_by="created_at")
+study_sessions = open_store("study_sessions", indexes=("set_id", "completed"), order_by="started_at",
+                            on_evict=lambda session_id, session: uncount_session(session))
+
+# Running totals across study sessions, updated as sessions start and cards are reviewed
+study_stats = open_aggregates("flashcard")
+
+# Cards are validated once when a set is generated and served from the stored dicts
+FLASHCARD_FIELDS = model_fields(Flashcard)
 
 def get_flashcard_system() -> FlashcardSystem:
     from main import flashcard_system
@@ -22,6 +38,105 @@ def get_flashcard_system() -> FlashcardSystem:
         raise HTTPException(status_code=500, detail="Flashcard system not initialized")
     return flashcard_system
 
+def card_id(set_id: str, index: int) -> str:
+    """Stable ID of a card for scheduling: its set and position"""
+    return f"{set_id}:{index}"
+
+def card_for_id(cid: str) -> Optional[Dict[str, Any]]:
+    set_id, _, index = cid.rpartition(":")
+    set_data = flashcard_sets.get(set_id)
+    if set_data and index.isdigit() and int(index) < len(set_data["flashcards"]):
+        return set_data["flashcards"][int(index)]
+    return None
+
+def schedule_view(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "card_id": state["card_id"],
+        "due_at": datetime.fromtimestamp(state["due_at"]).isoformat(),
+        "interval_days": state["interval_days"],
+        "ease": state["ease"],
+        "repetitions": state["repetitions"],
+        "lapses": state["lapses"]
+    }
+
+def compact_cards(card_ids: List[str]) -> Dict[str, Any]:
+    """
+    Session card list as fixed-width arrays instead of card copies
+    
+    card_order holds each position's index within its set. Sessions spanning
+    several sets (due sessions) also keep card_sets, each position's slot in set_refs.
+    """
+    set_refs: List[str] = []
+    slots: Dict[str, int] = {}
+    card_sets = array("H")
+    card_order = array("I")
+    for cid in card_ids:
+        set_id, _, index = cid.rpartition(":")
+        if set_id not in slots:
+            slots[set_id] = len(set_refs)
+            set_refs.append(set_id)
+        card_sets.append(slots[set_id])
+        card_order.append(int(index))
+    return {
+        "set_refs": set_refs,
+        "card_sets": card_sets if len(set_refs) > 1 else None,
+        "card_order": card_order
+    }
+
+def session_card_id(session: Dict[str, Any], position: int) -> str:
+    slot = session["card_sets"][position] if session["card_sets"] is not None else 0
+    return card_id(session["set_refs"][slot], session["card_order"][position])
+
+def session_card(session: Dict[str, Any], position: int) -> Dict[str, Any]:
+    """Card content for a session position, resolved from its set"""
+    card = card_for_id(session_card_id(session, position))
+    if card is None:
+        raise HTTPException(status_code=410, detail="This flashcard's set has been deleted")
+    return card
+
+def session_cards(session: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Every card of a session, reading each of its sets once"""
+    sets = [flashcard_sets.get(set_id) for set_id in session["set_refs"]]
+    cards = []
+    for position in range(session_total(session)):
+        slot = session["card_sets"][position] if session["card_sets"] is not None else 0
+        index = session["card_order"][position]
+        if sets[slot] is None or index >= len(sets[slot]["flashcards"]):
+            raise HTTPException(status_code=410, detail="This flashcard's set has been deleted")
+        cards.append(pick(sets[slot]["flashcards"][index], FLASHCARD_FIELDS))
+    return cards
+
+def session_total(session: Dict[str, Any]) -> int:
+    return len(session["card_order"])
+
+def rating_distribution(session: Dict[str, Any]) -> Dict[int, int]:
+    counts = session["rating_counts"]
+    return {rating: counts[rating] for rating in range(1, 6) if counts[rating]}
+
+def forget_session(session_id: str):
+    """Delete a study session and take it out of the running totals"""
+    uncount_session(study_sessions.pop(session_id))
+
+def uncount_session(session: Dict[str, Any]):
+    study_stats.decr("sessions_started")
+    if session["completed"]:
+        study_stats.decr("sessions_completed")
+    study_stats.unobserve("difficulty_rating", session["rating_total"], len(session["review_ratings"]))
+
+def scheduled_cards(request: StudySessionRequest) -> List[str]:
+    """IDs of the student's due cards, from one set or across all sets, most overdue first"""
+    if request.set_id:
+        ids = [card_id(request.set_id, i) for i in range(len(flashcard_sets[request.set_id]["flashcards"]))]
+        scheduler.add_cards(request.student_id, ids)
+        now = time.time()
+        states = scheduler.card_states(request.student_id, ids).values()
+        due = sorted((s for s in states if s["due_at"] <= now), key=lambda s: s["due_at"])
+        return [s["card_id"] for s in due[:request.max_cards]]
+    return [
+        s["card_id"] for s in scheduler.due_cards(request.student_id, request.max_cards)
+        if card_for_id(s["card_id"])
+    ]
+
 @router.post("/generate", response_model=FlashcardGenerateResponse)
 async def generate_flashcards(
     request: FlashcardGenerateRequest,
@@ -39,8 +154,15 @@ async def generate_flashcards(
                 detail=f"Invalid subject. Must be one of: {valid_subjects}"
             )
         
+        # Reject topics with no indexed material before spending an LLM call
+        coverage = topic_catalog.match(request.topic, request.subject)
+        if not has_material(coverage):
+            raise HTTPException(status_code=400, detail=unknown_topic_message(request.topic, coverage))
+        
         # Generate flashcards using the flashcard system
-        result = flashcard_system.generate_flashcards(
+        result = await run_blocking(
+            "flashcard",
+            flashcard_system.generate_flashcards,
             topic=request.topic,
             subject=request.subject,
             num_cards=request.num_cards
@@ -51,62 +173,77 @@ async def generate_flashcards(
         
         # Create set ID and store flashcard data
         set_id = str(uuid.uuid4())
-        flashcards = [Flashcard(**card) for card in result["flashcard_data"]]
+        flashcards = [Flashcard(**card).dict() for card in result["flashcard_data"]]
         
         # Calculate difficulty distribution
         difficulty_counts = {}
         category_counts = {}
-        for card in result["flashcard_data"]:
+        for card in flashcards:
             diff = card.get("difficulty", "unknown")
             cat = card.get("category", "General")
             difficulty_counts[diff] = difficulty_counts.get(diff, 0) + 1
             category_counts[cat] = category_counts.get(cat, 0) + 1
         
-        flashcard_sets[set_id] = {
+        await run_storage(flashcard_sets.__setitem__, set_id, {
             "set_id": set_id,
             "topic": request.topic,
             "subject": request.subject,
-            "flashcards": result["flashcard_data"],
+            "flashcards": flashcards,
             "created_at": datetime.now().isoformat(),
-            "total_cards": len(result["flashcard_data"]),
+            "total_cards": len(flashcards),
             "difficulty_distribution": difficulty_counts,
             "category_distribution": category_counts
-        }
+        })
         
-        return FlashcardGenerateResponse(
-            success=True,
-            message=result["message"],
-            flashcard_data=flashcards,
-            subject=request.subject,
-            set_id=set_id
-        )
+        return fast_json({
+            "success": True,
+            "message": result["message"],
+            "flashcard_data": flashcards,
+            "subject": request.subject,
+            "set_id": set_id,
+            "topic_suggestions": topic_suggestions(coverage)
+        })
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating flashcards: {str(e)}")
 
+def set_listing(set_id: str, set_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "set_id": set_id,
+        "topic": set_data["topic"],
+        "subject": set_data.get("subject"),
+        "total_cards": set_data["total_cards"],
+        "created_at": set_data["created_at"],
+        "difficulty_distribution": set_data.get("difficulty_distribution", {}),
+        "category_distribution": set_data.get("category_distribution", {})
+    }
+
 @router.get("/sets")
-async def list_flashcard_sets():
-    """
-    List all available flashcard sets
+@off_loop
+def list_flashcard_sets(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    subject: Optional[str] = Query(None),
+    created_after: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    created_before: Optional[str] = Query(None, description="ISO timestamp, exclusive"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return")
+):
     """
-    sets_list = []
-    for set_id, set_data in flashcard_sets.items():
-        sets_list.append({
-            "set_id": set_id,
-            "topic": set_data["topic"],
-            "subject": set_data.get("subject"),
-            "total_cards": set_data["total_cards"],
-            "created_at": set_data["created_at"],
-            "difficulty_distribution": set_data.get("difficulty_distribution", {}),
-            "category_distribution": set_data.get("category_distribution", {})
-        })
+    List available flashcard sets, oldest first, one page at a time
     
-    return {"flashcard_sets": sets_list}
+    Follow **next_cursor** until it is null to get every set.
+    """
+    page = paginate(
+        flashcard_sets, set_listing, "set_id", cursor, limit,
+        where={"subject": subject}, since=created_after, until=created_before, fields=fields
+    )
+    return fast_json({"flashcard_sets": page["items"], "next_cursor": page["next_cursor"]})
 
 @router.get("/set/{set_id}")
-async def get_flashcard_set(set_id: str):
+@off_loop
+def get_flashcard_set(set_id: str):
     """
     Get flashcard set details by ID
     """
@@ -114,9 +251,9 @@ async def get_flashcard_set(set_id: str):
         raise HTTPException(status_code=404, detail="Flashcard set not found")
     
     set_data = flashcard_sets[set_id]
-    flashcards = [Flashcard(**card) for card in set_data["flashcards"]]
+    flashcards = [pick(card, FLASHCARD_FIELDS) for card in set_data["flashcards"]]
     
-    return {
+    return fast_json({
         "set_id": set_id,
         "topic": set_data["topic"],
         "subject": set_data.get("subject"),
@@ -125,47 +262,79 @@ async def get_flashcard_set(set_id: str):
         "created_at": set_data["created_at"],
         "difficulty_distribution": set_data.get("difficulty_distribution", {}),
         "category_distribution": set_data.get("category_distribution", {})
-    }
+    })
 
 @router.post("/study/start", response_model=StudySessionResponse)
-async def start_study_session(request: StudySessionRequest):
+@off_loop
+def start_study_session(request: StudySessionRequest):
     """
-    Start a new study session with a flashcard set
+    Start a new study session
+    
+    - Without **student_id**: the whole set, shuffled
+    - With **student_id**: only the student's cards that are due for review
+      (new cards are due immediately), from **set_id** or, for session_type
+      "due", from every set the student has studied
     """
-    if request.set_id not in flashcard_sets:
+    if request.set_id and request.set_id not in flashcard_sets:
         raise HTTPException(status_code=404, detail="Flashcard set not found")
     
-    set_data = flashcard_sets[request.set_id]
-    session_id = str(uuid.uuid4())
+    card_ids = None
+    if request.student_id:
+        if not request.set_id and request.session_type != "due":
+            raise HTTPException(status_code=400, detail="set_id is required unless session_type is 'due'")
+        card_ids = scheduled_cards(request)
+        if not card_ids:
+            next_due = scheduler.next_due_at(request.student_id)
+            detail = "No cards due for review"
+            if next_due:
+                detail += f"; next review at {datetime.fromtimestamp(next_due).isoformat()}"
+            raise HTTPException(status_code=404, detail=detail)
+        cards = compact_cards(card_ids)
+    elif request.set_id:
+        # Shuffle flashcards for better learning
+        order = list(range(len(flashcard_sets[request.set_id]["flashcards"])))
+        random.shuffle(order)
+        cards = {"set_refs": [request.set_id], "card_sets": None, "card_order": array("I", order)}
+    else:
+        raise HTTPException(status_code=400, detail="set_id is required without a student_id")
     
-    # Shuffle flashcards for better learning
-    flashcards = set_data["flashcards"].copy()
-    random.shuffle(flashcards)
+    session_id = str(uuid.uuid4())
     
-    # Create study session
-    study_sessions[session_id] = {
+    # Create study session: card references and fixed-width review records only.
+    # Review i is for card position i (cards are reviewed in order).
+    session = {
         "session_id": session_id,
         "set_id": request.set_id,
         "session_type": request.session_type,
-        "flashcards": flashcards,
+        "student_id": request.student_id,
+        **cards,
         "current_card": 0,
-        "completed_cards": 0,
+        "review_ratings": array("B"),
+        "review_times": array("d"),
+        # Running per-session aggregates: count per rating (index 1-5), and
+        # per category [reviews, rating total]
+        "rating_counts": array("I", [0] * 6),
+        "rating_total": 0,
+        "category_ratings": {},
         "started_at": datetime.now().isoformat(),
-        "reviews": [],
         "completed": False
     }
+    study_sessions[session_id] = session
+    study_stats.incr("sessions_started")
     
-    flashcard_objects = [Flashcard(**card) for card in flashcards]
+    flashcards = session_cards(session)
     
-    return StudySessionResponse(
-        session_id=session_id,
-        flashcards=flashcard_objects,
-        current_card=0,
-        total_cards=len(flashcards)
-    )
+    return fast_json({
+        "session_id": session_id,
+        "flashcards": flashcards,
+        "current_card": 0,
+        "total_cards": len(flashcards),
+        "card_ids": card_ids
+    })
 
 @router.get("/study/{session_id}/current")
-async def get_current_card(session_id: str):
+@off_loop
+def get_current_card(session_id: str):
     """
     Get the current flashcard in the study session
     """
@@ -178,66 +347,89 @@ async def get_current_card(session_id: str):
         raise HTTPException(status_code=400, detail="Study session completed")
     
     current_index = session["current_card"]
-    if current_index >= len(session["flashcards"]):
+    total_cards = session_total(session)
+    if current_index >= total_cards:
         raise HTTPException(status_code=400, detail="No more cards in session")
     
-    current_flashcard = session["flashcards"][current_index]
-    
     return {
         "session_id": session_id,
-        "current_card": Flashcard(**current_flashcard),
+        "current_card": pick(session_card(session, current_index), FLASHCARD_FIELDS),
         "card_number": current_index + 1,
-        "total_cards": len(session["flashcards"]),
-        "progress": (current_index / len(session["flashcards"])) * 100
+        "total_cards": total_cards,
+        "progress": (current_index / total_cards) * 100
     }
 
 @router.post("/study/{session_id}/review")
-async def review_flashcard(session_id: str, request: FlashcardReviewRequest):
+@off_loop
+def review_flashcard(session_id: str, request: FlashcardReviewRequest):
     """
     Submit a review/difficulty rating for the current flashcard
     """
     if session_id not in study_sessions:
         raise HTTPException(status_code=404, detail="Study session not found")
     
-    session = study_sessions[session_id]
-    
-    if session["completed"]:
-        raise HTTPException(status_code=400, detail="Study session already completed")
+    rating = request.difficulty_rating
+    reviewed = {}
     
-    current_index = session["current_card"]
-    if current_index != request.card_index:
-        raise HTTPException(status_code=400, detail="Card index mismatch")
-    
-    if current_index >= len(session["flashcards"]):
-        raise HTTPException(status_code=400, detail="No more cards in session")
+    def record_review(session):
+        if session["completed"]:
+            raise HTTPException(status_code=400, detail="Study session already completed")
+        
+        current_index = session["current_card"]
+        if current_index != request.card_index:
+            raise HTTPException(status_code=400, detail="Card index mismatch")
+        
+        total_cards = session_total(session)
+        if current_index >= total_cards:
+            raise HTTPException(status_code=400, detail="No more cards in session")
+        
+        # Record the review
+        category = session_card(session, current_index).get("category", "General")
+        session["review_ratings"].append(rating)
+        session["review_times"].append(time.time())
+        session["rating_counts"][rating] += 1
+        session["rating_total"] += rating
+        category_rating = session["category_ratings"].setdefault(category, [0, 0])
+        category_rating[0] += 1
+        category_rating[1] += rating
+        session["current_card"] += 1
+        
+        # Check if session is completed
+        if session["current_card"] >= total_cards:
+            session["completed"] = True
+            session["completed_at"] = datetime.now().isoformat()
+        reviewed.update(card_id=session_card_id(session, current_index), total_cards=total_cards)
     
-    # Record the review
-    review = {
-        "card_index": request.card_index,
-        "difficulty_rating": request.difficulty_rating,
-        "timestamp": datetime.now().isoformat(),
-        "card": session["flashcards"][current_index]
-    }
+    # Atomic read-modify-write, so a card cannot be reviewed twice from concurrent requests
+    try:
+        session = study_sessions.update(session_id, record_review)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Study session not found")
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
-    session["reviews"].append(review)
-    session["completed_cards"] += 1
-    session["current_card"] += 1
+    study_stats.observe("difficulty_rating", rating)
+    if session["completed"]:
+        study_stats.incr("sessions_completed")
     
-    # Check if session is completed
-    if session["current_card"] >= len(session["flashcards"]):
-        session["completed"] = True
-        session["completed_at"] = datetime.now().isoformat()
+    # Reschedule the card for scheduled sessions
+    next_review = None
+    if session.get("student_id"):
+        state = scheduler.review(session["student_id"], reviewed["card_id"], rating)
+        next_review = schedule_view(state)
     
     return {
         "success": True,
         "message": "Review recorded",
-        "completed_cards": session["completed_cards"],
-        "total_cards": len(session["flashcards"]),
-        "session_completed": session["completed"]
+        "completed_cards": len(session["review_ratings"]),
+        "total_cards": reviewed["total_cards"],
+        "session_completed": session["completed"],
+        "next_review": next_review
     }
 
 @router.get("/study/{session_id}/progress")
-async def get_study_progress(session_id: str):
+@off_loop
+def get_study_progress(session_id: str):
     """
     Get progress information for a study session
     """
@@ -245,16 +437,12 @@ async def get_study_progress(session_id: str):
         raise HTTPException(status_code=404, detail="Study session not found")
     
     session = study_sessions[session_id]
-    total_cards = len(session["flashcards"])
-    completed_cards = session["completed_cards"]
+    total_cards = session_total(session)
+    completed_cards = len(session["review_ratings"])
     progress_percentage = (completed_cards / total_cards * 100) if total_cards > 0 else 0
     
-    # Calculate difficulty distribution from reviews
-    difficulty_stats = {}
-    if session["reviews"]:
-        for review in session["reviews"]:
-            rating = review["difficulty_rating"]
-            difficulty_stats[rating] = difficulty_stats.get(rating, 0) + 1
+    # Difficulty distribution from the session's running counts
+    difficulty_stats = rating_distribution(session)
     
     return {
         "session_id": session_id,
@@ -269,7 +457,8 @@ async def get_study_progress(session_id: str):
     }
 
 @router.get("/study/{session_id}/results")
-async def get_study_results(session_id: str):
+@off_loop
+def get_study_results(session_id: str):
     """
     Get final results and statistics for a completed study session
     """
@@ -281,41 +470,20 @@ async def get_study_results(session_id: str):
     if not session["completed"]:
         raise HTTPException(status_code=400, detail="Study session not completed yet")
     
-    reviews = session["reviews"]
-    total_cards = len(session["flashcards"])
-    
-    # Calculate statistics
-    difficulty_distribution = {}
-    category_performance = {}
-    average_difficulty = 0
-    
-    if reviews:
-        # Difficulty distribution
-        for review in reviews:
-            rating = review["difficulty_rating"]
-            difficulty_distribution[rating] = difficulty_distribution.get(rating, 0) + 1
-        
-        # Average difficulty
-        total_rating = sum(review["difficulty_rating"] for review in reviews)
-        average_difficulty = total_rating / len(reviews)
-        
-        # Category performance
-        for review in reviews:
-            card = review["card"]
-            category = card.get("category", "General")
-            if category not in category_performance:
-                category_performance[category] = {
-                    "total_cards": 0,
-                    "average_difficulty": 0,
-                    "total_rating": 0
-                }
-            category_performance[category]["total_cards"] += 1
-            category_performance[category]["total_rating"] += review["difficulty_rating"]
-        
-        # Calculate average difficulty per category
-        for category in category_performance:
-            cat_data = category_performance[category]
-            cat_data["average_difficulty"] = cat_data["total_rating"] / cat_data["total_cards"]
+    total_cards = session_total(session)
+    reviews = len(session["review_ratings"])
+    
+    # Statistics come from the running aggregates kept on the session
+    difficulty_distribution = rating_distribution(session)
+    average_difficulty = session["rating_total"] / reviews if reviews else 0
+    category_performance = {
+        category: {
+            "total_cards": count,
+            "average_difficulty": total / count,
+            "total_rating": total
+        }
+        for category, (count, total) in session["category_ratings"].items()
+    }
     
     # Generate study recommendations
     recommendations = []
@@ -326,6 +494,13 @@ async def get_study_results(session_id: str):
     else:
         recommendations.append("Good progress! Consider spaced repetition for better retention")
     
+    next_review_at = None
+    if session.get("student_id"):
+        next_due = scheduler.next_due_at(session["student_id"])
+        if next_due:
+            next_review_at = datetime.fromtimestamp(next_due).isoformat()
+            recommendations.append(f"Next review is due at {next_review_at}")
+    
     # Calculate session duration
     started_at = datetime.fromisoformat(session["started_at"])
     completed_at = datetime.fromisoformat(session["completed_at"])
@@ -339,12 +514,14 @@ async def get_study_results(session_id: str):
         "category_performance": category_performance,
         "session_duration_minutes": round(duration_minutes, 2),
         "recommendations": recommendations,
+        "next_review_at": next_review_at,
         "started_at": session["started_at"],
         "completed_at": session["completed_at"]
     }
 
 @router.delete("/set/{set_id}")
-async def delete_flashcard_set(set_id: str):
+@off_loop
+def delete_flashcard_set(set_id: str):
     """
     Delete a flashcard set
     """
@@ -352,27 +529,24 @@ async def delete_flashcard_set(set_id: str):
         raise HTTPException(status_code=404, detail="Flashcard set not found")
     
     # Delete associated study sessions
-    sessions_to_delete = [
-        session_id for session_id, session in study_sessions.items()
-        if session["set_id"] == set_id
-    ]
-    
-    for session_id in sessions_to_delete:
-        del study_sessions[session_id]
+    for session_id in study_sessions.keys_where("set_id", set_id):
+        forget_session(session_id)
     
+    scheduler.remove_cards(card_id(set_id, i) for i in range(len(flashcard_sets[set_id]["flashcards"])))
     del flashcard_sets[set_id]
     
     return {"message": "Flashcard set deleted successfully"}
 
 @router.delete("/study/{session_id}")
-async def delete_study_session(session_id: str):
+@off_loop
+def delete_study_session(session_id: str):
     """
     Delete a study session
     """
     if session_id not in study_sessions:
         raise HTTPException(status_code=404, detail="Study session not found")
     
-    del study_sessions[session_id]
+    forget_session(session_id)
     
     return {"message": "Study session deleted successfully"}
 
@@ -386,22 +560,66 @@ async def get_available_flashcard_subjects():
         "description": "Available subjects for flashcard generation"
     }
 
+@router.get("/due/{student_id}")
+@off_loop
+def get_due_cards(student_id: str, limit: int = 20):
+    """
+    Next cards due for review for a student, most overdue first
+    """
+    due = [
+        {**schedule_view(state), "card": card_for_id(state["card_id"])}
+        for state in scheduler.due_cards(student_id, max(1, min(limit, 200)))
+        if card_for_id(state["card_id"])
+    ]
+    next_due = scheduler.next_due_at(student_id)
+    return {
+        "student_id": student_id,
+        "due_cards": due,
+        "next_due_at": datetime.fromtimestamp(next_due).isoformat() if next_due else None
+    }
+
+def study_session_listing(session_id: str, session_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "session_id": session_id,
+        "set_id": session_data["set_id"],
+        "session_type": session_data["session_type"],
+        "started_at": session_data["started_at"],
+        "completed": session_data["completed"],
+        "completed_cards": len(session_data["review_ratings"]),
+        "total_cards": session_total(session_data),
+        "progress_percentage": (len(session_data["review_ratings"]) / session_total(session_data) * 100) if session_total(session_data) > 0 else 0
+    }
+
 @router.get("/study/sessions")
-async def list_study_sessions():
+@off_loop
+def list_study_sessions(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    set_id: Optional[str] = Query(None),
+    completed: Optional[bool] = Query(None),
+    started_after: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    started_before: Optional[str] = Query(None, description="ISO timestamp, exclusive"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return")
+):
     """
-    List all study sessions
+    List study sessions, oldest first, one page at a time, with overall totals
+    from the running aggregates
+    
+    Follow **next_cursor** until it is null to get every session.
     """
-    sessions_list = []
-    for session_id, session_data in study_sessions.items():
-        sessions_list.append({
-            "session_id": session_id,
-            "set_id": session_data["set_id"],
-            "session_type": session_data["session_type"],
-            "started_at": session_data["started_at"],
-            "completed": session_data["completed"],
-            "completed_cards": session_data["completed_cards"],
-            "total_cards": len(session_data["flashcards"]),
-            "progress_percentage": (session_data["completed_cards"] / len(session_data["flashcards"]) * 100) if len(session_data["flashcards"]) > 0 else 0
-        })
+    page = paginate(
+        study_sessions, study_session_listing, "session_id", cursor, limit,
+        where={"set_id": set_id, "completed": completed},
+        since=started_after, until=started_before, fields=fields
+    )
     
-    return {"study_sessions": sessions_list}
\ No newline at end of file
+    return fast_json({
+        "study_sessions": page["items"],
+        "next_cursor": page["next_cursor"],
+        "summary": {
+            "total_sessions": int(study_stats.count("sessions_started")),
+            "completed_sessions": int(study_stats.count("sessions_completed")),
+            "total_reviews": study_stats.observations("difficulty_rating"),
+            "average_difficulty_rating": round(study_stats.mean("difficulty_rating"), 2)
+        }
+    })
\ No newline at end of file
@@ -5,6 +5,7 @@ import os
 import tempfile
 from pathlib import Path
 import logging
+import uuid
 from dotenv import load_dotenv
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
@@ -13,6 +14,9 @@ from langchain_pinecone import PineconeVectorStore
 from pinecone import Pinecone
 from langchain_community.document_loaders import TextLoader, PyPDFLoader
 
+from topic_catalog import topic_catalog
+from topic_context import topic_context
+
 load_dotenv()
 
 # Initialize logging
@@ -48,14 +52,24 @@ def ingest_documents(documents, subject: str, batch_size: int = 50):
         
         # Upload to Pinecone in batches to avoid token limit
         total_ingested = 0
+        topics_catalogued = 0
         for i in range(0, len(split_documents), batch_size):
             batch = split_documents[i:i + batch_size]
+            # Explicit chunk IDs so the topic catalogue can point back at representative chunks
+            chunk_ids = [str(uuid.uuid4()) for _ in batch]
+            for doc, chunk_id in zip(batch, chunk_ids):
+                doc.metadata["chunk_id"] = chunk_id
             try:
                 PineconeVectorStore.from_documents(
                     documents=batch,
                     embedding=embedding,
+                    ids=chunk_ids,
                     index_name=os.environ["INDEX_NAME"]
                 )
+                topics_catalogued = topic_catalog.add_chunks(
+                    subject,
+                    [(chunk_id, doc.page_content) for chunk_id, doc in zip(chunk_ids, batch)]
+                )
                 total_ingested += len(batch)
                 logger.info(f"✅ Batch {i//batch_size + 1}: Ingested {len(batch)} chunks ({total_ingested}/{len(split_documents)})")
             except Exception as batch_error:
@@ -63,10 +77,13 @@ def ingest_documents(documents, subject: str, batch_size: int = 50):
                 raise
         
         logger.info(f"✅ Successfully ingested {total_ingested} chunks with subject: {subject}")
+        # Cached generation contexts for this subject no longer reflect the index
+        topic_context.invalidate(subject)
         return {
             "status": "success",
             "chunks_ingested": total_ingested,
-            "subject": subject
+            "subject": subject,
+            "topics_catalogued": topics_catalogued
         }
     except Exception as e:
         logger.error(f"❌ Error ingesting documents: {str(e)}")
@@ -33,6 +33,7 @@ class QuizGenerateRequest(BaseModel):
     subject: Optional[str] = Field(None, description="Subject filter")
     num_questions: int = Field(5, ge=1, le=20, description="Number of questions")
     difficulty: Optional[DifficultyLevel] = Field(None, description="Difficulty level filter")
+    student_id: Optional[str] = Field(None, description="Student ID, used to avoid repeating recently seen questions")
 
 class QuizQuestion(BaseModel):
     question: str
@@ -88,14 +89,17 @@ class FlashcardGenerateResponse(BaseModel):
     set_id: Optional[str] = None
 
 class StudySessionRequest(BaseModel):
-    set_id: str
-    session_type: str = Field("review", description="Type of study session")
+    set_id: Optional[str] = Field(None, description="Flashcard set to study (required unless session_type is 'due')")
+    session_type: str = Field("review", description="Type of study session; 'due' studies a student's due cards from all sets")
+    student_id: Optional[str] = Field(None, description="Schedule reviews for this student with spaced repetition")
+    max_cards: int = Field(20, ge=1, le=200, description="Maximum due cards in a scheduled session")
 
 class StudySessionResponse(BaseModel):
     session_id: str
     flashcards: List[Flashcard]
     current_card: int
     total_cards: int
+    card_ids: Optional[List[str]] = None
 
 class FlashcardReviewRequest(BaseModel):
     session_id: str
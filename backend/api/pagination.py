@@ -0,0 +1,63 @@
+import base64
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from storage import Store
+
+# Page sizes for list endpoints
+DEFAULT_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", "500"))
+
+
+def encode_cursor(order_value: Any, key: str) -> str:
+    """Opaque cursor for the position just after (order_value, key)"""
+    return base64.urlsafe_b64encode(json.dumps([order_value, key]).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, str]]:
+    if not cursor:
+        return None
+    try:
+        order_value, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return order_value, key
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_fields(fields: Optional[str], allowed: List[str], id_field: str) -> Optional[List[str]]:
+    """Requested fields from a comma-separated list (the ID is always included)"""
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {unknown}. Available: {allowed}")
+    return [id_field] + [f for f in requested if f != id_field]
+
+
+def paginate(store: Store, summarize: Callable[[str, Any], Dict[str, Any]], id_field: str,
+             cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+             where: Optional[Dict[str, Any]] = None, since: Optional[str] = None,
+             until: Optional[str] = None, fields: Optional[str] = None) -> Dict[str, Any]:
+    """
+    One page of a store's records in creation order, summarized and projected
+
+    Returns the page's items and next_cursor (None on the last page). Filters
+    whose value is None are ignored.
+    """
+    where = {field: value for field, value in (where or {}).items() if value is not None}
+    rows = store.page(decode_cursor(cursor), limit + 1, where, since, until)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_key, last_record = rows[-1]
+        next_cursor = encode_cursor(store.order_value(last_record), last_key)
+
+    items = [summarize(key, record) for key, record in rows]
+    if fields and items:
+        selected = parse_fields(fields, list(items[0]), id_field)
+        items = [{f: item[f] for f in selected} for item in items]
+    return {"items": items, "next_cursor": next_cursor}
@@ -1,25 +1,140 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
 from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import asyncio
+import os
+import time
+
+from api.pagination import paginate, parse_fields, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from proctoring import (
+    ProctoringCapacityError, ProctoringSourceError, ProctoringSourceInUseError, PROCTORING_MAX_SESSIONS
+)
+from storage import open_store, run_storage, off_loop, ConflictError, WORKER_ID
 
 router = APIRouter()
 
 # Global proctoring system instance
 proctoring_system = None
 
+# Each student's session runs on one worker. Its lease is shared so any worker
+# can answer /status and forward /stop; the lease lapses if the owner stops
+# heartbeating (crashed or restarted).
+PROCTORING_HEARTBEAT_SECONDS = int(os.getenv("PROCTORING_HEARTBEAT_SECONDS", "5"))
+proctoring_state = open_store("proctoring_state")
+# Heartbeat task per student proctored on this worker
+lease_tasks = {}
+# Video feeds block on the camera between frames: give them their own threads,
+# one per session, rather than the threadpool streaming responses share
+feed_executor = ThreadPoolExecutor(max_workers=PROCTORING_MAX_SESSIONS, thread_name_prefix="video-feed")
+
 def set_proctoring_system(system):
     """Set the global proctoring system instance"""
     global proctoring_system
     proctoring_system = system
     print("Proctoring system initialized in API routes")
 
+
+def lease_is_live(lease: Optional[Dict[str, Any]]) -> bool:
+    return bool(lease and lease["owner"]
+                and time.time() - lease["heartbeat_at"] < 3 * PROCTORING_HEARTBEAT_SECONDS)
+
+
+def claim_session(username: str, total_time: int) -> Optional[Dict[str, Any]]:
+    """
+    Take the student's session lease for this worker
+
+    Returns None once claimed, or the lease of the other worker that holds it.
+    """
+    now = time.time()
+    lease = {"owner": WORKER_ID, "username": username, "started_at": now,
+             "total_time": total_time, "heartbeat_at": now, "stop_requested": False}
+    outcome = {}
+
+    def take_over(current):
+        if current["owner"] != WORKER_ID and lease_is_live(current):
+            outcome["held_by"] = dict(current)
+            return
+        current.update(lease)
+
+    while True:
+        if proctoring_state.add(username, lease):
+            return None
+        try:
+            proctoring_state.update(username, take_over)
+            return outcome.get("held_by")
+        except KeyError:
+            continue  # Released between the two calls
+
+
+def release_session(username: str):
+    """Delete the student's lease if this worker still holds it"""
+    try:
+        proctoring_state.discard(username, lambda current: current["owner"] == WORKER_ID)
+    except ConflictError as e:
+        print(f"Error releasing proctoring lease for {username}: {e}")
+
+
+def lease_time_remaining(lease: Dict[str, Any]) -> int:
+    return int(max(0, lease["started_at"] + lease["total_time"] - time.time()))
+
+
+def remote_lease(username: str) -> Optional[Dict[str, Any]]:
+    """The live lease of another worker proctoring this student, if any"""
+    lease = proctoring_state.get(username)
+    if lease_is_live(lease) and lease["owner"] != WORKER_ID:
+        return lease
+    return None
+
+
+async def relay_frames(frames):
+    """Pull a session's frames on the feed threads and stream them"""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            frame = await loop.run_in_executor(feed_executor, next, frames, None)
+            if frame is None:
+                break
+            yield frame
+    finally:
+        # Releases the camera if the client went away mid-stream
+        await loop.run_in_executor(feed_executor, frames.close)
+
+
+async def hold_session(session):
+    """Heartbeat a session's lease while it runs here; stop it when another worker asks to"""
+    username = session.username
+
+    def heartbeat(current):
+        if current["owner"] == WORKER_ID:
+            current["heartbeat_at"] = time.time()
+
+    try:
+        while session.video_feed_active:
+            await asyncio.sleep(PROCTORING_HEARTBEAT_SECONDS)
+            try:
+                lease = await run_storage(proctoring_state.update, username, heartbeat)
+            except (KeyError, ConflictError) as e:
+                print(f"Error renewing proctoring lease for {username}: {e}")
+                continue
+            if lease["owner"] != WORKER_ID or lease["stop_requested"]:
+                print(f"---Stopping proctoring for {username} on request from another worker---")
+                session.stop_proctoring()
+            else:
+                session.get_feed_status()  # Stops once the exam time is up
+    finally:
+        lease_tasks.pop(username, None)
+        await run_storage(release_session, username)
+
+
 # Pydantic Models
 class StartProctoringRequest(BaseModel):
     username: str
     exam_duration: Optional[int] = 3600  # Duration in seconds (default 1 hour)
+    camera_source: Optional[str] = None  # Device index or a configured source (default: a free PROCTORING_CAMERA_SOURCES camera)
+    audio_device: Optional[int] = None  # Input device next to a local camera (default microphone if unset)
 
 class ProctoringStatusResponse(BaseModel):
     active: bool
@@ -44,6 +159,47 @@ class AltTabEvent(BaseModel):
     time_elapsed: Optional[float] = None
     username: Optional[str] = None
 
+def stop_session(username: str) -> ProctoringResponse:
+    """Stop a student's session here, or ask the worker running it to"""
+    if proctoring_system.stop_session(username):
+        release_session(username)
+        return ProctoringResponse(
+            status="inactive",
+            message=f"Proctoring stopped successfully for {username}",
+            data={
+                "username": username,
+                "stopped_at": datetime.now().isoformat()
+            }
+        )
+
+    lease = remote_lease(username)
+    if lease:
+        # The session is on another worker: it stops on its next heartbeat
+        try:
+            proctoring_state.update(username, lambda current: current.update(stop_requested=True))
+        except (KeyError, ConflictError):
+            pass
+        return ProctoringResponse(
+            status="stopping",
+            message=f"Stop requested for {username}",
+            data={"username": username, "worker": lease["owner"]}
+        )
+    return ProctoringResponse(
+        status="inactive",
+        message=f"Proctoring is not currently active for {username}"
+    )
+
+
+def only_username() -> Optional[str]:
+    """The student being proctored when exactly one is (for calls that name nobody)"""
+    sessions = proctoring_system.active_sessions()
+    if len(sessions) > 1:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{len(sessions)} students are being proctored; pass the username"
+        )
+    return sessions[0].username if sessions else None
+
 # API Endpoints
 
 @router.post("/start", response_model=ProctoringResponse)
@@ -51,98 +207,187 @@ async def start_proctoring(request: StartProctoringRequest):
     """
     Start proctoring for a user
     
+    Each student gets their own session; up to PROCTORING_MAX_SESSIONS run at once.
+    
     Parameters:
     - username: The username of the student
     - exam_duration: Duration of exam in seconds (default: 3600 = 1 hour)
+    - camera_source: Camera device index, or one of PROCTORING_CAMERA_SOURCES, for this
+      student (default: the first configured camera no other session is using)
+    - audio_device: Microphone for a local camera; sound is not checked for streams
     """
     if proctoring_system is None:
         raise HTTPException(status_code=500, detail="Proctoring system not initialized")
     
     if not request.username or request.username.strip() == "":
         raise HTTPException(status_code=400, detail="Username is required")
+    username = request.username.strip()
     
     # Check if already active
-    if proctoring_system.video_feed_active:
+    session = proctoring_system.get_session(username)
+    if session is not None:
         return ProctoringResponse(
             status="already_active",
-            message=f"Proctoring is already active for user: {proctoring_system.current_username}",
+            message=f"Proctoring is already active for user: {username}",
             data={
-                "current_user": proctoring_system.current_username,
-                "time_remaining": proctoring_system.get_feed_status()["time_remaining"]
+                "current_user": username,
+                "time_remaining": session.get_feed_status()["time_remaining"]
+            }
+        )
+    
+    total_time = request.exam_duration if request.exam_duration and request.exam_duration > 0 \
+        else proctoring_system.total_time
+    held_by = await run_storage(claim_session, username, total_time)
+    if held_by:
+        return ProctoringResponse(
+            status="already_active",
+            message=f"Proctoring is already active for user: {username}",
+            data={
+                "current_user": username,
+                "time_remaining": lease_time_remaining(held_by),
+                "worker": held_by["owner"]
             }
         )
     
     try:
-        # Set exam duration if provided
-        if request.exam_duration and request.exam_duration > 0:
-            proctoring_system.total_time = request.exam_duration
-        
-        # Start proctoring
-        proctoring_system.start_proctoring(request.username)
+        # Opens the audio stream and starts its thread: keep it off the event loop
+        session = await asyncio.to_thread(
+            proctoring_system.start_session, username, total_time, request.camera_source, request.audio_device
+        )
+        lease_tasks[username] = asyncio.create_task(hold_session(session))
         
         return ProctoringResponse(
             status="active",
-            message=f"Proctoring started successfully for {request.username}",
+            message=f"Proctoring started successfully for {username}",
             data={
-                "username": request.username,
-                "duration_seconds": proctoring_system.total_time,
-                "duration_minutes": proctoring_system.total_time // 60
+                "username": username,
+                "duration_seconds": session.total_time,
+                "duration_minutes": session.total_time // 60,
+                "sound_detection": session.audio_enabled,
+                "active_sessions": len(proctoring_system.sessions)
             }
         )
+    except ProctoringCapacityError as e:
+        await run_storage(release_session, username)
+        raise HTTPException(status_code=503, detail=str(e))
+    except ProctoringSourceError as e:
+        await run_storage(release_session, username)
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProctoringSourceInUseError as e:
+        await run_storage(release_session, username)
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         print(f"Error starting proctoring: {e}")
+        await run_storage(release_session, username)
         raise HTTPException(status_code=500, detail=f"Error starting proctoring: {str(e)}")
 
 
+@router.post("/stop/{username}", response_model=ProctoringResponse)
+@off_loop
+def stop_proctoring(username: str):
+    """
+    Stop a student's proctoring session
+    """
+    if proctoring_system is None:
+        raise HTTPException(status_code=500, detail="Proctoring system not initialized")
+    
+    try:
+        return stop_session(username)
+    except Exception as e:
+        print(f"Error stopping proctoring: {e}")
+        raise HTTPException(status_code=500, detail=f"Error stopping proctoring: {str(e)}")
+
+
 @router.post("/stop", response_model=ProctoringResponse)
-async def stop_proctoring():
+async def stop_only_session():
     """
-    Stop proctoring session
+    Stop the proctoring session when only one student is being proctored
+    
+    Use /stop/{username} when several are.
     """
     if proctoring_system is None:
         raise HTTPException(status_code=500, detail="Proctoring system not initialized")
     
-    if not proctoring_system.video_feed_active:
+    username = only_username()
+    if username is None:
         return ProctoringResponse(
             status="inactive",
             message="Proctoring is not currently active"
         )
+    return await stop_proctoring(username)
+
+
+@router.get("/status/{username}", response_model=ProctoringStatusResponse)
+@off_loop
+def get_proctoring_status(username: str):
+    """
+    Get a student's proctoring status and time remaining
+    """
+    if proctoring_system is None:
+        raise HTTPException(status_code=500, detail="Proctoring system not initialized")
     
     try:
-        username = proctoring_system.current_username
-        proctoring_system.stop_proctoring()
+        session = proctoring_system.get_session(username)
+        if session is not None:
+            status = session.get_feed_status()
+            return ProctoringStatusResponse(
+                active=status["active"],
+                time_remaining=status["time_remaining"],
+                username=username if status["active"] else None
+            )
         
-        return ProctoringResponse(
-            status="inactive",
-            message=f"Proctoring stopped successfully for {username}",
-            data={
-                "username": username,
-                "stopped_at": datetime.now().isoformat()
-            }
-        )
+        lease = remote_lease(username)
+        if lease:
+            return ProctoringStatusResponse(
+                active=True,
+                time_remaining=lease_time_remaining(lease),
+                username=username
+            )
+        return ProctoringStatusResponse(active=False, time_remaining=proctoring_system.total_time)
     except Exception as e:
-        print(f"Error stopping proctoring: {e}")
-        raise HTTPException(status_code=500, detail=f"Error stopping proctoring: {str(e)}")
+        print(f"Error getting status: {e}")
+        raise HTTPException(status_code=500, detail=f"Error getting status: {str(e)}")
 
 
 @router.get("/status", response_model=ProctoringStatusResponse)
-async def get_proctoring_status():
+async def get_only_session_status():
     """
-    Get current proctoring status and time remaining
+    Status of the proctoring session when only one student is being proctored
+    
+    Use /status/{username} when several are.
     """
     if proctoring_system is None:
         raise HTTPException(status_code=500, detail="Proctoring system not initialized")
     
-    try:
-        status = proctoring_system.get_feed_status()
-        return ProctoringStatusResponse(
-            active=status["active"],
-            time_remaining=status["time_remaining"],
-            username=proctoring_system.current_username if status["active"] else None
-        )
-    except Exception as e:
-        print(f"Error getting status: {e}")
-        raise HTTPException(status_code=500, detail=f"Error getting status: {str(e)}")
+    username = only_username()
+    if username is None:
+        return ProctoringStatusResponse(active=False, time_remaining=proctoring_system.total_time)
+    return await get_proctoring_status(username)
+
+
+@router.get("/sessions")
+async def list_sessions():
+    """
+    Students being proctored on this worker
+    """
+    if proctoring_system is None:
+        raise HTTPException(status_code=500, detail="Proctoring system not initialized")
+    
+    sessions = []
+    for session in proctoring_system.active_sessions():
+        status = session.get_feed_status()
+        sessions.append({
+            "username": session.username,
+            "active": status["active"],
+            "time_remaining": status["time_remaining"],
+            "recording": session.is_recording,
+            "sound_detection": session.audio_enabled
+        })
+    return JSONResponse(content={
+        "sessions": sessions,
+        "max_sessions": proctoring_system.max_sessions,
+        "worker": WORKER_ID
+    })
 
 
 @router.get("/video_feed/{username}")
@@ -156,21 +401,24 @@ async def video_feed(username: str):
     if proctoring_system is None:
         raise HTTPException(status_code=500, detail="Proctoring system not initialized")
     
-    if not proctoring_system.video_feed_active:
+    session = proctoring_system.get_session(username)
+    if session is None:
+        lease = await run_storage(remote_lease, username)
+        if lease:
+            # Frames only exist on the worker running the session
+            raise HTTPException(
+                status_code=409,
+                detail=f"Video feed is served by worker {lease['owner']}; "
+                       "route proctoring requests to it (sticky sessions)"
+            )
         raise HTTPException(
             status_code=400,
-            detail="Video feed is not active. Please start proctoring first using /start endpoint."
-        )
-    
-    if proctoring_system.current_username != username:
-        raise HTTPException(
-            status_code=403,
-            detail=f"Video feed is active for user '{proctoring_system.current_username}', not '{username}'"
+            detail=f"Video feed is not active for '{username}'. Please start proctoring first using /start endpoint."
         )
     
     try:
         return StreamingResponse(
-            proctoring_system.generate_video_feed(username),
+            relay_frames(session.generate_video_feed()),
             media_type="multipart/x-mixed-replace; boundary=frame"
         )
     except Exception as e:
@@ -202,24 +450,22 @@ async def get_user_data(username: str):
                 total_duration=0.0
             )
         
-        # Calculate statistics
-        cheating_count = sum(1 for _, is_cheating in data if is_cheating)
-        total_duration = data[-1][0] if data else 0.0
+        summary = proctoring_system.get_user_summary(username)
         
         return UserDataResponse(
             username=username,
             data=data,
-            total_cheating_instances=cheating_count,
-            total_duration=total_duration
+            total_cheating_instances=summary["cheating"],
+            total_duration=summary["duration"]
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting user data: {str(e)}")
 
 
 @router.post("/toggle", response_model=ProctoringResponse)
-async def toggle_proctoring():
+async def toggle_proctoring(username: Optional[str] = None):
     """
-    Toggle proctoring on/off
+    Toggle proctoring off for a student (or the only one being proctored)
     
     Note: To start proctoring, use the /start endpoint with a username
     """
@@ -227,12 +473,9 @@ async def toggle_proctoring():
         raise HTTPException(status_code=500, detail="Proctoring system not initialized")
     
     try:
-        if proctoring_system.video_feed_active:
-            proctoring_system.stop_proctoring()
-            return ProctoringResponse(
-                status="inactive",
-                message="Proctoring stopped"
-            )
+        username = username or only_username()
+        if username and proctoring_system.get_session(username):
+            return await run_storage(stop_session, username)
         else:
             raise HTTPException(
                 status_code=400,
@@ -289,43 +532,45 @@ async def handle_alt_tab(event: AltTabEvent):
 
 
 @router.get("/recordings")
-async def list_recordings():
+async def list_recordings(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    created_after: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    created_before: Optional[str] = Query(None, description="ISO timestamp, exclusive"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return")
+):
     """
-    List all cheating recordings saved
+    List saved cheating recordings, oldest first, one page at a time
+    
+    Follow **next_cursor** until it is null to get every recording.
     """
     if proctoring_system is None:
         raise HTTPException(status_code=500, detail="Proctoring system not initialized")
     
+    def summarize(filename: str, recording: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "filename": filename,
+            "size_mb": round(recording["size_bytes"] / (1024 * 1024), 2),
+            "created_at": recording["created_at"],
+            "path": recording["path"]
+        }
+    
     try:
-        import os
-        recordings_dir = proctoring_system.RECORDING_DIR
-        
-        if not os.path.exists(recordings_dir):
-            return JSONResponse(content={
-                "recordings": [],
-                "total": 0,
-                "message": "No recordings directory found"
-            })
-        
-        recordings = []
-        for filename in os.listdir(recordings_dir):
-            if filename.endswith('.mp4'):
-                file_path = os.path.join(recordings_dir, filename)
-                file_size = os.path.getsize(file_path)
-                file_time = os.path.getmtime(file_path)
-                
-                recordings.append({
-                    "filename": filename,
-                    "size_mb": round(file_size / (1024 * 1024), 2),
-                    "created_at": datetime.fromtimestamp(file_time).isoformat(),
-                    "path": file_path
-                })
-        
+        # Recordings are indexed in creation order as they are saved: a page is one range read
+        recordings = proctoring_system.recordings
+        parse_fields(fields, ["filename", "size_mb", "created_at", "path"], "filename")
+        page = await run_storage(
+            paginate, recordings, summarize, "filename", cursor, limit,
+            since=created_after, until=created_before, fields=fields
+        )
         return JSONResponse(content={
-            "recordings": recordings,
-            "total": len(recordings),
-            "directory": recordings_dir
+            "recordings": page["items"],
+            "next_cursor": page["next_cursor"],
+            "total": await run_storage(len, recordings),
+            "directory": proctoring_system.RECORDING_DIR
         })
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing recordings: {str(e)}")
 
@@ -349,6 +594,7 @@ async def delete_recording(filename: str):
             raise HTTPException(status_code=400, detail="Invalid file format")
         
         os.remove(file_path)
+        await run_storage(proctoring_system.recordings.pop, filename, None)
         
         return JSONResponse(content={
             "status": "success",
@@ -372,8 +618,8 @@ async def get_settings():
         "total_time": proctoring_system.total_time,
         "minimum_cheating_duration": proctoring_system.MINIMUM_CHEATING_DURATION,
         "recording_directory": proctoring_system.RECORDING_DIR,
-        "audio_detection_active": proctoring_system.audio_detection_active,
-        "video_feed_active": proctoring_system.video_feed_active
+        "active_sessions": len(proctoring_system.sessions),
+        "max_sessions": proctoring_system.max_sessions
     })
 
 
@@ -383,7 +629,7 @@ async def update_settings(
     minimum_cheating_duration: Optional[int] = None
 ):
     """
-    Update proctoring settings
+    Update proctoring settings (applies to sessions started afterwards)
     
     Parameters:
     - total_time: Total exam duration in seconds
@@ -418,22 +664,22 @@ async def get_user_statistics(username: str):
         raise HTTPException(status_code=500, detail="Proctoring system not initialized")
     
     try:
-        data = proctoring_system.get_user_data(username)
+        # Running counts maintained as samples are logged (no scan of the samples)
+        summary = proctoring_system.get_user_summary(username)
         
-        if not data:
+        if not summary["entries"]:
             return JSONResponse(content={
                 "username": username,
                 "message": "No data available for this user"
             })
         
-        # Calculate statistics
-        total_entries = len(data)
-        cheating_instances = sum(1 for _, is_cheating in data if is_cheating)
+        total_entries = summary["entries"]
+        cheating_instances = summary["cheating"]
         non_cheating_instances = total_entries - cheating_instances
         
         cheating_percentage = (cheating_instances / total_entries * 100) if total_entries > 0 else 0
         
-        total_duration = data[-1][0] if data else 0.0
+        total_duration = summary["duration"]
         
         return JSONResponse(content={
             "username": username,
@@ -442,7 +688,7 @@ async def get_user_statistics(username: str):
             "non_cheating_instances": non_cheating_instances,
             "cheating_percentage": round(cheating_percentage, 2),
             "total_duration_seconds": round(total_duration, 2),
-            "exam_completed": not proctoring_system.video_feed_active
+            "exam_completed": proctoring_system.get_session(username) is None
         })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting statistics: {str(e)}")
\ No newline at end of file
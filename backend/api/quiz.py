@@ -1,5 +1,6 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, Optional
 import uuid
 from datetime import datetime
 
@@ -8,12 +9,22 @@ from api.models import (
     QuizAnswerRequest, QuizAnswerResponse, QuizResultsResponse
 )
 from quiz import QuizSystem
+from concurrency import run_blocking
+from api.streaming import stream_from_producer
+from api.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from api.responses import fast_json, model_fields, pick
+from topic_catalog import topic_catalog, unknown_topic_message, has_material, topic_suggestions
+from storage import open_store, run_storage, off_loop, ConflictError
 
 router = APIRouter()
 
-# In-memory quiz storage (use Redis or database in production)
-active_quizzes: Dict[str, Dict[str, Any]] = {}
-quiz_sessions: Dict[str, Dict[str, Any]] = {}
+# Quiz storage (in-memory by default, SQLite with STORAGE_BACKEND=sqlite);
+# sessions are indexed by quiz_id
+active_quizzes = open_store("quizzes", indexes=("subject",), order_by="created_at")
+quiz_sessions = open_store("quiz_sessions", indexes=("quiz_id",))
+
+# Questions are validated once when a quiz is generated and served from the stored dicts
+QUIZ_QUESTION_FIELDS = model_fields(QuizQuestion)
 
 def get_quiz_system() -> QuizSystem:
     from main import quiz_system
@@ -38,11 +49,20 @@ async def generate_quiz(
                 detail=f"Invalid subject. Must be one of: {valid_subjects}"
             )
         
+        # Reject topics with no indexed material before spending an LLM call
+        coverage = topic_catalog.match(request.topic, request.subject)
+        if not has_material(coverage):
+            raise HTTPException(status_code=400, detail=unknown_topic_message(request.topic, coverage))
+        
         # Generate quiz using the quiz system
-        result = quiz_system.generate_quiz(
+        result = await run_blocking(
+            "quiz",
+            quiz_system.generate_quiz,
             topic=request.topic,
             subject=request.subject,
-            num_questions=request.num_questions
+            num_questions=request.num_questions,
+            difficulty=request.difficulty.value if request.difficulty else None,
+            student_id=request.student_id
         )
         
         if not result["success"]:
@@ -51,50 +71,142 @@ async def generate_quiz(
         # Create quiz ID and store quiz data
         quiz_id = str(uuid.uuid4())
         quiz_questions = [
-            QuizQuestion(**question) for question in result["quiz_data"]
+            QuizQuestion(**question).dict() for question in result["quiz_data"]
         ]
         
-        active_quizzes[quiz_id] = {
+        await run_storage(active_quizzes.__setitem__, quiz_id, {
             "quiz_id": quiz_id,
             "topic": request.topic,
             "subject": request.subject,
-            "questions": result["quiz_data"],
+            "questions": quiz_questions,
             "created_at": datetime.now().isoformat(),
-            "total_questions": len(result["quiz_data"])
-        }
+            "total_questions": len(quiz_questions),
+            "status": "complete"
+        })
         
-        return QuizGenerateResponse(
-            success=True,
-            message=result["message"],
-            quiz_data=quiz_questions,
-            subject=request.subject,
-            quiz_id=quiz_id
-        )
+        return fast_json({
+            "success": True,
+            "message": result["message"],
+            "quiz_data": quiz_questions,
+            "subject": request.subject,
+            "quiz_id": quiz_id,
+            "topic_suggestions": topic_suggestions(coverage)
+        })
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating quiz: {str(e)}")
 
-@router.get("/list")
-async def list_available_quizzes():
+@router.post("/generate/stream")
+async def generate_quiz_stream(
+    request: QuizGenerateRequest,
+    quiz_system: QuizSystem = Depends(get_quiz_system)
+):
     """
-    List all available quizzes
+    Generate a quiz and stream questions as server-sent events
+    
+    Events:
+    - **quiz**: quiz_id allocated up front (sessions can start immediately)
+    - **question**: one question as soon as it is available
+    - **complete**: generation finished, the stored quiz is marked complete
+    - **error**: generation failed
     """
-    quiz_list = []
-    for quiz_id, quiz_data in active_quizzes.items():
-        quiz_list.append({
+    valid_subjects = ["DataMining", "Network", "Distributed"]
+    if request.subject and request.subject not in valid_subjects:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid subject. Must be one of: {valid_subjects}"
+        )
+    
+    coverage = topic_catalog.match(request.topic, request.subject)
+    if not has_material(coverage):
+        raise HTTPException(status_code=400, detail=unknown_topic_message(request.topic, coverage))
+    
+    quiz_id = str(uuid.uuid4())
+    quiz = {
+        "quiz_id": quiz_id,
+        "topic": request.topic,
+        "subject": request.subject,
+        "questions": [],
+        "created_at": datetime.now().isoformat(),
+        "total_questions": request.num_questions,
+        "status": "generating"
+    }
+    await run_storage(active_quizzes.__setitem__, quiz_id, quiz)
+    
+    def produce(emit):
+        emit("quiz", {
             "quiz_id": quiz_id,
-            "topic": quiz_data["topic"],
-            "subject": quiz_data.get("subject"),
-            "total_questions": quiz_data["total_questions"],
-            "created_at": quiz_data["created_at"]
+            "topic": request.topic,
+            "subject": request.subject,
+            "requested_questions": request.num_questions,
+            "topic_suggestions": topic_suggestions(coverage)
+        })
+        try:
+            for q in quiz_system.generate_quiz_stream(
+                topic=request.topic,
+                subject=request.subject,
+                num_questions=request.num_questions,
+                difficulty=request.difficulty.value if request.difficulty else None,
+                student_id=request.student_id
+            ):
+                # Stored and sent without the bank's question_id, as in /generate
+                question = QuizQuestion(**q).dict()
+                quiz["questions"].append(question)
+                active_quizzes[quiz_id] = quiz
+                emit("question", {"question_number": len(quiz["questions"]), **question})
+        except Exception as e:
+            quiz["status"] = "failed"
+            active_quizzes[quiz_id] = quiz
+            emit("error", {"quiz_id": quiz_id, "message": str(e)})
+            return
+        
+        quiz["total_questions"] = len(quiz["questions"])
+        quiz["status"] = "complete" if quiz["questions"] else "failed"
+        active_quizzes[quiz_id] = quiz
+        emit("complete", {
+            "quiz_id": quiz_id,
+            "status": quiz["status"],
+            "total_questions": quiz["total_questions"]
         })
     
-    return {"quizzes": quiz_list}
+    return StreamingResponse(await stream_from_producer("quiz", produce), media_type="text/event-stream")
+
+def quiz_listing(quiz_id: str, quiz_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "quiz_id": quiz_id,
+        "topic": quiz_data["topic"],
+        "subject": quiz_data.get("subject"),
+        "total_questions": quiz_data["total_questions"],
+        "created_at": quiz_data["created_at"],
+        "status": quiz_data.get("status", "complete")
+    }
+
+@router.get("/list")
+@off_loop
+def list_available_quizzes(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    subject: Optional[str] = Query(None),
+    created_after: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    created_before: Optional[str] = Query(None, description="ISO timestamp, exclusive"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return")
+):
+    """
+    List available quizzes, oldest first, one page at a time
+    
+    Follow **next_cursor** until it is null to get every quiz.
+    """
+    page = paginate(
+        active_quizzes, quiz_listing, "quiz_id", cursor, limit,
+        where={"subject": subject}, since=created_after, until=created_before, fields=fields
+    )
+    return fast_json({"quizzes": page["items"], "next_cursor": page["next_cursor"]})
 
 @router.get("/{quiz_id}")
-async def get_quiz(quiz_id: str):
+@off_loop
+def get_quiz(quiz_id: str):
     """
     Get quiz details by ID
     """
@@ -102,24 +214,30 @@ async def get_quiz(quiz_id: str):
         raise HTTPException(status_code=404, detail="Quiz not found")
     
     quiz_data = active_quizzes[quiz_id]
-    questions = [QuizQuestion(**q) for q in quiz_data["questions"]]
+    questions = [pick(q, QUIZ_QUESTION_FIELDS) for q in quiz_data["questions"]]
     
-    return {
+    return fast_json({
         "quiz_id": quiz_id,
         "topic": quiz_data["topic"],
         "subject": quiz_data.get("subject"),
         "questions": questions,
         "total_questions": quiz_data["total_questions"],
-        "created_at": quiz_data["created_at"]
-    }
+        "created_at": quiz_data["created_at"],
+        "status": quiz_data.get("status", "complete")
+    })
 
 @router.post("/session/{quiz_id}/start")
-async def start_quiz_session(quiz_id: str):
+@off_loop
+def start_quiz_session(quiz_id: str):
     """
     Start a new quiz session
+    
+    Sessions may start while a streamed quiz is still being generated.
     """
     if quiz_id not in active_quizzes:
         raise HTTPException(status_code=404, detail="Quiz not found")
+    if active_quizzes[quiz_id].get("status") == "failed":
+        raise HTTPException(status_code=400, detail="Quiz generation failed")
     
     session_id = str(uuid.uuid4())
     quiz_sessions[session_id] = {
@@ -144,60 +262,74 @@ async def start_quiz_session(quiz_id: str):
     }
 
 @router.post("/session/{session_id}/answer", response_model=QuizAnswerResponse)
-async def submit_answer(session_id: str, request: QuizAnswerRequest):
+@off_loop
+def submit_answer(session_id: str, request: QuizAnswerRequest):
     """
     Submit an answer for the current question
     """
     if session_id not in quiz_sessions:
         raise HTTPException(status_code=404, detail="Quiz session not found")
     
-    session = quiz_sessions[session_id]
-    if session["completed"]:
-        raise HTTPException(status_code=400, detail="Quiz already completed")
-    
-    quiz_data = active_quizzes[session["quiz_id"]]
+    quiz_data = active_quizzes[quiz_sessions[session_id]["quiz_id"]]
     questions = quiz_data["questions"]
-    current_q_index = session["current_question"]
-    
-    if current_q_index >= len(questions):
-        raise HTTPException(status_code=400, detail="No more questions")
-    
-    current_question = questions[current_q_index]
-    correct_answer = current_question["correct_answer"].upper()
-    user_answer = request.answer.upper()
-    
-    # Check if answer is correct
-    is_correct = user_answer == correct_answer
-    if is_correct:
-        session["score"] += 1
-    
-    # Store answer
-    session["answers"].append({
-        "question_index": current_q_index,
-        "user_answer": user_answer,
-        "correct_answer": correct_answer,
-        "is_correct": is_correct,
-        "timestamp": datetime.now().isoformat()
-    })
+    outcome = {}
     
-    # Move to next question
-    session["current_question"] += 1
+    def answer(session):
+        if session["completed"]:
+            raise HTTPException(status_code=400, detail="Quiz already completed")
+        
+        current_q_index = session["current_question"]
+        if current_q_index >= len(questions):
+            if quiz_data.get("status", "complete") == "generating":
+                raise HTTPException(status_code=409, detail="Next question is still being generated")
+            raise HTTPException(status_code=400, detail="No more questions")
+        
+        current_question = questions[current_q_index]
+        correct_answer = current_question["correct_answer"].upper()
+        user_answer = request.answer.upper()
+        
+        # Check if answer is correct
+        is_correct = user_answer == correct_answer
+        if is_correct:
+            session["score"] += 1
+        
+        # Store answer
+        session["answers"].append({
+            "question_index": current_q_index,
+            "user_answer": user_answer,
+            "correct_answer": correct_answer,
+            "is_correct": is_correct,
+            "timestamp": datetime.now().isoformat()
+        })
+        
+        # Move to next question
+        session["current_question"] += 1
+        
+        # Check if quiz is completed (a quiz still being generated has more questions coming)
+        if session["current_question"] >= len(questions) and quiz_data.get("status", "complete") != "generating":
+            session["completed"] = True
+            session["completed_at"] = datetime.now().isoformat()
+        outcome.update(question=current_question, correct_answer=correct_answer, is_correct=is_correct)
     
-    # Check if quiz is completed
-    if session["current_question"] >= len(questions):
-        session["completed"] = True
-        session["completed_at"] = datetime.now().isoformat()
+    # Atomic read-modify-write, so concurrent answers (on any worker) cannot double count
+    try:
+        session = quiz_sessions.update(session_id, answer)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Quiz session not found")
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
     return QuizAnswerResponse(
-        correct=is_correct,
-        correct_answer=correct_answer,
-        explanation=current_question.get("explanation", ""),
+        correct=outcome["is_correct"],
+        correct_answer=outcome["correct_answer"],
+        explanation=outcome["question"].get("explanation", ""),
         score=session["score"],
         total_questions=len(questions)
     )
 
 @router.get("/session/{session_id}/next")
-async def get_next_question(session_id: str):
+@off_loop
+def get_next_question(session_id: str):
     """
     Get the next question in the quiz session
     """
@@ -213,6 +345,8 @@ async def get_next_question(session_id: str):
     current_q_index = session["current_question"]
     
     if current_q_index >= len(questions):
+        if quiz_data.get("status", "complete") == "generating":
+            raise HTTPException(status_code=409, detail="Next question is still being generated")
         raise HTTPException(status_code=400, detail="No more questions")
     
     current_question = questions[current_q_index]
@@ -225,7 +359,8 @@ async def get_next_question(session_id: str):
     }
 
 @router.get("/session/{session_id}/results", response_model=QuizResultsResponse)
-async def get_quiz_results(session_id: str):
+@off_loop
+def get_quiz_results(session_id: str):
     """
     Get final quiz results
     """
@@ -233,10 +368,19 @@ async def get_quiz_results(session_id: str):
         raise HTTPException(status_code=404, detail="Quiz session not found")
     
     session = quiz_sessions[session_id]
+    quiz_data = active_quizzes[session["quiz_id"]]
+    
+    # A streamed quiz may finish generating after the student answered every question
+    if (not session["completed"]
+            and quiz_data.get("status", "complete") == "complete"
+            and session["current_question"] >= len(quiz_data["questions"])):
+        session["completed"] = True
+        session["completed_at"] = datetime.now().isoformat()
+        quiz_sessions[session_id] = session
+    
     if not session["completed"]:
         raise HTTPException(status_code=400, detail="Quiz not completed yet")
     
-    quiz_data = active_quizzes[session["quiz_id"]]
     score = session["score"]
     total_questions = len(quiz_data["questions"])
     percentage = (score / total_questions) * 100 if total_questions > 0 else 0
@@ -262,7 +406,8 @@ async def get_quiz_results(session_id: str):
     )
 
 @router.delete("/{quiz_id}")
-async def delete_quiz(quiz_id: str):
+@off_loop
+def delete_quiz(quiz_id: str):
     """
     Delete a quiz
     """
@@ -270,12 +415,7 @@ async def delete_quiz(quiz_id: str):
         raise HTTPException(status_code=404, detail="Quiz not found")
     
     # Also delete any associated sessions
-    sessions_to_delete = [
-        session_id for session_id, session in quiz_sessions.items()
-        if session["quiz_id"] == quiz_id
-    ]
-    
-    for session_id in sessions_to_delete:
+    for session_id in quiz_sessions.keys_where("quiz_id", quiz_id):
         del quiz_sessions[session_id]
     
     del active_quizzes[quiz_id]
@@ -0,0 +1,23 @@
+from typing import Any, Dict, Iterable, Type
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+
+def fast_json(content: Any, status_code: int = 200) -> ORJSONResponse:
+    """
+    Encode plain dicts and lists straight to JSON with orjson
+
+    Returning a response directly skips response_model validation and
+    jsonable_encoder, so only pass data that was validated when it was stored.
+    """
+    return ORJSONResponse(content=content, status_code=status_code)
+
+
+def model_fields(model: Type[BaseModel]) -> tuple:
+    return tuple(model.model_fields)
+
+
+def pick(record: Dict[str, Any], fields: Iterable[str]) -> Dict[str, Any]:
+    """A stored record restricted to a model's fields, without building the model"""
+    return {field: record.get(field) for field in fields}
@@ -0,0 +1,56 @@
+import asyncio
+import json
+import queue
+from typing import Any, Callable, Dict, Iterator
+
+from concurrency import endpoint_executor, endpoint_limiter
+
+# Emitter handed to producers: emit(event_name, payload)
+Emit = Callable[[str, Dict[str, Any]], None]
+
+_DONE = object()
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a single server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_from_producer(endpoint: str, produce: Callable[[Emit], None]) -> Iterator[str]:
+    """
+    Run a producer on the endpoint's pool and relay what it emits as SSE frames
+
+    Waits for a slot under the endpoint's limiter first, like run_blocking; the
+    slot is released when the producer finishes. The producer keeps running if
+    the client disconnects, so work that updates shared state (e.g. a partially
+    generated exam) always finishes.
+    """
+    events: "queue.Queue" = queue.Queue()
+    limiter = endpoint_limiter(endpoint)
+    loop = asyncio.get_running_loop()
+
+    def run():
+        try:
+            produce(lambda event, data: events.put((event, data)))
+        except Exception as e:
+            events.put(("error", {"message": str(e)}))
+        finally:
+            events.put(_DONE)
+            loop.call_soon_threadsafe(limiter.release)
+
+    await limiter.acquire()
+    # Submit eagerly: the generator below only starts once the response is iterated
+    try:
+        endpoint_executor(endpoint).submit(run)
+    except Exception:
+        limiter.release()
+        raise
+
+    def relay():
+        while True:
+            item = events.get()
+            if item is _DONE:
+                break
+            yield sse_event(*item)
+
+    return relay()
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+
+from topic_catalog import topic_catalog
+
+router = APIRouter()
+
+@router.get("/{subject}")
+async def list_topics(
+    subject: str,
+    prefix: str = Query("", description="Autocomplete prefix"),
+    limit: int = Query(10, ge=1, le=100, description="Maximum number of topics")
+):
+    """
+    List catalogued topics for a subject, most covered first
+
+    - Use **prefix** for autocomplete (matches the start of any word in a topic)
+    - Topics come from headings and keyphrases extracted at ingestion time
+    """
+    if not topic_catalog.has_subject(subject):
+        raise HTTPException(status_code=404, detail=f"No topic catalogue for subject: {subject}")
+
+    topics = topic_catalog.suggest(subject, prefix, limit)
+
+    return {
+        "subject": subject,
+        "prefix": prefix,
+        "topics": topics,
+        "total": len(topics)
+    }
+
+@router.get("/check/topic")
+async def check_topic(
+    topic: str = Query(..., description="Free-text topic to check"),
+    subject: Optional[str] = Query(None, description="Subject filter")
+):
+    """
+    Check whether a topic has indexed material before generating content
+
+    Returns `known: null` when no catalogue exists yet for the subject.
+    """
+    return {
+        "topic": topic,
+        "subject": subject,
+        **topic_catalog.match(topic, subject)
+    }
@@ -0,0 +1,121 @@
+"""
+Measure class-wide bulk grading throughput against a stub LLM.
+
+Run from the backend directory:
+
+    python -m benchmarks.bulk_grading
+    python -m benchmarks.bulk_grading --students 300 --duplicates 0.4 --latency 0.8
+
+The stub answers every evaluation call after --latency seconds, so the numbers
+reflect scheduling, batching and deduplication rather than model speed.
+Reports answers per minute for bulk grading and for one evaluation per session.
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import tempfile
+import time
+
+# The chains are replaced by stubs below; the key only lets the module import
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import exam
+from exam import ExamSystem
+from evaluation_cache import EvaluationCache
+from benchmarks.eval_batching import synthetic_exam
+
+
+class StubEvaluationChain:
+    """Scores every answer as half marks after a fixed latency"""
+
+    def __init__(self, latency: float, batch: bool):
+        self.latency = latency
+        self.batch = batch
+        self.calls = 0
+
+    def _evaluation(self, cls, **extra):
+        return cls(score=1, feedback="Stub evaluation", strengths=[], improvements=[],
+                   key_points_covered=[], key_points_missed=[], **extra)
+
+    async def ainvoke(self, inputs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if not self.batch:
+            return self._evaluation(exam.AnswerEvaluation)
+        numbers = re.findall(r"### Question (\d+)\n", inputs["answers"])
+        return exam.BatchEvaluation(evaluations=[
+            self._evaluation(exam.NumberedAnswerEvaluation, question_number=int(n)) for n in numbers
+        ])
+
+
+def synthetic_submissions(exam_def: dict, students: int, duplicates: float, seed: int = 7) -> dict:
+    """session_id -> answers; a `duplicates` share of answers repeat a common answer"""
+    rng = random.Random(seed)
+    submissions = {}
+    for s in range(students):
+        answers = []
+        for q in exam_def["exam_data"]:
+            point = q["key_points"][0]
+            if rng.random() < duplicates:
+                text = f"{point} is the main idea behind this question."
+            else:
+                text = f"Student {s} explains that {point.lower()} matters because of reason {rng.randrange(10**6)}."
+            answers.append({"question_number": q["question_number"], "answer": text})
+        submissions[f"session-{s}"] = answers
+    return submissions
+
+
+def fresh_system(latency: float) -> tuple:
+    exam_system = ExamSystem()
+    exam_system.evaluation_cache = EvaluationCache(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    single = StubEvaluationChain(latency, batch=False)
+    batched = StubEvaluationChain(latency, batch=True)
+    exam.evaluation_chain = single
+    exam.batch_evaluation_chain = batched
+    return exam_system, single, batched
+
+
+async def per_session(exam_system: ExamSystem, exam_def: dict, submissions: dict, batch_mode: bool):
+    await asyncio.gather(*[
+        exam_system.evaluate_exam_async(session_id, exam_def, answers, batch_mode=batch_mode)
+        for session_id, answers in submissions.items()
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=12)
+    parser.add_argument("--duplicates", type=float, default=0.3, help="Share of answers shared across students")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub LLM latency in seconds")
+    args = parser.parse_args()
+
+    exam_def = synthetic_exam(args.questions)
+    submissions = synthetic_submissions(exam_def, args.students, args.duplicates)
+    total_answers = args.students * args.questions
+
+    print(f"{args.students} submissions x {args.questions} questions = {total_answers} answers, "
+          f"{args.duplicates:.0%} shared, {args.latency}s stub latency")
+    print(f"{'mode':>22} {'calls':>7} {'seconds':>8} {'answers/min':>12}")
+    for batch_mode in (False, True):
+        label = "batched" if batch_mode else "single"
+
+        exam_system, single, batched = fresh_system(args.latency)
+        start = time.perf_counter()
+        asyncio.run(per_session(exam_system, exam_def, submissions, batch_mode))
+        seconds = time.perf_counter() - start
+        print(f"{'per-session ' + label:>22} {single.calls + batched.calls:7d} {seconds:8.2f} "
+              f"{total_answers / seconds * 60:12.0f}")
+
+        exam_system, single, batched = fresh_system(args.latency)
+        result = asyncio.run(exam_system.grade_submissions_async(
+            "benchmark", exam_def, submissions, batch_mode=batch_mode
+        ))
+        print(f"{'bulk ' + label:>22} {single.calls + batched.calls:7d} {result['elapsed_seconds']:8.2f} "
+              f"{result['answers_per_minute']:12.0f}   ({result['unique_answers']} unique answers)")
+
+
+if __name__ == "__main__":
+    main()
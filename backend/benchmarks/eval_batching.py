@@ -0,0 +1,145 @@
+"""
+Compare single-answer and batched exam evaluation.
+
+Run from the backend directory:
+
+    python -m benchmarks.eval_batching            # real calls, needs OPENAI_API_KEY
+    python -m benchmarks.eval_batching --dry-run  # prompt token estimates only
+
+Reports prompt/completion tokens, LLM calls and wall time per submission.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from langchain_community.callbacks import get_openai_callback
+
+from exam import (
+    ExamSystem,
+    evaluation_prompt,
+    batch_evaluation_prompt,
+    format_answer_block,
+    plan_evaluation_batches,
+)
+from evaluation_cache import EvaluationCache
+from topic_context import estimate_tokens
+
+TOPICS = [
+    ("Explain how decision tree pruning reduces overfitting.",
+     ["Pre-pruning vs post-pruning", "Validation set", "Bias/variance trade-off"]),
+    ("Describe the k-means clustering algorithm and its limitations.",
+     ["Centroid initialisation", "Assignment and update steps", "Sensitivity to k and outliers"]),
+    ("Compare the Apriori and FP-Growth algorithms.",
+     ["Candidate generation", "FP-tree structure", "Number of database scans"]),
+    ("What is information gain and how is it used to choose splits?",
+     ["Entropy", "Weighted child entropy", "Bias towards many-valued attributes"]),
+]
+
+
+def synthetic_exam(num_questions: int = 12) -> dict:
+    exam_data = []
+    for i in range(num_questions):
+        question, key_points = TOPICS[i % len(TOPICS)]
+        hard = i < 3
+        exam_data.append({
+            "question_number": i + 1,
+            "question": question,
+            "question_type": "analytical" if hard else "conceptual",
+            "difficulty": "hard" if hard else "medium",
+            "marks": 10 if hard else 5,
+            "key_points": key_points,
+            "sample_answer": " ".join(key_points) + ". " + question * 3
+        })
+    return {
+        "exam_data": exam_data,
+        "topic": "Data Mining",
+        "subject": "DataMining",
+        "total_marks": sum(q["marks"] for q in exam_data)
+    }
+
+
+def synthetic_answers(exam: dict) -> list:
+    return [
+        {"question_number": q["question_number"], "answer": f"{q['key_points'][0]} is central here. " * 8}
+        for q in exam["exam_data"]
+    ]
+
+
+def estimate_prompt_tokens(exam: dict, answers: list) -> dict:
+    items = [
+        (next(q for q in exam["exam_data"] if q["question_number"] == a["question_number"]), a["answer"])
+        for a in answers
+    ]
+    single = 0
+    for question_data, answer in items:
+        messages = evaluation_prompt.format_messages(
+            question=question_data["question"],
+            max_marks=question_data["marks"],
+            difficulty=question_data["difficulty"],
+            key_points="\n".join(question_data["key_points"]),
+            sample_answer=question_data["sample_answer"],
+            student_answer=answer
+        )
+        single += sum(estimate_tokens(m.content) for m in messages)
+
+    batches = plan_evaluation_batches(items)
+    batched = 0
+    for batch in batches:
+        messages = batch_evaluation_prompt.format_messages(
+            count=len(batch),
+            answers="\n\n".join(format_answer_block(q, a) for q, a in batch)
+        )
+        batched += sum(estimate_tokens(m.content) for m in messages)
+
+    return {
+        "single": {"calls": len(items), "prompt_tokens": single},
+        "batched": {"calls": len(batches), "prompt_tokens": batched},
+    }
+
+
+def run(exam_system: ExamSystem, exam: dict, answers: list, batch_mode: bool, runs: int) -> dict:
+    totals = {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0, "seconds": 0.0}
+    for run_number in range(runs):
+        # Fresh evaluation cache per run so every run pays for its grading
+        cache_dir = tempfile.mkdtemp()
+        exam_system.evaluation_cache = EvaluationCache(os.path.join(cache_dir, f"run{run_number}.db"))
+        with get_openai_callback() as cb:
+            start = time.perf_counter()
+            exam_system.evaluate_exam("benchmark", exam, answers, batch_mode=batch_mode)
+            totals["seconds"] += time.perf_counter() - start
+        totals["prompt_tokens"] += cb.prompt_tokens
+        totals["completion_tokens"] += cb.completion_tokens
+        totals["calls"] += cb.successful_requests
+    return {k: v / runs for k, v in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=12)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--dry-run", action="store_true", help="Only estimate prompt tokens")
+    args = parser.parse_args()
+
+    exam = synthetic_exam(args.questions)
+    answers = synthetic_answers(exam)
+
+    if args.dry_run:
+        for mode, stats in estimate_prompt_tokens(exam, answers).items():
+            print(f"{mode:>8}: {stats['calls']:3d} calls, ~{stats['prompt_tokens']} prompt tokens per submission")
+        return
+
+    exam_system = ExamSystem()
+    print(f"{'mode':>8} {'calls':>6} {'prompt':>8} {'completion':>11} {'seconds':>8}   (per submission)")
+    for mode, batch_mode in (("single", False), ("batched", True)):
+        stats = run(exam_system, exam, answers, batch_mode, args.runs)
+        print(f"{mode:>8} {stats['calls']:6.1f} {stats['prompt_tokens']:8.0f} "
+              f"{stats['completion_tokens']:11.0f} {stats['seconds']:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
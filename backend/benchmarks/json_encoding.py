@@ -0,0 +1,127 @@
+"""
+Compare response encoding cost per endpoint: Pydantic + jsonable_encoder + json
+against orjson on the stored dicts.
+
+Run from the backend directory:
+
+    python -m benchmarks.json_encoding
+    python -m benchmarks.json_encoding --repeat 500 --cards 50 --sources 12
+
+The "model" path is what the endpoints did before: build the response models,
+run them through jsonable_encoder and encode with the standard json module
+(JSONResponse). The "orjson" path is what they do now: encode the stored dicts
+directly (ORJSONResponse). Payloads are synthetic but sized like real responses.
+"""
+import argparse
+import json
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from api.models import (
+    ChatResponse, Flashcard, FlashcardGenerateResponse, QuizGenerateResponse, QuizQuestion
+)
+from api.exam import ExamGenerateResponse, ExamQuestion
+
+
+def synthetic_payloads(cards: int, questions: int, sources: int, page: int) -> dict:
+    """endpoint -> (stored dict payload, function building it through the models)"""
+    flashcards = [
+        {"front": f"What does term {i} mean in distributed consensus?" * 2,
+         "back": f"Term {i} is explained in detail here. " * 8,
+         "category": f"Category {i % 5}", "difficulty": ("easy", "medium", "hard")[i % 3],
+         "tags": [f"tag-{i}", "consensus", "raft", "replication", f"chapter-{i % 7}"]}
+        for i in range(cards)
+    ]
+    quiz = [
+        {"question": f"Question {i} about routing protocols? " * 3,
+         "options": [f"A) option {i}-{o} " * 3 for o in range(4)],
+         "correct_answer": "A", "explanation": "Because of the reasons given in chapter 4. " * 5,
+         "difficulty": "medium"}
+        for i in range(questions)
+    ]
+    exam = [
+        {"question_number": i + 1, "question": f"Explain concept {i} and its trade-offs. " * 4,
+         "question_type": "long" if i % 2 else "short", "difficulty": "hard" if i % 2 else "medium",
+         "marks": 10 if i % 2 else 5}
+        for i in range(questions)
+    ]
+    chat = {
+        "generation": "A detailed answer drawing on the course material. " * 40,
+        "sources": [
+            {"content": "Retrieved passage text from the lecture notes. " * 20,
+             "metadata": {"source": f"notes/week{i}.pdf", "page": i, "subject": "Network",
+                          "heading": f"Section {i}", "score": 0.87 - i / 100}}
+            for i in range(sources)
+        ],
+        "is_conversational": False, "subject": "Network", "answer_quality": "good"
+    }
+    listing = [
+        {"exam_id": f"exam-{i:06d}", "topic": "Routing", "subject": "Network", "total_questions": 12,
+         "total_marks": 90, "created_at": f"2026-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}", "status": "complete"}
+        for i in range(page)
+    ]
+
+    return {
+        "flashcard/generate": (
+            {"success": True, "message": "ok", "flashcard_data": flashcards, "subject": "Network", "set_id": "s"},
+            lambda: FlashcardGenerateResponse(success=True, message="ok", subject="Network", set_id="s",
+                                              flashcard_data=[Flashcard(**c) for c in flashcards])
+        ),
+        "flashcard/set": (
+            {"set_id": "s", "topic": "t", "flashcards": flashcards, "total_cards": cards},
+            lambda: {"set_id": "s", "topic": "t", "flashcards": [Flashcard(**c) for c in flashcards],
+                     "total_cards": cards}
+        ),
+        "quiz/generate": (
+            {"success": True, "message": "ok", "quiz_data": quiz, "subject": "Network", "quiz_id": "q"},
+            lambda: QuizGenerateResponse(success=True, message="ok", subject="Network", quiz_id="q",
+                                         quiz_data=[QuizQuestion(**q) for q in quiz])
+        ),
+        "exam/generate": (
+            {"success": True, "message": "ok", "exam_id": "e", "exam_data": exam},
+            lambda: ExamGenerateResponse(success=True, message="ok", exam_id="e",
+                                         exam_data=[ExamQuestion(**q) for q in exam])
+        ),
+        "chat/message": (chat, lambda: ChatResponse(**chat)),
+        "exam/list": ({"exams": listing, "next_cursor": None}, lambda: {"exams": listing, "next_cursor": None}),
+    }
+
+
+def model_path(build) -> bytes:
+    content = jsonable_encoder(build())
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def orjson_path(content) -> bytes:
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--cards", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--sources", type=int, default=8)
+    parser.add_argument("--page", type=int, default=500, help="Items in a list page")
+    args = parser.parse_args()
+
+    payloads = synthetic_payloads(args.cards, args.questions, args.sources, args.page)
+    print(f"{'endpoint':>20} {'KB':>7} {'model us':>10} {'orjson us':>10} {'speedup':>8}")
+    for endpoint, (content, build) in payloads.items():
+        size = len(orjson_path(content)) / 1024
+        before = timed(lambda: model_path(build), args.repeat)
+        after = timed(lambda: orjson_path(content), args.repeat)
+        print(f"{endpoint:>20} {size:7.1f} {before:10.1f} {after:10.1f} {before / after:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
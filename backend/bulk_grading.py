@@ -0,0 +1,77 @@
+import os
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Dict, MutableMapping
+
+from evaluation_jobs import public_job
+from storage import Store, write_behind
+
+# Graded answers per progress record written while a bulk job runs
+BULK_CHECKPOINT_EVERY = int(os.getenv("BULK_CHECKPOINT_EVERY", "50"))
+
+
+def progress_record(job: Dict[str, Any]) -> Dict[str, Any]:
+    """A bulk job's stored record: its status and counters, without the graded answers"""
+    return {k: v for k, v in public_job(job).items() if k != "graded"}
+
+
+def load_graded(progress: Store, job_id: str) -> Dict[str, Dict[str, Any]]:
+    """Answers a bulk job has checkpointed so far: session_id -> question_number -> evaluation"""
+    graded: Dict[str, Dict[str, Any]] = {}
+    for key in progress.keys_where("job_id", job_id):
+        chunk = progress.get(key)
+        for session_id, evaluations in (chunk or {}).get("graded", {}).items():
+            graded.setdefault(session_id, {}).update(evaluations)
+    return graded
+
+
+def drop_progress(progress: Store, job_id: str):
+    """Delete a finished bulk job's progress records"""
+    for key in progress.keys_where("job_id", job_id):
+        progress.pop(key, None)
+
+
+class BulkGradingCheckpoint:
+    """
+    Records graded answers on a bulk grading job and periodically stores the
+    answers graded since the last checkpoint, plus the job's counters, where
+    any worker can read its progress.
+
+    Each checkpoint writes only its own answers, so a job costs O(answers) to
+    checkpoint however large the class. A job resumed after its worker stopped
+    starts from the stored answers and grades only the rest.
+    """
+
+    def __init__(self, job: Dict[str, Any], store: MutableMapping, progress: MutableMapping,
+                 every: int = BULK_CHECKPOINT_EVERY):
+        self.job = job
+        self.store = store
+        self.progress = progress
+        self.every = max(1, every)
+        self._unsaved: Dict[str, Dict[str, Any]] = {}
+        self._unsaved_count = 0
+
+    def record(self, session_id: str, question_number: int, evaluation: Dict[str, Any]):
+        """on_progress callback for ExamSystem.grade_submissions_async"""
+        self.job["graded"].setdefault(session_id, {})[str(question_number)] = evaluation
+        self.job["answers_graded"] += 1
+        self._unsaved.setdefault(session_id, {})[str(question_number)] = evaluation
+        self._unsaved_count += 1
+        if self._unsaved_count >= self.every:
+            self.save()
+
+    def save(self) -> Future:
+        """
+        Store the new answers and the job's counters, written behind in order
+        (await the returned future to be sure both landed)
+        """
+        self.job["checkpointed_at"] = datetime.now().isoformat()
+        self.job["heartbeat_at"] = time.time()
+        if self._unsaved:
+            key = f"{self.job['job_id']}:{uuid.uuid4().hex}"
+            write_behind(self.progress, key, {"job_id": self.job["job_id"], "graded": self._unsaved})
+            self._unsaved = {}
+            self._unsaved_count = 0
+        return write_behind(self.store, self.job["job_id"], progress_record(self.job))
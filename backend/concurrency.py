@@ -0,0 +1,189 @@
+import asyncio
+import functools
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict
+
+# Dedicated pool for blocking generation pipelines (quiz, flashcard, exam graphs)
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "8"))
+generation_executor = ThreadPoolExecutor(
+    max_workers=GENERATION_WORKERS,
+    thread_name_prefix="generation"
+)
+
+# Chat gets its own pool so answers never queue behind long generations
+CHAT_WORKERS = int(os.getenv("CHAT_WORKERS", "8"))
+chat_executor = ThreadPoolExecutor(
+    max_workers=CHAT_WORKERS,
+    thread_name_prefix="chat"
+)
+
+# Maximum in-flight generations per endpoint; further requests wait their turn
+ENDPOINT_LIMITS = {
+    "quiz": int(os.getenv("QUIZ_GENERATION_LIMIT", "4")),
+    "flashcard": int(os.getenv("FLASHCARD_GENERATION_LIMIT", "4")),
+    "exam": int(os.getenv("EXAM_GENERATION_LIMIT", "2")),
+    "chat": int(os.getenv("CHAT_LIMIT", "8")),
+}
+
+# Endpoints with their own pool; the rest share the generation pool
+ENDPOINT_EXECUTORS = {"chat": chat_executor}
+
+_limiters: Dict[str, asyncio.Semaphore] = {}
+
+
+def endpoint_executor(name: str) -> ThreadPoolExecutor:
+    return ENDPOINT_EXECUTORS.get(name, generation_executor)
+
+
+def endpoint_limiter(name: str) -> asyncio.Semaphore:
+    """Semaphore bounding concurrent generations for one endpoint"""
+    if name not in _limiters:
+        _limiters[name] = asyncio.Semaphore(ENDPOINT_LIMITS.get(name, GENERATION_WORKERS))
+    return _limiters[name]
+
+
+async def run_blocking(endpoint: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking generation call on the endpoint's pool
+
+    The event loop stays free for chat, proctoring and other requests while the
+    call waits on the LLM, and the endpoint's limiter caps how many run at once.
+    """
+    async with endpoint_limiter(endpoint):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(endpoint_executor(endpoint), functools.partial(fn, *args, **kwargs))
+
+
+# Process-wide cap on in-flight LLM calls, shared by every chain
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Slots low-priority work (bulk grading) may never take, kept for interactive traffic
+LLM_LOW_PRIORITY_RESERVE = int(os.getenv("LLM_LOW_PRIORITY_RESERVE", "4"))
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, event=None, loop=None, future=None):
+        self.event = event
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+
+class LLMGate:
+    """
+    Counting gate for LLM calls, usable from worker threads and coroutines alike.
+
+    Threads (generation pipelines, chat graph) block in invoke(); coroutines
+    (exam grading) await ainvoke() without holding a thread. Waiters are served
+    first-come first-served whichever kind they are, so raising
+    LLM_MAX_CONCURRENCY to the provider's rate limit is the only knob.
+    
+    Low-priority callers only get a slot when no normal caller is waiting and
+    fewer than limit - reserve calls are in flight.
+    """
+
+    def __init__(self, limit: int = LLM_MAX_CONCURRENCY, reserve: int = LLM_LOW_PRIORITY_RESERVE):
+        self.limit = limit
+        self.reserve = max(0, min(reserve, limit - 1))
+        self._in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._low_waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, priority: str) -> bool:
+        if priority == "low":
+            free = self._in_flight < self.limit - self.reserve and not self._waiters and not self._low_waiters
+        else:
+            free = self._in_flight < self.limit and not self._waiters
+        if free:
+            self._in_flight += 1
+        return free
+
+    def _queue_for(self, priority: str) -> Deque[_Waiter]:
+        return self._low_waiters if priority == "low" else self._waiters
+
+    def acquire(self, priority: str = "normal"):
+        """Blocking acquire for worker threads (never call this on the event loop)"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError("LLMGate.acquire() would block the event loop; use ainvoke()")
+        with self._lock:
+            if self._try_acquire(priority):
+                return
+            waiter = _Waiter(event=threading.Event())
+            self._queue_for(priority).append(waiter)
+        waiter.event.wait()
+
+    async def acquire_async(self, priority: str = "normal"):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire(priority):
+                return
+            waiter = _Waiter(loop=loop, future=loop.create_future())
+            self._queue_for(priority).append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._queue_for(priority).remove(waiter)
+            if granted:
+                # The slot was handed over while we were being cancelled
+                self.release()
+            raise
+
+    def release(self):
+        """Hand the slot to the oldest normal waiter, then to a low-priority one if allowed, or free it"""
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+            elif self._low_waiters and self._in_flight <= self.limit - self.reserve:
+                waiter = self._low_waiters.popleft()
+            else:
+                self._in_flight -= 1
+                return
+            waiter.granted = True
+        if waiter.event is not None:
+            waiter.event.set()
+        else:
+            waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    def invoke(self, chain, inputs, priority: str = "normal", **kwargs):
+        self.acquire(priority)
+        try:
+            return chain.invoke(inputs, **kwargs)
+        finally:
+            self.release()
+
+    async def ainvoke(self, chain, inputs, priority: str = "normal", **kwargs):
+        await self.acquire_async(priority)
+        try:
+            return await chain.ainvoke(inputs, **kwargs)
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "low_priority_reserve": self.reserve,
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiters),
+                "waiting_low_priority": len(self._low_waiters)
+            }
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+llm_gate = LLMGate()
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aggregates import Aggregates
+
+# Cache location (override with environment variables)
+CACHE_PATH = os.getenv(
+    "EVALUATION_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "evaluation_cache.db")
+)
+MAX_CACHE_ENTRIES = int(os.getenv("EVALUATION_CACHE_MAX_ENTRIES", "50000"))
+# Inserts between trims of the entries beyond the cap (it may be overshot by as many)
+CACHE_TRIM_EVERY = int(os.getenv("EVALUATION_CACHE_TRIM_EVERY", "500"))
+
+
+def normalize_text(text: str) -> str:
+    """Case- and whitespace-insensitive form used for near-exact matches"""
+    return " ".join((text or "").lower().split())
+
+
+def _digest(parts: list) -> str:
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def rubric_parts(question_data: dict, normalize: bool) -> list:
+    """The parts of a question that determine its grade: the question, marks, key points and sample answer"""
+    clean = normalize_text if normalize else (lambda t: t)
+    return [
+        clean(question_data["question"]),
+        question_data["marks"],
+        [clean(point) for point in question_data["key_points"]],
+        clean(question_data["sample_answer"])
+    ]
+
+
+def evaluation_keys(question_data: dict, student_answer: str) -> tuple:
+    """(exact key, normalized key) for an answer to a question"""
+    exact = _digest([student_answer, *rubric_parts(question_data, normalize=False)])
+    normalized = _digest([normalize_text(student_answer), *rubric_parts(question_data, normalize=True)])
+    return exact, normalized
+
+
+class EvaluationCache:
+    """
+    Content-addressed store of answer evaluations, persisted in SQLite.
+
+    Lookups try the exact answer text first, then a case/whitespace-normalized
+    form, so resubmissions and copy-pasted answers are graded once. Hit and
+    miss counts go to counters: pass shared aggregates (open_aggregates) for
+    totals across workers.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, counters: Optional[Aggregates] = None):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS evaluations (
+                exact_key TEXT PRIMARY KEY,
+                normalized_key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_evaluations_normalized ON evaluations (normalized_key);
+            CREATE INDEX IF NOT EXISTS idx_evaluations_created ON evaluations (created_at);
+        """)
+        self._conn.commit()
+        self.counters = counters if counters is not None else Aggregates()
+        self._inserts = 0
+
+    def _lookup(self, question_data: dict, student_answer: str, outcomes: Counter) -> Optional[Dict[str, Any]]:
+        exact, normalized = evaluation_keys(question_data, student_answer)
+        row = self._conn.execute(
+            "SELECT payload FROM evaluations WHERE exact_key = ?", (exact,)
+        ).fetchone()
+        if row:
+            outcomes["exact_hits"] += 1
+        else:
+            row = self._conn.execute(
+                "SELECT payload FROM evaluations WHERE normalized_key = ? LIMIT 1", (normalized,)
+            ).fetchone()
+            if not row:
+                outcomes["misses"] += 1
+                return None
+            outcomes["near_exact_hits"] += 1
+        return {**json.loads(row[0]), "question_number": question_data["question_number"], "cached": True}
+
+    def get_many(self, items: List[tuple]) -> List[Optional[Dict[str, Any]]]:
+        """Cached evaluations (or None) for (question_data, answer) pairs, counted in one update"""
+        outcomes: Counter = Counter()
+        with self._lock:
+            evaluations = [self._lookup(question_data, answer, outcomes) for question_data, answer in items]
+        for name, count in outcomes.items():
+            self.counters.incr(name, count)
+        return evaluations
+
+    def get(self, question_data: dict, student_answer: str) -> Optional[Dict[str, Any]]:
+        """Cached evaluation for this answer, renumbered for this question, or None"""
+        return self.get_many([(question_data, student_answer)])[0]
+
+    def put(self, question_data: dict, student_answer: str, evaluation: Dict[str, Any]):
+        """Store a successful evaluation"""
+        if not evaluation.get("success"):
+            return
+        exact, normalized = evaluation_keys(question_data, student_answer)
+        payload = {k: v for k, v in evaluation.items() if k not in ("question_number", "cached")}
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO evaluations (exact_key, normalized_key, payload, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (exact, normalized, json.dumps(payload), time.time())
+            )
+            # Bound the cache every so often (not per insert): drop the oldest entries beyond the cap
+            self._inserts += 1
+            if self._inserts >= CACHE_TRIM_EVERY:
+                self._inserts = 0
+                self._conn.execute(
+                    "DELETE FROM evaluations WHERE exact_key IN ("
+                    " SELECT exact_key FROM evaluations ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (MAX_CACHE_ENTRIES,)
+                )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        exact_hits, near_exact_hits, misses = (
+            int(self.counters.count(name)) for name in ("exact_hits", "near_exact_hits", "misses")
+        )
+        lookups = exact_hits + near_exact_hits + misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+        return {
+            "entries": entries,
+            "lookups": lookups,
+            "exact_hits": exact_hits,
+            "near_exact_hits": near_exact_hits,
+            "hit_rate": round((exact_hits + near_exact_hits) / lookups, 4) if lookups else 0.0
+        }
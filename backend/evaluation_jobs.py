@@ -0,0 +1,215 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, MutableMapping, Optional
+
+from storage import InMemoryStore, Store, run_storage, write_behind
+
+# Bounded grading concurrency; extra submissions wait in the queue
+EVALUATION_WORKERS = int(os.getenv("EVALUATION_WORKERS", "4"))
+EVALUATION_QUEUE_LIMIT = int(os.getenv("EVALUATION_QUEUE_LIMIT", "1000"))
+
+# Runner: (job, on_result) -> evaluation result dict
+JobRunner = Callable[[Dict[str, Any], Callable[[dict], None]], Awaitable[Dict[str, Any]]]
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class EvaluationJobQueue:
+    """
+    Queue of exam evaluation jobs processed by a fixed pool of asyncio workers.
+
+    Jobs live independently of the request that submitted them, so grading
+    finishes even if the client disconnects. Per-question results are recorded
+    on the job as they complete, each written to the progress store under its
+    own key, and published to any subscribers; the job store holds the job's
+    counters while it runs and its full results once it finishes. Only queued
+    and running jobs (with their inputs) are held in memory; finished jobs are
+    read back from the store, whose retention settings decide how long they
+    are kept.
+    """
+
+    def __init__(self, runner: JobRunner, store: Optional[MutableMapping] = None,
+                 progress: Optional[Store] = None,
+                 workers: int = EVALUATION_WORKERS, limit: int = EVALUATION_QUEUE_LIMIT,
+                 worker_id: Optional[str] = None):
+        self.runner = runner
+        self.store = store if store is not None else {}
+        self.progress = progress if progress is not None else InMemoryStore("evaluation_progress", indexes=("job_id",))
+        self.worker_id = worker_id
+        self.num_workers = workers
+        self.limit = limit
+        # Queued and running jobs on this worker
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.finished: Counter = Counter()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._done: Dict[str, asyncio.Event] = {}
+        self._listeners: Dict[str, List[asyncio.Queue]] = {}
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Enqueue a job (must carry the runner's inputs) and return it with its job_id"""
+        self._ensure_started()
+        if self._queue.qsize() >= self.limit:
+            raise QueueFullError("Evaluation queue is full, please retry shortly")
+        job_id = str(uuid.uuid4())
+        job.update({
+            "job_id": job_id,
+            "worker": self.worker_id,
+            "status": "queued",
+            "evaluations": [],
+            "questions_completed": 0,
+            "queued_at": datetime.now().isoformat(),
+            "started_at": None,
+            "completed_at": None,
+            "error": None
+        })
+        self.jobs[job_id] = job
+        self._save(job)
+        self._done[job_id] = asyncio.Event()
+        self._queue.put_nowait(job_id)
+        print(f"---EVALUATION JOB {job_id} QUEUED ({self._queue.qsize()} WAITING)---")
+        return job
+
+    def _save(self, job: Dict[str, Any]) -> Future:
+        """Write the job's record behind, off the event loop; results only once it has finished"""
+        job["heartbeat_at"] = time.time()
+        record = public_job(job)
+        if job["status"] in ("queued", "running"):
+            del record["evaluations"]  # In the progress store meanwhile
+        else:
+            record["evaluations"] = list(job["evaluations"])
+        return write_behind(self.store, job["job_id"], record)
+
+    def _stored_evaluations(self, job_id: str) -> List[Dict[str, Any]]:
+        stored = [self.progress.get(key) for key in self.progress.keys_where("job_id", job_id)]
+        evaluations = [{k: v for k, v in e.items() if k != "job_id"} for e in stored if e]
+        return sorted(evaluations, key=lambda e: e["question_number"])
+
+    def _drop_progress(self, job_id: str):
+        for key in self.progress.keys_where("job_id", job_id):
+            self.progress.pop(key, None)
+
+    def heartbeat(self):
+        """Re-save this worker's unfinished jobs so other workers see they are alive"""
+        for job in list(self.jobs.values()):
+            self._save(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job from this worker, or its stored record (finished, or run elsewhere with its results so far)"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        job = self.store.get(job_id)
+        if job is not None and "evaluations" not in job:
+            job = {**job, "evaluations": self._stored_evaluations(job_id)}
+        return job
+
+    def is_local(self, job_id: str) -> bool:
+        return job_id in self.jobs
+
+    async def wait(self, job_id: str) -> Dict[str, Any]:
+        """Wait for a job submitted on this worker to finish (complete or failed)"""
+        job, done = self.jobs.get(job_id), self._done.get(job_id)
+        if done is not None:
+            await done.wait()
+        return public_job(job) if job is not None else await run_storage(self.store.__getitem__, job_id)
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        listener: asyncio.Queue = asyncio.Queue()
+        self._listeners.setdefault(job_id, []).append(listener)
+        return listener
+
+    def unsubscribe(self, job_id: str, listener: asyncio.Queue):
+        listeners = self._listeners.get(job_id, [])
+        if listener in listeners:
+            listeners.remove(listener)
+        if not listeners:
+            self._listeners.pop(job_id, None)
+
+    def _publish(self, job_id: str, event: str, data: Dict[str, Any]):
+        for listener in self._listeners.get(job_id, []):
+            listener.put_nowait((event, data))
+
+    def stats(self) -> Dict[str, Any]:
+        # Copies: statistics may be read from a storage thread while workers run
+        statuses = Counter(job["status"] for job in list(self.jobs.values()))
+        statuses.update(dict(self.finished))
+        return {
+            "workers": self.num_workers,
+            "waiting": self._queue.qsize() if self._queue else 0,
+            "jobs": dict(statuses)
+        }
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self.jobs[job_id]
+            job["status"] = "running"
+            job["started_at"] = datetime.now().isoformat()
+            self._save(job)
+            self._publish(job_id, "status", {"job_id": job_id, "status": "running"})
+
+            def record(evaluation: dict):
+                job["evaluations"].append(evaluation)
+                job["questions_completed"] = len(job["evaluations"])
+                # Partial results are readable from any worker while grading continues;
+                # each question is written once, not the whole list again
+                write_behind(self.progress, f"{job_id}:{evaluation['question_number']}", {**evaluation, "job_id": job_id})
+                self._save(job)
+                self._publish(job_id, "evaluation", evaluation)
+
+            try:
+                result = await self.runner(job, record)
+                if not result.get("success"):
+                    raise RuntimeError(result.get("message", "Evaluation failed"))
+                job.update(result)
+                job["status"] = "complete"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"---EVALUATION JOB {job_id} FAILED: {e}---")
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                job["completed_at"] = datetime.now().isoformat()
+                # The inputs are only needed while grading
+                job.pop("_exam", None)
+                job.pop("_answers", None)
+                # The final record must be stored before get() stops finding the job here
+                try:
+                    await asyncio.wrap_future(self._save(job))
+                    await run_storage(self._drop_progress, job_id)
+                except Exception:
+                    pass  # Reported by the writer; the job is finished either way
+                self.jobs.pop(job_id, None)
+                if job["status"] in ("complete", "failed"):
+                    self.finished[job["status"]] += 1
+                self._done.pop(job_id).set()
+                self._queue.task_done()
+
+            self._publish(job_id, job["status"], public_job(job))
+
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Job as returned to clients, without the submitted inputs"""
+    # list() copies in one step: a running job may be read from a storage thread
+    return {k: v for k, v in list(job.items()) if not k.startswith("_")}
@@ -1,17 +1,23 @@
 from dotenv import load_dotenv
 from langgraph.graph import END, StateGraph
-from typing import Any, Dict, List, TypedDict, Optional
+from typing import Any, Callable, Dict, List, TypedDict, Optional
 import os
+import time
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Langchain imports
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_pinecone import PineconeVectorStore
+from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableSequence
 from pydantic import BaseModel, Field
-from pinecone import Pinecone
+
+from topic_context import topic_context, fit_to_budget, estimate_tokens
+from evaluation_cache import EvaluationCache, normalize_text
+from pre_grader import pre_grade
+from concurrency import llm_gate
+from storage import storage_executor, open_aggregates
+from near_duplicates import NearDuplicateDetector, DedupSession, MAX_REGEN_ROUNDS, default_embed_fn, format_exclusions
 
 load_dotenv()
 
@@ -29,26 +35,8 @@ class ExamState(TypedDict):
     exam_config: Optional[dict]
     generation: str
 
-# Initialize components
-embedding = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index(os.environ["INDEX_NAME"])
-
-# Retriever function
-def get_retriever(subject=None):
-    vectorstore = PineconeVectorStore(index=index, embedding=embedding)
-    
-    if subject:
-        retriever = vectorstore.as_retriever(
-            search_kwargs={
-                "filter": {"subject": subject},
-                "k": 20  # Get more documents for exam generation
-            }
-        )
-    else:
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 20})
-    
-    return retriever
+# Token budget for this generator's share of the shared topic context
+CONTEXT_TOKEN_BUDGET = int(os.getenv("EXAM_CONTEXT_TOKENS", "10500"))
 
 # Exam models
 class ExamQuestion(BaseModel):
@@ -69,27 +57,34 @@ class ExamData(BaseModel):
 llm = ChatOpenAI(temperature=0.3, model="gpt-4o-mini")
 structured_llm_exam = llm.with_structured_output(ExamData)
 
-exam_system_prompt = """You are an expert educational content creator specializing in generating comprehensive exam questions.
-
-CRITICAL REQUIREMENT: You MUST generate EXACTLY {total_questions} questions in total:
-- EXACTLY {num_hard} HARD questions (10 marks each)
-- EXACTLY {num_medium} MEDIUM questions (5 marks each)
-- Total questions MUST be: {total_questions}
-
-DO NOT generate more or fewer questions than specified above.
+# Exams are generated in shards: each call produces a small set of questions of a
+# single difficulty from its own slice of the documents, and shards run concurrently.
+SHARD_SIZE = int(os.getenv("EXAM_SHARD_SIZE", "5"))
+MAX_SHARD_RETRIES = 3
+# Top-up calls only ask for the missing questions, over a smaller slice of context
+TOPUP_CONTEXT_TOKENS = int(os.getenv("EXAM_TOPUP_CONTEXT_TOKENS", "1500"))
 
-**HARD Questions (10 marks each):**
+DIFFICULTY_GUIDELINES = {
+    "hard": """**HARD Questions (10 marks each):**
 - Should test deep understanding and analytical skills
 - Require detailed, multi-faceted answers
 - Test ability to apply concepts, analyze scenarios, or synthesize information
 - Should take significant time and thought to answer properly
-- Include complex scenarios or case studies
-
-**MEDIUM Questions (5 marks each):**
+- Include complex scenarios or case studies""",
+    "medium": """**MEDIUM Questions (5 marks each):**
 - Should test core understanding and application
 - Require moderate explanation with examples
 - Test ability to explain concepts and their applications
-- Should be answerable in a few paragraphs
+- Should be answerable in a few paragraphs""",
+}
+
+exam_system_prompt = """You are an expert educational content creator specializing in generating comprehensive exam questions.
+
+CRITICAL REQUIREMENT: You MUST generate EXACTLY {num_questions} {difficulty_label} questions ({marks} marks each).
+
+DO NOT generate more or fewer questions than specified above.
+
+{difficulty_guidelines}
 
 **General Guidelines:**
 1. Questions should be open-ended (descriptive, not multiple choice)
@@ -99,11 +94,7 @@ DO NOT generate more or fewer questions than specified above.
 5. Include a sample comprehensive answer for each question
 6. Ensure questions test different cognitive levels (understand, apply, analyze, evaluate)
 
-**STRICT Question Distribution (FOLLOW EXACTLY):**
-- Questions 1 to {num_hard}: HARD (10 marks each)
-- Questions {start_medium} to {total_questions}: MEDIUM (5 marks each)
-
-REMINDER: Generate EXACTLY {total_questions} questions total. Count carefully."""
+REMINDER: Generate EXACTLY {num_questions} questions. Count carefully."""
 
 exam_prompt = ChatPromptTemplate.from_messages([
     ("system", exam_system_prompt),
@@ -113,15 +104,23 @@ Documents:
 {documents}
 
 MANDATORY REQUIREMENTS:
-- Total questions to generate: {total_questions}
-- HARD questions (10 marks each): {num_hard}
-- MEDIUM questions (5 marks each): {num_medium}
+- Questions to generate: {num_questions}
+- Difficulty: {difficulty_label} ({marks} marks each)
+
+Questions already written (do NOT repeat or rephrase these):
+{exclusions}
 
-Generate EXACTLY {total_questions} exam questions based on this content. Do not generate more or fewer questions.""")
+Generate EXACTLY {num_questions} exam questions based on this content. Do not generate more or fewer questions.""")
 ])
 
 exam_generator_chain: RunnableSequence = exam_prompt | structured_llm_exam
 
+# Shared pool for shard calls so concurrent exams cannot spawn unbounded threads
+shard_executor = ThreadPoolExecutor(max_workers=int(os.getenv("EXAM_SHARD_WORKERS", "8")))
+
+# Per-subject index of generated exam questions, shared across exams
+exam_duplicates = NearDuplicateDetector(embed_fn=default_embed_fn())
+
 # Evaluation model and chain
 class AnswerEvaluation(BaseModel):
     score: float = Field(description="Score awarded (out of maximum marks)")
@@ -178,23 +177,106 @@ Please evaluate this answer and provide a score out of {max_marks} marks.""")
 
 evaluation_chain: RunnableSequence = evaluation_prompt | structured_llm_evaluator
 
+# Batched evaluation: several answers share one system prompt in a single call
+EVAL_BATCH_MODE = os.getenv("EXAM_EVAL_BATCH_MODE", "true").lower() in ("1", "true", "yes")
+EVAL_BATCH_TOKEN_BUDGET = int(os.getenv("EXAM_EVAL_BATCH_TOKENS", "6000"))
+EVAL_MAX_BATCH_SIZE = int(os.getenv("EXAM_EVAL_MAX_BATCH_SIZE", "6"))
+
+class NumberedAnswerEvaluation(AnswerEvaluation):
+    question_number: int = Field(description="Number of the question this evaluation is for")
+
+class BatchEvaluation(BaseModel):
+    evaluations: List[NumberedAnswerEvaluation] = Field(description="One evaluation per answer, in the order given")
+
+structured_llm_batch_evaluator = evaluation_llm.with_structured_output(BatchEvaluation)
+
+batch_evaluation_prompt = ChatPromptTemplate.from_messages([
+    ("system", evaluation_system_prompt + """
+
+You will receive several answers at once. Evaluate each one independently, as if it were the only answer,
+and return exactly one evaluation per question with its question_number."""),
+    ("human", """Evaluate the following {count} answers.
+
+{answers}""")
+])
+
+batch_evaluation_chain: RunnableSequence = batch_evaluation_prompt | structured_llm_batch_evaluator
+
+def format_answer_block(question_data: dict, student_answer: str) -> str:
+    """One question/answer section of a batched evaluation prompt"""
+    key_points_text = "\n".join([f"{i+1}. {point}" for i, point in enumerate(question_data["key_points"])])
+    return f"""### Question {question_data["question_number"]}
+Question: {question_data["question"]}
+
+Maximum Marks: {question_data["marks"]}
+Difficulty: {question_data["difficulty"]}
+
+Key Points Expected:
+{key_points_text}
+
+Sample Answer:
+{question_data["sample_answer"]}
+
+Student's Answer:
+{student_answer}"""
+
+def plan_batch_indices(items: List[tuple], token_budget: int = EVAL_BATCH_TOKEN_BUDGET,
+                       max_batch_size: int = EVAL_MAX_BATCH_SIZE) -> List[List[int]]:
+    """
+    Group (question_data, answer) pairs, by index, so each batch's answer blocks fit the token budget
+
+    Batch results are matched back by question number, so a batch never holds
+    two answers to the same question (as happens when grading a whole class).
+    """
+    batches: List[List[int]] = []
+    used: List[int] = []
+    numbers: List[set] = []
+    for index, (question_data, answer) in enumerate(items):
+        cost = estimate_tokens(format_answer_block(question_data, answer))
+        number = question_data["question_number"]
+        for b, batch in enumerate(batches):
+            if (number not in numbers[b] and len(batch) < max_batch_size
+                    and used[b] + cost <= token_budget):
+                break
+        else:
+            b = len(batches)
+            batches.append([])
+            used.append(0)
+            numbers.append(set())
+        batches[b].append(index)
+        used[b] += cost
+        numbers[b].add(number)
+    return batches
+
+def plan_evaluation_batches(items: List[tuple], token_budget: int = EVAL_BATCH_TOKEN_BUDGET,
+                            max_batch_size: int = EVAL_MAX_BATCH_SIZE) -> List[List[tuple]]:
+    """Group (question_data, answer) pairs so each batch's answer blocks fit the token budget"""
+    return [[items[i] for i in batch] for batch in plan_batch_indices(items, token_budget, max_batch_size)]
+
+def overall_feedback(percentage: float) -> str:
+    if percentage >= 90:
+        return "Outstanding! Excellent understanding of the subject."
+    elif percentage >= 80:
+        return "Excellent work! Strong grasp of the concepts."
+    elif percentage >= 70:
+        return "Good performance! Solid understanding with room for improvement."
+    elif percentage >= 60:
+        return "Satisfactory. Review the concepts and practice more."
+    elif percentage >= 50:
+        return "Pass. Significant improvement needed in understanding."
+    else:
+        return "Needs improvement. Please review the material thoroughly."
+
 # Node functions
 def retrieve(state: ExamState) -> Dict[str, Any]:
     print("---RETRIEVE FOR EXAM---")
     topic = state["question"]
     subject = state.get("subject")
     
-    # Create a comprehensive search query
-    search_query = f"{topic} concepts theory applications examples problems"
+    # Shared (subject, topic) context, trimmed to this generator's token budget
     if subject:
-        search_query = f"{subject} {search_query}"
         print(f"---FILTERING BY SUBJECT: {subject}---")
-        retriever = get_retriever(subject=subject)
-    else:
-        print("---NO SUBJECT FILTER---")
-        retriever = get_retriever()
-    
-    documents = retriever.invoke(search_query)
+    documents = fit_to_budget(topic_context.get(topic, subject), CONTEXT_TOKEN_BUDGET)
     print(f"---RETRIEVED {len(documents)} DOCUMENTS FOR EXAM GENERATION---")
     
     return {
@@ -203,6 +285,122 @@ def retrieve(state: ExamState) -> Dict[str, Any]:
         "subject": subject
     }
 
+def plan_shards(num_hard: int, num_medium: int, shard_size: int = SHARD_SIZE) -> List[dict]:
+    """Split the requested exam into single-difficulty shards of at most shard_size questions"""
+    shards = []
+    for difficulty, count, marks in (("hard", num_hard, 10), ("medium", num_medium, 5)):
+        for start in range(0, count, shard_size):
+            shards.append({
+                "index": len(shards),
+                "difficulty": difficulty,
+                "marks": marks,
+                "num_questions": min(shard_size, count - start)
+            })
+    return shards
+
+def partition_documents(documents: list, num_shards: int) -> List[list]:
+    """Give each shard a disjoint slice of the documents (all of them when there are too few)"""
+    if len(documents) < num_shards:
+        return [documents] * num_shards
+    return [documents[i::num_shards] for i in range(num_shards)]
+
+def generate_shard(shard: dict, documents: list, topic: str, exclude: Optional[List[str]] = None) -> List[ExamQuestion]:
+    """
+    Generate one shard, keeping valid questions from a short result
+    
+    Retries are top-ups: they ask only for the missing questions, over a trimmed
+    slice of the documents, with everything already written passed as exclusions.
+    """
+    full_content = "\n\n".join([doc.page_content for doc in documents])
+    topup_content = "\n\n".join([doc.page_content for doc in fit_to_budget(documents, TOPUP_CONTEXT_TOKENS)])
+    needed = shard["num_questions"]
+    exclude = list(exclude or [])
+    questions: List[ExamQuestion] = []
+    
+    for attempt in range(MAX_SHARD_RETRIES):
+        missing = needed - len(questions)
+        if missing <= 0:
+            break
+        try:
+            result = llm_gate.invoke(exam_generator_chain, {
+                "documents": topup_content if questions else full_content,
+                "topic": topic,
+                "num_questions": missing,
+                "difficulty_label": shard["difficulty"].upper(),
+                "difficulty_guidelines": DIFFICULTY_GUIDELINES[shard["difficulty"]],
+                "marks": shard["marks"],
+                "exclusions": format_exclusions(exclude + [q.question for q in questions])
+            })
+        except Exception as e:
+            print(f"---SHARD {shard['index']} ERROR ON ATTEMPT {attempt + 1}: {e}---")
+            continue
+        
+        seen = {q.question.strip().lower() for q in questions}
+        new = [q for q in result.questions if q.question.strip().lower() not in seen][:missing]
+        questions.extend(new)
+        label = "TOP-UP" if attempt else "GOT"
+        print(f"---SHARD {shard['index']} ({shard['difficulty'].upper()}) {label}: {len(questions)}/{needed}---")
+    
+    if len(questions) < needed:
+        print(f"---! WARNING: SHARD {shard['index']} SHORT AFTER {MAX_SHARD_RETRIES} ATTEMPTS ({len(questions)}/{needed})---")
+    return questions
+
+def run_shards(shards: List[dict], documents: list, topic: str, exclude: Optional[List[str]] = None):
+    """Run shards concurrently, yielding (shard, questions) as each one finishes"""
+    doc_slices = partition_documents(documents, len(shards))
+    futures = {
+        shard_executor.submit(generate_shard, shard, doc_slice, topic, exclude): shard
+        for shard, doc_slice in zip(shards, doc_slices)
+    }
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+def iter_exam_shards(documents: list, topic: str, num_hard: int, num_medium: int,
+                     session: Optional[DedupSession] = None):
+    """
+    Run all shards concurrently, yielding (shard, questions) as each one finishes
+    
+    Latency is bounded by the slowest shard rather than by whole-exam retries.
+    With a dedup session, near-duplicate questions are dropped and only their
+    slots are regenerated, as smaller shards of the same difficulty.
+    """
+    shards = plan_shards(num_hard, num_medium)
+    exclude = None
+    for attempt in range(MAX_REGEN_ROUNDS + 1):
+        refill = []
+        for shard, questions in run_shards(shards, documents, topic, exclude):
+            if session is not None:
+                kept = [q for q in questions if session.accept(q.question)]
+                if len(kept) < len(questions):
+                    refill.append({**shard, "num_questions": len(questions) - len(kept)})
+                questions = kept
+            yield shard, questions
+        if not refill or attempt == MAX_REGEN_ROUNDS:
+            break
+        print(f"---REGENERATING {sum(r['num_questions'] for r in refill)} NEAR-DUPLICATE EXAM SLOTS---")
+        shards = refill
+        exclude = session.texts
+
+def to_exam_question(q: ExamQuestion, shard: dict, question_number: int) -> dict:
+    """Serializable question with difficulty and marks fixed by its shard"""
+    return {
+        "question_number": question_number,
+        "question": q.question,
+        "question_type": q.question_type,
+        "difficulty": shard["difficulty"],
+        "marks": shard["marks"],
+        "key_points": q.key_points,
+        "sample_answer": q.sample_answer
+    }
+
+def merge_shards(shard_results: List[tuple]) -> List[dict]:
+    """Order shard output hard-first and number the exam"""
+    exam_data = []
+    for shard, questions in sorted(shard_results, key=lambda item: item[0]["index"]):
+        for q in questions:
+            exam_data.append(to_exam_question(q, shard, len(exam_data) + 1))
+    return exam_data
+
 def generate_exam(state: ExamState) -> Dict[str, Any]:
     print("---GENERATE EXAM---")
     
@@ -225,57 +423,22 @@ def generate_exam(state: ExamState) -> Dict[str, Any]:
             "subject": subject
         }
     
-    # Combine document content
-    doc_content = "\n\n".join([doc.page_content for doc in documents[:15]])
+    print(f"---GENERATING {total_questions} QUESTIONS IN {len(plan_shards(num_hard, num_medium))} SHARDS---")
+    session = exam_duplicates.session(state.get("subject"))
+    try:
+        shard_results = list(iter_exam_shards(documents, topic, num_hard, num_medium, session))
+    except Exception as e:
+        return {
+            "exam_data": [],
+            "generation": f"Error generating exam: {str(e)}",
+            "question": topic,
+            "subject": subject
+        }
     
-    # Retry logic: Try up to 3 times to get the correct number of questions
-    max_retries = 3
-    exam_result = None
+    exam_data = merge_shards(shard_results)
+    session.commit()
     
-    for attempt in range(max_retries):
-        try:
-            print(f"---ATTEMPT {attempt + 1}/{max_retries} TO GENERATE {total_questions} QUESTIONS---")
-            
-            # Generate exam questions
-            exam_result = exam_generator_chain.invoke({
-                "documents": doc_content,
-                "topic": topic,
-                "num_hard": num_hard,
-                "num_medium": num_medium,
-                "total_questions": total_questions,
-                "start_medium": num_hard + 1
-            })
-            
-            print(f"---GENERATED {len(exam_result.questions)} QUESTIONS (Expected: {total_questions})---")
-            
-            # Check if we got the right number
-            if len(exam_result.questions) == total_questions:
-                print("---✓ SUCCESS: Correct number of questions generated---")
-                break
-            elif len(exam_result.questions) > total_questions:
-                print(f"---! WARNING: Got {len(exam_result.questions)} questions, trimming to {total_questions}---")
-                # Trim excess questions
-                exam_result.questions = exam_result.questions[:total_questions]
-                break
-            elif attempt < max_retries - 1:
-                print(f"---↻ RETRY: Got {len(exam_result.questions)} questions, retrying...---")
-                continue
-            else:
-                print(f"---! WARNING: After {max_retries} attempts, got {len(exam_result.questions)} questions---")
-                # Proceed with whatever we got
-            
-        except Exception as e:
-            print(f"---ERROR ON ATTEMPT {attempt + 1}: {e}---")
-            if attempt == max_retries - 1:
-                return {
-                    "exam_data": [],
-                    "generation": f"Error generating exam after {max_retries} attempts: {str(e)}",
-                    "question": topic,
-                    "subject": subject
-                }
-            continue
-    
-    if not exam_result or not exam_result.questions:
+    if not exam_data:
         return {
             "exam_data": [],
             "generation": "Failed to generate exam questions.",
@@ -283,31 +446,7 @@ def generate_exam(state: ExamState) -> Dict[str, Any]:
             "subject": subject
         }
     
-    # Convert to serializable format and ensure correct marks distribution
-    exam_data = []
-    total_marks = 0
-    
-    for i, q in enumerate(exam_result.questions):
-        # First num_hard questions should be 10 marks (hard)
-        # Next num_medium questions should be 5 marks (medium)
-        if i < num_hard:
-            marks = 10
-            difficulty = "hard"
-        else:
-            marks = 5
-            difficulty = "medium"
-        
-        total_marks += marks
-        
-        exam_data.append({
-            "question_number": i + 1,
-            "question": q.question,
-            "question_type": q.question_type,
-            "difficulty": difficulty,
-            "marks": marks,
-            "key_points": q.key_points,
-            "sample_answer": q.sample_answer
-        })
+    total_marks = sum(q["marks"] for q in exam_data)
     
     # Generate summary message
     generation = f"Generated {len(exam_data)} exam questions on {topic}. Total marks: {total_marks}"
@@ -342,8 +481,8 @@ exam_app = workflow.compile()
 class ExamSystem:
     def __init__(self):
         self.app = exam_app
-        self.current_exam = None
-        self.executor = ThreadPoolExecutor(max_workers=5)
+        # Hit rates are counted in the shared aggregates, across workers
+        self.evaluation_cache = EvaluationCache(counters=open_aggregates("evaluation_cache"))
     
     def generate_exam(self, topic: str, subject: str = None, num_hard: int = 3, num_medium: int = 9):
         """Generate an exam on a specific topic"""
@@ -369,12 +508,6 @@ class ExamSystem:
             exam_config = response.get("exam_config", {})
             
             if exam_data:
-                self.current_exam = {
-                    "exam_data": exam_data,
-                    "topic": topic,
-                    "subject": subject,
-                    "total_marks": exam_config.get("total_marks", 0)
-                }
                 return {
                     "success": True,
                     "exam_data": exam_data,
@@ -391,37 +524,45 @@ class ExamSystem:
         except Exception as e:
             return {"success": False, "message": f"Error generating exam: {e}"}
     
-    async def evaluate_answer_async(self, question_data: dict, student_answer: str) -> dict:
+    def generate_exam_stream(self, topic: str, subject: str = None, num_hard: int = 3, num_medium: int = 9):
+        """
+        Generate an exam incrementally, yielding each question as soon as its shard is done
+        
+        Questions are numbered in arrival order and checked for near-duplicates
+        against each other and earlier exams on the subject; dropped slots are
+        regenerated. Raises ValueError when retrieval finds no documents.
+        """
+        print(f"---STREAMING EXAM: {topic} ({num_hard} HARD + {num_medium} MEDIUM)---")
+        documents = retrieve({"question": topic, "subject": subject})["documents"]
+        if not documents:
+            raise ValueError("No documents available to generate exam questions.")
+        
+        session = exam_duplicates.session(subject)
+        number = 0
+        for shard, questions in iter_exam_shards(documents, topic, num_hard, num_medium, session):
+            for q in questions:
+                number += 1
+                yield to_exam_question(q, shard, number)
+        session.commit()
+    
+    async def evaluate_answer_async(self, question_data: dict, student_answer: str,
+                                    priority: str = "normal") -> dict:
         """Asynchronously evaluate a single answer"""
         try:
             # Format key points as a numbered list
             key_points_text = "\n".join([f"{i+1}. {point}" for i, point in enumerate(question_data["key_points"])])
             
-            # Run evaluation in executor to avoid blocking
-            loop = asyncio.get_event_loop()
-            evaluation = await loop.run_in_executor(
-                self.executor,
-                lambda: evaluation_chain.invoke({
-                    "question": question_data["question"],
-                    "max_marks": question_data["marks"],
-                    "difficulty": question_data["difficulty"],
-                    "key_points": key_points_text,
-                    "sample_answer": question_data["sample_answer"],
-                    "student_answer": student_answer
-                })
-            )
-            
-            return {
-                "question_number": question_data["question_number"],
-                "score": evaluation.score,
+            # Native async call, gated with every other LLM call in the process
+            evaluation = await llm_gate.ainvoke(evaluation_chain, {
+                "question": question_data["question"],
                 "max_marks": question_data["marks"],
-                "feedback": evaluation.feedback,
-                "strengths": evaluation.strengths,
-                "improvements": evaluation.improvements,
-                "key_points_covered": evaluation.key_points_covered,
-                "key_points_missed": evaluation.key_points_missed,
-                "success": True
-            }
+                "difficulty": question_data["difficulty"],
+                "key_points": key_points_text,
+                "sample_answer": question_data["sample_answer"],
+                "student_answer": student_answer
+            }, priority=priority)
+            
+            return self._evaluation_result(question_data, evaluation)
             
         except Exception as e:
             return {
@@ -432,76 +573,289 @@ class ExamSystem:
                 "success": False
             }
     
-    async def evaluate_exam_async(self, exam_id: str, answers: List[Dict[str, str]]) -> dict:
+    def _evaluation_result(self, question_data: dict, evaluation: AnswerEvaluation) -> dict:
+        return {
+            "question_number": question_data["question_number"],
+            "score": evaluation.score,
+            "max_marks": question_data["marks"],
+            "feedback": evaluation.feedback,
+            "strengths": evaluation.strengths,
+            "improvements": evaluation.improvements,
+            "key_points_covered": evaluation.key_points_covered,
+            "key_points_missed": evaluation.key_points_missed,
+            "success": True
+        }
+    
+    async def evaluate_batch_async(self, batch: List[tuple], priority: str = "normal") -> List[dict]:
+        """
+        Evaluate a group of (question_data, answer) pairs in one structured-output call
+        
+        Evaluations that are missing, duplicated or score outside 0..max marks fail
+        validation and those answers are re-evaluated with single-answer calls.
+        Results are returned in batch order.
+        """
+        if len(batch) == 1:
+            return [await self.evaluate_answer_async(*batch[0], priority=priority)]
+        
+        by_number = {}
+        try:
+            result = await llm_gate.ainvoke(batch_evaluation_chain, {
+                "count": len(batch),
+                "answers": "\n\n".join(format_answer_block(q, a) for q, a in batch)
+            }, priority=priority)
+            for evaluation in result.evaluations:
+                by_number.setdefault(evaluation.question_number, []).append(evaluation)
+        except Exception as e:
+            print(f"---BATCH EVALUATION ERROR, FALLING BACK TO SINGLE CALLS: {e}---")
+        
+        evaluations = [None] * len(batch)
+        fallback = []
+        for i, (question_data, student_answer) in enumerate(batch):
+            matches = by_number.get(question_data["question_number"], [])
+            if len(matches) == 1 and 0 <= matches[0].score <= question_data["marks"]:
+                evaluations[i] = self._evaluation_result(question_data, matches[0])
+            else:
+                fallback.append(i)
+        
+        if fallback:
+            print(f"---RE-EVALUATING {len(fallback)}/{len(batch)} ANSWERS INDIVIDUALLY---")
+            retried = await asyncio.gather(*[self.evaluate_answer_async(*batch[i], priority=priority) for i in fallback])
+            for i, evaluation in zip(fallback, retried):
+                evaluations[i] = evaluation
+        return evaluations
+    
+    async def evaluate_items_async(self, items: List[tuple], batch_mode: bool = None,
+                                   on_item: Callable[[int, dict], None] = None,
+                                   priority: str = "normal") -> List[dict]:
+        """
+        Evaluate (question_data, answer) pairs, returning evaluations in item order
+        
+        Clear-cut answers are graded locally; answers graded before (same text
+        and rubric) come straight from the cache. Only the rest reach the LLM,
+        batched by token budget unless disabled. on_item(index, evaluation) is
+        called as each evaluation becomes available.
+        """
+        evaluations: List[Optional[dict]] = [None] * len(items)
+        
+        def ready(index: int, evaluation: dict):
+            evaluations[index] = evaluation
+            if on_item:
+                on_item(index, evaluation)
+        
+        def grade_locally() -> List[Optional[dict]]:
+            local = [pre_grade(q, a) for q, a in items]
+            cached = iter(self.evaluation_cache.get_many([items[i] for i, e in enumerate(local) if e is None]))
+            return [e or next(cached) for e in local]
+        
+        def remember(graded: List[tuple]):
+            for i, evaluation in graded:
+                self.evaluation_cache.put(*items[i], evaluation)
+        
+        # The cache is a SQLite database: query it on the storage pool, off the event loop
+        loop = asyncio.get_running_loop()
+        pending = []
+        for i, local in enumerate(await loop.run_in_executor(storage_executor, grade_locally)):
+            if local:
+                ready(i, local)
+            else:
+                pending.append(i)
+        if len(pending) < len(items):
+            print(f"---{len(items) - len(pending)} ANSWERS PRE-GRADED OR SERVED FROM CACHE---")
+        
+        if batch_mode is None:
+            batch_mode = EVAL_BATCH_MODE
+        if batch_mode:
+            batches = [[pending[i] for i in batch] for batch in plan_batch_indices([items[i] for i in pending])]
+            print(f"---EVALUATING {len(pending)} ANSWERS IN {len(batches)} BATCHES---")
+        else:
+            batches = [[i] for i in pending]
+            print(f"---EVALUATING {len(pending)} ANSWERS ASYNCHRONOUSLY---")
+        
+        async def run(batch: List[int]) -> tuple:
+            return batch, await self.evaluate_batch_async([items[i] for i in batch], priority)
+        
+        # Collect results as each call finishes so callers can report progress
+        for next_batch in asyncio.as_completed([run(batch) for batch in batches]):
+            batch, results = await next_batch
+            await loop.run_in_executor(storage_executor, remember, list(zip(batch, results)))
+            for i, evaluation in zip(batch, results):
+                ready(i, evaluation)
+        return evaluations
+    
+    def _exam_summary(self, exam: dict, evaluations: List[dict]) -> dict:
+        """Total score, percentage and overall feedback for one submission"""
+        total_score = sum(e["score"] for e in evaluations if e["success"])
+        total_max_marks = exam["total_marks"]
+        percentage = (total_score / total_max_marks * 100) if total_max_marks > 0 else 0
+        return {
+            "total_score": round(total_score, 2),
+            "total_max_marks": total_max_marks,
+            "percentage": round(percentage, 2),
+            "overall_feedback": overall_feedback(percentage)
+        }
+    
+    def _pair_answers(self, exam_data: List[dict], answers: List[Dict[str, str]]) -> List[tuple]:
+        """Pair each answer with its question, dropping answers to unknown questions"""
+        questions = {q["question_number"]: q for q in exam_data}
+        return [
+            (questions[a["question_number"]], a["answer"])
+            for a in answers if a["question_number"] in questions
+        ]
+    
+    async def evaluate_exam_async(self, exam_id: str, exam: dict, answers: List[Dict[str, str]],
+                                  batch_mode: bool = None, on_result: Callable[[dict], None] = None) -> dict:
         """
         Asynchronously evaluate all answers in an exam
         
+        The exam definition is passed in on every call and nothing is stored on
+        the system, so submissions for different exams can be graded concurrently.
+        
         Args:
             exam_id: ID of the exam
+            exam: Exam definition with exam_data (full questions), topic, subject and total_marks
             answers: List of dicts with question_number and answer
+            batch_mode: Grade several answers per call (defaults to EXAM_EVAL_BATCH_MODE)
+            on_result: Called with each per-question evaluation as soon as it is ready
             
         Returns:
             Evaluation results with scores and feedback
         """
-        if not self.current_exam:
-            return {"success": False, "message": "No exam loaded"}
+        if not exam or not exam.get("exam_data"):
+            return {"success": False, "message": "No exam questions to evaluate against"}
         
-        exam_data = self.current_exam["exam_data"]
+        items = self._pair_answers(exam["exam_data"], answers)
         
-        # Create evaluation tasks for all answers
-        tasks = []
-        for answer_item in answers:
-            question_num = answer_item["question_number"]
-            student_answer = answer_item["answer"]
-            
-            # Find the corresponding question
-            question_data = next((q for q in exam_data if q["question_number"] == question_num), None)
+        on_item = (lambda index, evaluation: on_result(evaluation)) if on_result else None
+        evaluations = await self.evaluate_items_async(items, batch_mode, on_item)
+        evaluations.sort(key=lambda e: e["question_number"])
+        pre_graded = sum(1 for e in evaluations if e.get("pre_graded"))
+        cached = sum(1 for e in evaluations if e.get("cached"))
+        
+        return {
+            "success": True,
+            "exam_id": exam_id,
+            "topic": exam["topic"],
+            "subject": exam.get("subject"),
+            "evaluations": evaluations,
+            **self._exam_summary(exam, evaluations),
+            "questions_evaluated": len(evaluations),
+            "cached_evaluations": cached,
+            "pre_graded_evaluations": pre_graded,
+            "llm_calls_avoided": pre_graded + cached,
+            "successful_evaluations": sum(1 for e in evaluations if e["success"])
+        }
+    
+    async def grade_submissions_async(self, exam_id: str, exam: dict,
+                                      submissions: Dict[str, List[Dict[str, str]]],
+                                      batch_mode: bool = None, priority: str = "low",
+                                      on_progress: Callable[[str, int, dict], None] = None,
+                                      graded: Optional[Dict[str, Dict[str, dict]]] = None) -> dict:
+        """
+        Grade a whole class's submissions for one exam
+        
+        Identical answers to the same question (ignoring case and whitespace) are
+        graded once and shared across students. Calls run at low priority by
+        default so interactive grading and chat are served first.
+        
+        Args:
+            exam_id: ID of the exam
+            exam: Exam definition with exam_data, topic, subject and total_marks
+            submissions: session_id -> list of dicts with question_number and answer
+            batch_mode: Grade several answers per call (defaults to EXAM_EVAL_BATCH_MODE)
+            priority: LLM gate priority for the grading calls
+            on_progress: Called with (session_id, question_number, evaluation) as answers are graded
+            graded: Evaluations already made for this job (session_id -> question_number
+                    as a string -> evaluation), e.g. by a worker that stopped; not graded again
             
-            if question_data:
-                tasks.append(self.evaluate_answer_async(question_data, student_answer))
+        Returns:
+            Per-session results plus class-wide statistics
+        """
+        if not exam or not exam.get("exam_data"):
+            return {"success": False, "message": "No exam questions to evaluate against"}
         
-        # Execute all evaluations concurrently
-        print(f"---EVALUATING {len(tasks)} ANSWERS ASYNCHRONOUSLY---")
-        evaluations = await asyncio.gather(*tasks)
+        started = time.perf_counter()
         
-        # Calculate total score
-        total_score = sum(e["score"] for e in evaluations if e["success"])
-        total_max_marks = self.current_exam["total_marks"]
-        percentage = (total_score / total_max_marks * 100) if total_max_marks > 0 else 0
+        # One item per distinct (question, normalized answer); remember who gave it
+        graded = graded or {}
+        per_session: Dict[str, List[dict]] = {session_id: [] for session_id in submissions}
+        unique_items: List[tuple] = []
+        owners: List[List[str]] = []
+        index_by_key: Dict[tuple, int] = {}
+        total_answers = 0
+        resumed = 0
+        for session_id, answers in submissions.items():
+            for question_data, student_answer in self._pair_answers(exam["exam_data"], answers):
+                total_answers += 1
+                earlier = graded.get(session_id, {}).get(str(question_data["question_number"]))
+                if earlier:
+                    per_session[session_id].append(dict(earlier))
+                    resumed += 1
+                    continue
+                key = (question_data["question_number"], normalize_text(student_answer))
+                if key not in index_by_key:
+                    index_by_key[key] = len(unique_items)
+                    unique_items.append((question_data, student_answer))
+                    owners.append([])
+                owners[index_by_key[key]].append(session_id)
+        print(f"---BULK GRADING {total_answers} ANSWERS ({len(unique_items)} UNIQUE, {resumed} ALREADY GRADED) "
+              f"FROM {len(submissions)} SUBMISSIONS---")
         
-        # Generate overall feedback
-        if percentage >= 90:
-            overall_feedback = "Outstanding! Excellent understanding of the subject."
-        elif percentage >= 80:
-            overall_feedback = "Excellent work! Strong grasp of the concepts."
-        elif percentage >= 70:
-            overall_feedback = "Good performance! Solid understanding with room for improvement."
-        elif percentage >= 60:
-            overall_feedback = "Satisfactory. Review the concepts and practice more."
-        elif percentage >= 50:
-            overall_feedback = "Pass. Significant improvement needed in understanding."
-        else:
-            overall_feedback = "Needs improvement. Please review the material thoroughly."
+        def on_item(index: int, evaluation: dict):
+            if on_progress:
+                for session_id in owners[index]:
+                    on_progress(session_id, evaluation["question_number"], evaluation)
+        
+        unique_evaluations = await self.evaluate_items_async(unique_items, batch_mode, on_item, priority)
+        
+        for index, evaluation in enumerate(unique_evaluations):
+            for session_id in owners[index]:
+                per_session[session_id].append(dict(evaluation))
+        
+        results = {}
+        for session_id, evaluations in per_session.items():
+            evaluations.sort(key=lambda e: e["question_number"])
+            results[session_id] = {
+                "session_id": session_id,
+                "evaluations": evaluations,
+                **self._exam_summary(exam, evaluations),
+                "questions_evaluated": len(evaluations),
+                "successful_evaluations": sum(1 for e in evaluations if e["success"])
+            }
+        
+        question_scores: Dict[int, List[float]] = {}
+        for result in results.values():
+            for e in result["evaluations"]:
+                if e["success"]:
+                    question_scores.setdefault(e["question_number"], []).append(e["score"])
+        percentages = [r["percentage"] for r in results.values()]
+        elapsed = time.perf_counter() - started
+        locally_graded = sum(1 for e in unique_evaluations if e.get("pre_graded") or e.get("cached"))
         
         return {
             "success": True,
             "exam_id": exam_id,
-            "topic": self.current_exam["topic"],
-            "subject": self.current_exam.get("subject"),
-            "evaluations": evaluations,
-            "total_score": round(total_score, 2),
-            "total_max_marks": total_max_marks,
-            "percentage": round(percentage, 2),
-            "overall_feedback": overall_feedback,
-            "questions_evaluated": len(evaluations),
-            "successful_evaluations": sum(1 for e in evaluations if e["success"])
+            "topic": exam["topic"],
+            "subject": exam.get("subject"),
+            "results": results,
+            "submissions_graded": len(results),
+            "total_answers": total_answers,
+            "unique_answers": len(unique_items),
+            "answers_resumed": resumed,
+            "llm_calls_avoided": total_answers - resumed - len(unique_items) + locally_graded,
+            "class_average_percentage": round(sum(percentages) / len(percentages), 2) if percentages else 0,
+            "question_averages": {
+                number: round(sum(scores) / len(scores), 2)
+                for number, scores in sorted(question_scores.items())
+            },
+            "elapsed_seconds": round(elapsed, 2),
+            "answers_per_minute": round(total_answers / elapsed * 60, 1) if elapsed > 0 else None
         }
     
-    def evaluate_exam(self, exam_id: str, answers: List[Dict[str, str]]) -> dict:
+    def evaluate_exam(self, exam_id: str, exam: dict, answers: List[Dict[str, str]], batch_mode: bool = None) -> dict:
         """
         Synchronous wrapper for evaluate_exam_async
         """
-        return asyncio.run(self.evaluate_exam_async(exam_id, answers))
+        return asyncio.run(self.evaluate_exam_async(exam_id, exam, answers, batch_mode))
 
 
 if __name__ == "__main__":
@@ -5,12 +5,14 @@ import os
 import random
 
 # Langchain imports
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_pinecone import PineconeVectorStore
+from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableSequence
 from pydantic import BaseModel, Field
-from pinecone import Pinecone
+
+from topic_context import topic_context, fit_to_budget
+from concurrency import llm_gate
+from near_duplicates import NearDuplicateDetector, generate_unique, default_embed_fn
 
 load_dotenv()
 
@@ -28,23 +30,8 @@ class FlashcardState(TypedDict):
     flashcard_config: Optional[dict]
     generation: str
 
-# Initialize components
-embedding = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index(os.environ["INDEX_NAME"])
-
-# Retriever function
-def get_retriever(subject=None):
-    vectorstore = PineconeVectorStore(index=index, embedding=embedding)
-    
-    if subject:
-        retriever = vectorstore.as_retriever(
-            search_kwargs={"filter": {"subject": subject}}
-        )
-    else:
-        retriever = vectorstore.as_retriever()
-    
-    return retriever
+# Token budget for this generator's share of the shared topic context
+CONTEXT_TOKEN_BUDGET = int(os.getenv("FLASHCARD_CONTEXT_TOKENS", "3000"))
 
 # Flashcard models
 class Flashcard(BaseModel):
@@ -115,17 +102,10 @@ def retrieve(state: FlashcardState) -> Dict[str, Any]:
     topic = state["question"]  # Using question as topic
     subject = state.get("subject")
     
-    # Create a search query from the topic
-    search_query = f"{topic} concepts definitions examples key terms"
+    # Shared (subject, topic) context, trimmed to this generator's token budget
     if subject:
-        search_query = f"{subject} {search_query}"
         print(f"---FILTERING BY SUBJECT: {subject}---")
-        retriever = get_retriever(subject=subject)
-    else:
-        print("---NO SUBJECT FILTER---")
-        retriever = get_retriever()
-    
-    documents = retriever.invoke(search_query)
+    documents = fit_to_budget(topic_context.get(topic, subject), CONTEXT_TOKEN_BUDGET)
     print(f"---RETRIEVED {len(documents)} DOCUMENTS FOR FLASHCARD GENERATION---")
     
     return {
@@ -159,7 +139,7 @@ def generate_flashcards(state: FlashcardState) -> Dict[str, Any]:
         doc_content = "\n\n".join([doc.page_content for doc in documents])
         
         # Generate flashcards
-        flashcard_result = flashcard_generator_chain.invoke({
+        flashcard_result = llm_gate.invoke(flashcard_generator_chain, {
             "documents": doc_content,
             "topic": topic,
             "subject": subject,
@@ -220,20 +200,32 @@ class FlashcardSystem:
     def __init__(self):
         self.app = app3
         self.current_flashcards = None
+        # Per-subject index of card fronts so repeated generations do not repeat cards
+        self.duplicates = NearDuplicateDetector(embed_fn=default_embed_fn())
     
     def generate_flashcards(self, topic: str, subject: str = None, num_cards: int = 10):
-        """Generate flashcards on a specific topic"""
+        """Generate flashcards on a specific topic, regenerating only near-duplicate cards"""
         try:
-            response = self.app.invoke({
-                "question": topic,  # Using question field as topic
-                "subject": subject,
-                "documents": [],
-                "flashcard_data": [],
-                "flashcard_config": {"num_cards": num_cards},
-                "generation": ""
-            })
+            session = self.duplicates.session(subject)
+            response = {}
+            
+            def generate(n: int) -> List[dict]:
+                if not response:
+                    response.update(self.app.invoke({
+                        "question": topic,  # Using question field as topic
+                        "subject": subject,
+                        "documents": [],
+                        "flashcard_data": [],
+                        "flashcard_config": {"num_cards": n},
+                        "generation": ""
+                    }))
+                else:
+                    # Reuse the retrieved documents for regeneration rounds
+                    response.update(generate_flashcards({**response, "flashcard_config": {"num_cards": n}}))
+                return response.get("flashcard_data", [])
             
-            flashcard_data = response.get("flashcard_data", [])
+            flashcard_data = generate_unique(generate, num_cards, session, lambda card: card["front"])
+            session.commit()
             if flashcard_data:
                 self.current_flashcards = flashcard_data
                 return {
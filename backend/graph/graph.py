@@ -1,6 +1,7 @@
 from dotenv import load_dotenv
 from langgraph.graph import END, StateGraph
 
+from concurrency import llm_gate
 from graph.chains.answer_grader import answer_grader
 from graph.chains.hallucination_grader import hallucination_grader
 from graph.chains.router import RouteQuery, question_router
@@ -30,14 +31,14 @@ def grade_generation_grounded_in_documents_and_question(state: GraphState) -> st
     documents = state["documents"]
     generation = state["generation"]
 
-    score = hallucination_grader.invoke(
-        {"documents": documents, "generation": generation}
+    score = llm_gate.invoke(
+        hallucination_grader, {"documents": documents, "generation": generation}
     )
 
     if hallucination_grade := score.binary_score:
         print("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
         print("---GRADE GENERATION vs QUESTION---")
-        score = answer_grader.invoke({"question": question, "generation": generation})
+        score = llm_gate.invoke(answer_grader, {"question": question, "generation": generation})
         if answer_grade := score.binary_score:
             print("---DECISION: GENERATION ADDRESSES QUESTION---")
             return "useful"
@@ -54,7 +55,7 @@ def route_question(state: GraphState) -> str:
     question = state["question"]
     subject = state.get("subject", "")
     
-    source: RouteQuery = question_router.invoke({
+    source: RouteQuery = llm_gate.invoke(question_router, {
         "question": question, 
         "subject": subject
     })
@@ -1,5 +1,6 @@
 from typing import Any, Dict
 
+from concurrency import llm_gate
 from graph.chains.conversational_generation import generation_chain
 from graph.state import GraphState
 
@@ -24,7 +25,7 @@ def generate(state: GraphState) -> Dict[str, Any]:
     print(f"   Subject: {subject}")
     print(f"   Context length: {len(context)} chars")
     
-    generation = generation_chain.invoke({
+    generation = llm_gate.invoke(generation_chain, {
         "context": context,
         "question": question,
         "subject": subject
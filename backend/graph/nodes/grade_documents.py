@@ -1,5 +1,6 @@
 from typing import Any, Dict
 
+from concurrency import llm_gate
 from graph.chains.retrieval_grader import retrieval_grader
 from graph.state import GraphState
 from graph.utils.source_extractor import extract_sources_from_documents
@@ -27,8 +28,8 @@ def grade_documents(state: GraphState) -> Dict[str, Any]:
     web_search = False
     
     for d in documents:
-        score = retrieval_grader.invoke(
-            {"question": question, "document": d.page_content}
+        score = llm_gate.invoke(
+            retrieval_grader, {"question": question, "document": d.page_content}
         )
         grade = score.binary_score
         if grade.lower() == "yes":
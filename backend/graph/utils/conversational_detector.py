@@ -3,6 +3,8 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
 
+from concurrency import llm_gate
+
 
 class QueryType(BaseModel):
     """Query classification"""
@@ -60,7 +62,7 @@ def detect_conversational_query(query: str, subject: str = "general") -> Dict:
     Returns:
         Dict with classification flags
     """
-    result = query_classifier.invoke({
+    result = llm_gate.invoke(query_classifier, {
         "query": query,
         "subject": subject or "general topics"
     })
@@ -49,20 +49,20 @@ index = pc.Index(os.environ["INDEX_NAME"])
 # batch_upload(all_docs, batch_size=50)
 
 # Create retriever function that supports subject filtering
-def get_retriever(subject=None):
+def get_retriever(subject=None, k=None):
     vectorstore = PineconeVectorStore(
         index=index,
         embedding=embedding,
     )
     
+    search_kwargs = {}
     if subject:
         # Create retriever with metadata filter
-        retriever = vectorstore.as_retriever(
-            search_kwargs={"filter": {"subject": subject}}
-        )
-    else:
-        # Create retriever without filter
-        retriever = vectorstore.as_retriever()
+        search_kwargs["filter"] = {"subject": subject}
+    if k:
+        search_kwargs["k"] = k
+    
+    retriever = vectorstore.as_retriever(search_kwargs=search_kwargs)
     
     return retriever
 
@@ -1,8 +1,10 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
 from typing import Dict, Any
 import os
+import asyncio
 from dotenv import load_dotenv
 
 # load_dotenv()
@@ -17,6 +19,8 @@ from quiz import QuizSystem
 from flashcard import FlashcardSystem
 from proctoring import ProctoringSystem
 from exam import ExamSystem
+from concurrency import generation_executor, chat_executor
+from storage import storage_info, run_sweeper, storage_executor, storage_writer, PoolExhaustedError
 
 # Import API routers
 from api.chat import router as chat_router
@@ -25,7 +29,10 @@ from api.flashcard import router as flashcard_router
 from api.proctoring import router as proctoring_router, set_proctoring_system
 from api.ingestion import router as ingestion_router
 from api.models import *
-from api.exam import router as exam_router
+from api.exam import router as exam_router, evaluation_queue, watch_evaluation_jobs
+from api.topics import router as topics_router
+from api.diagnostics import router as diagnostics_router
+from topic_catalog import topic_catalog, follow_catalog
 
 
 
@@ -52,13 +59,29 @@ async def lifespan(app: FastAPI):
         print(f"Error initializing systems: {e}")
         raise
     
+    # Evict idle sessions in the background
+    sweeper = asyncio.create_task(run_sweeper())
+    # Keep grading jobs alive across workers and recover those of stopped workers
+    job_watcher = asyncio.create_task(watch_evaluation_jobs())
+    # Pick up topics catalogued by other workers
+    catalog_follower = asyncio.create_task(follow_catalog(topic_catalog))
+    
     yield
     
     # Shutdown
     print("Shutting down...")
-    if proctoring_system and proctoring_system.video_feed_active:
-        print("  Stopping proctoring system...")
-        proctoring_system.stop_proctoring()
+    if proctoring_system and proctoring_system.sessions:
+        print(f"  Stopping {len(proctoring_system.sessions)} proctoring sessions...")
+        proctoring_system.stop_all()
+    sweeper.cancel()
+    job_watcher.cancel()
+    catalog_follower.cancel()
+    await evaluation_queue.stop()
+    generation_executor.shutdown(wait=False, cancel_futures=True)
+    chat_executor.shutdown(wait=False, cancel_futures=True)
+    # Let queued job record writes land before exiting
+    storage_writer.shutdown(wait=True)
+    storage_executor.shutdown(wait=False, cancel_futures=True)
     print("✓ Shutdown complete")
 
 # Create FastAPI app
@@ -66,9 +89,18 @@ app = FastAPI(
     title="Educational RAG API",
     description="Backend API for RAG Chat, Quiz Generation, and Flashcard System",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson for every JSON response (orjson is in requirements.txt)
+    default_response_class=ORJSONResponse
 )
 
+# Storage saturated: tell the client to retry rather than failing with a 500
+@app.exception_handler(PoolExhaustedError)
+async def storage_busy(request: Request, exc: PoolExhaustedError):
+    print(f"---STORAGE POOL EXHAUSTED: {exc}---")
+    return ORJSONResponse(status_code=503, content={"detail": "Storage is busy, please retry"},
+                          headers={"Retry-After": "1"})
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -109,6 +141,8 @@ app.include_router(flashcard_router, prefix="/api/flashcard", tags=["flashcard"]
 app.include_router(proctoring_router, prefix="/api/proctoring", tags=["Proctoring"])
 app.include_router(ingestion_router, prefix="/api/ingestion", tags=["Ingestion"])
 app.include_router(exam_router, prefix="/api/exam", tags=["exam"])
+app.include_router(topics_router, prefix="/api/topics", tags=["topics"])
+app.include_router(diagnostics_router, prefix="/api/diagnostics", tags=["diagnostics"])
 
 @app.get("/")
 async def root():
@@ -121,9 +155,19 @@ async def health_check():
         "rag_system": "initialized",
         "quiz_system": "initialized" if quiz_system else "not initialized",
         "flashcard_system": "initialized" if flashcard_system else "not initialized",
-        "exam_system": "initialized" if exam_system else "not initialized"
+        "exam_system": "initialized" if exam_system else "not initialized",
+        "storage": storage_info()
     }
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    from storage import STORAGE_BACKEND
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1 and STORAGE_BACKEND != "sqlite":
+        # In-memory stores are per process, so workers would not see each other's sessions
+        print("---WEB_CONCURRENCY > 1 NEEDS STORAGE_BACKEND=sqlite, STARTING ONE WORKER---")
+        workers = 1
+    if workers > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,261 @@
+import hashlib
+import math
+import os
+import random
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from topic_catalog import tokenize
+
+# MinHash / LSH parameters (override with environment variables)
+NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "64"))
+LSH_BANDS = int(os.getenv("DEDUP_LSH_BANDS", "16"))
+DUPLICATE_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.7"))
+MAX_INDEX_ITEMS = int(os.getenv("DEDUP_MAX_INDEX_ITEMS", "5000"))
+MAX_REGEN_ROUNDS = int(os.getenv("DEDUP_MAX_REGEN_ROUNDS", "2"))
+
+# Optional embedding confirmation for pairs just below the MinHash threshold
+USE_EMBEDDINGS = os.getenv("DEDUP_EMBEDDINGS", "false").lower() in ("1", "true", "yes")
+EMBEDDING_FLOOR = float(os.getenv("DEDUP_EMBEDDING_FLOOR", "0.4"))
+EMBEDDING_THRESHOLD = float(os.getenv("DEDUP_EMBEDDING_THRESHOLD", "0.92"))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+Signature = Tuple[int, ...]
+EmbedFn = Callable[[List[str]], List[List[float]]]
+
+
+def shingles(text: str) -> set:
+    """Normalized word unigrams and bigrams, so rephrasings with the same content words collide"""
+    tokens = tokenize(text)
+    if not tokens:
+        tokens = text.lower().split()
+    return set(tokens) | {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+
+
+class MinHasher:
+    """Fixed family of NUM_PERM universal hash functions producing MinHash signatures"""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, text: str) -> Signature:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+            for s in shingles(text)
+        ] or [0]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        )
+
+
+def estimate_similarity(sig_a: Signature, sig_b: Signature) -> float:
+    """Estimated Jaccard similarity: fraction of matching MinHash slots"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class SignatureIndex:
+    """
+    LSH index over MinHash signatures for one subject.
+
+    Signatures are split into bands; items sharing any band bucket are candidates,
+    so a lookup touches a handful of buckets instead of every stored item.
+    Oldest items are evicted beyond max_items.
+    """
+
+    def __init__(self, bands: int = LSH_BANDS, max_items: int = MAX_INDEX_ITEMS):
+        self.bands = bands
+        self.max_items = max_items
+        self._items: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Signature], set] = {}
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _band_keys(self, signature: Signature) -> List[Tuple[int, Signature]]:
+        rows = max(1, len(signature) // self.bands)
+        return [(band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def add(self, signature: Signature, text: str, embedding: Optional[List[float]] = None):
+        item_id = self._next_id
+        self._next_id += 1
+        self._items[item_id] = {"signature": signature, "text": text, "embedding": embedding}
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, set()).add(item_id)
+        while len(self._items) > self.max_items:
+            self._remove(next(iter(self._items)))
+
+    def _remove(self, item_id: int):
+        item = self._items.pop(item_id)
+        for band_key in self._band_keys(item["signature"]):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(item_id)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def candidates(self, signature: Signature) -> List[Dict[str, Any]]:
+        ids = set()
+        for band_key in self._band_keys(signature):
+            ids |= self._buckets.get(band_key, set())
+        return [self._items[i] for i in ids]
+
+
+class NearDuplicateDetector:
+    """
+    Near-duplicate check for generated items against a per-subject signature index.
+
+    MinHash similarity at or above the threshold is a duplicate. With an embed_fn,
+    candidates in the grey zone below it are confirmed by embedding cosine.
+    An optional loader seeds a subject's index the first time it is used
+    (e.g. from the question bank).
+    """
+
+    def __init__(self, threshold: float = DUPLICATE_THRESHOLD, embed_fn: Optional[EmbedFn] = None,
+                 loader: Optional[Callable[[str], Iterable[str]]] = None):
+        self.threshold = threshold
+        self.embed_fn = embed_fn
+        self.loader = loader
+        self.hasher = MinHasher()
+        self._indexes: Dict[str, SignatureIndex] = {}
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.duplicates = 0
+
+    def _index(self, subject: str) -> SignatureIndex:
+        index = self._indexes.get(subject)
+        if index is None:
+            index = SignatureIndex()
+            if self.loader:
+                for text in self.loader(subject):
+                    index.add(self.hasher.signature(text), text)
+                print(f"---SEEDED DUPLICATE INDEX FOR {subject or 'ALL SUBJECTS'}: {len(index)} ITEMS---")
+            self._indexes[subject] = index
+        return index
+
+    def _embed(self, item: Dict[str, Any]) -> List[float]:
+        if item.get("embedding") is None:
+            item["embedding"] = self.embed_fn([item["text"]])[0]
+        return item["embedding"]
+
+    def is_duplicate(self, item: Dict[str, Any], candidates: List[Dict[str, Any]]) -> bool:
+        grey = []
+        for other in candidates:
+            similarity = estimate_similarity(item["signature"], other["signature"])
+            if similarity >= self.threshold:
+                return True
+            if similarity >= EMBEDDING_FLOOR:
+                grey.append(other)
+        if self.embed_fn and grey:
+            vector = self._embed(item)
+            return any(cosine(vector, self._embed(other)) >= EMBEDDING_THRESHOLD for other in grey)
+        return False
+
+    def session(self, subject: Optional[str]) -> "DedupSession":
+        return DedupSession(self, subject or "")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "indexed": {subject: len(index) for subject, index in self._indexes.items()}
+        }
+
+
+class DedupSession:
+    """
+    One generated item set: items are checked against each other and the subject
+    index, and only committed to the index once the set is kept.
+    """
+
+    def __init__(self, detector: NearDuplicateDetector, subject: str):
+        self.detector = detector
+        self.subject = subject
+        self._local = SignatureIndex(max_items=MAX_INDEX_ITEMS)
+        self._accepted: List[Dict[str, Any]] = []
+        self._texts: List[str] = []
+
+    @property
+    def texts(self) -> List[str]:
+        """Texts accepted so far in this session"""
+        return list(self._texts)
+
+    def accept(self, text: str) -> bool:
+        """True if text is new; near-duplicates are rejected"""
+        detector = self.detector
+        item = {"signature": detector.hasher.signature(text), "text": text, "embedding": None}
+        with detector._lock:
+            candidates = self._local.candidates(item["signature"])
+            candidates += detector._index(self.subject).candidates(item["signature"])
+            duplicate = detector.is_duplicate(item, candidates)
+            detector.checked += 1
+            if duplicate:
+                detector.duplicates += 1
+                print(f"---NEAR-DUPLICATE DROPPED: {text[:60]}---")
+                return False
+            self._local.add(item["signature"], text, item["embedding"])
+            self._accepted.append(item)
+            self._texts.append(text)
+        return True
+
+    def commit(self):
+        """Register the accepted items in the subject index"""
+        with self.detector._lock:
+            index = self.detector._index(self.subject)
+            for item in self._accepted:
+                index.add(item["signature"], item["text"], item["embedding"])
+        self._accepted = []
+
+
+def generate_unique(generate_fn: Callable[[int], List[Any]], count: int, session: DedupSession,
+                    text_fn: Callable[[Any], str], max_rounds: int = MAX_REGEN_ROUNDS) -> List[Any]:
+    """
+    Generate count items, regenerating only the slots lost to near-duplicates
+
+    generate_fn(n) returns up to n new items. Gives up after max_rounds
+    regenerations and returns whatever unique items it has.
+    """
+    items: List[Any] = []
+    needed = count
+    for attempt in range(max_rounds + 1):
+        batch = generate_fn(needed)
+        if not batch:
+            break
+        kept = [item for item in batch if session.accept(text_fn(item))]
+        items.extend(kept)
+        dropped = len(batch) - len(kept)
+        if not dropped or attempt == max_rounds:
+            break
+        print(f"---REGENERATING {dropped} NEAR-DUPLICATE SLOTS---")
+        needed = dropped
+    return items
+
+
+def default_embed_fn() -> Optional[EmbedFn]:
+    """OpenAI embeddings when DEDUP_EMBEDDINGS is enabled, otherwise MinHash only"""
+    if not USE_EMBEDDINGS:
+        return None
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY")).embed_documents
+
+
+def format_exclusions(questions: List[str]) -> str:
+    """Prompt section listing questions the model must not repeat or rephrase"""
+    if not questions:
+        return "None"
+    return "\n".join(f"- {q}" for q in questions)
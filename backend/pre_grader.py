@@ -0,0 +1,89 @@
+import os
+from typing import Any, Dict, List, Optional
+
+from topic_catalog import tokenize
+from evaluation_cache import normalize_text
+
+# Thresholds for answers that can be graded without the LLM (override with environment variables)
+MIN_ANSWER_TOKENS = int(os.getenv("PREGRADE_MIN_ANSWER_TOKENS", "3"))
+QUESTION_COPY_OVERLAP = float(os.getenv("PREGRADE_QUESTION_COPY_OVERLAP", "0.9"))
+OFF_TOPIC_OVERLAP = float(os.getenv("PREGRADE_OFF_TOPIC_OVERLAP", "0.05"))
+KEY_POINT_COVERAGE = float(os.getenv("PREGRADE_KEY_POINT_COVERAGE", "0.6"))
+
+NON_ANSWERS = {
+    "i don't know", "i dont know", "idk", "don't know", "dont know", "no idea",
+    "not sure", "n/a", "na", "none", "skip", "pass", "?", "-", "..."
+}
+
+
+def key_point_coverage(answer_tokens: set, key_points: List[str]) -> tuple:
+    """Split key points into (covered, missed) by the share of their content words in the answer"""
+    covered, missed = [], []
+    for point in key_points:
+        point_tokens = set(tokenize(point))
+        if point_tokens and len(point_tokens & answer_tokens) / len(point_tokens) >= KEY_POINT_COVERAGE:
+            covered.append(point)
+        else:
+            missed.append(point)
+    return covered, missed
+
+
+def _result(question_data: dict, score: float, feedback: str, covered: List[str], missed: List[str],
+            improvements: List[str]) -> Dict[str, Any]:
+    return {
+        "question_number": question_data["question_number"],
+        "score": score,
+        "max_marks": question_data["marks"],
+        "feedback": feedback,
+        "strengths": ["Matches the model answer"] if score else [],
+        "improvements": improvements,
+        "key_points_covered": covered,
+        "key_points_missed": missed,
+        "success": True,
+        "pre_graded": True
+    }
+
+
+def pre_grade(question_data: dict, student_answer: str) -> Optional[Dict[str, Any]]:
+    """
+    Grade clear-cut answers locally, or return None when the LLM should decide
+
+    Zero marks: blank, a non-answer ("I don't know"), or, when no key point is
+    covered, too short, a copy of the question, or no vocabulary in common
+    with the question and rubric.
+    Full marks: the sample answer verbatim (ignoring case and whitespace).
+    """
+    key_points = question_data["key_points"]
+    normalized = normalize_text(student_answer)
+
+    if normalized and normalized == normalize_text(question_data["sample_answer"]):
+        return _result(question_data, question_data["marks"],
+                       "Your answer matches the model answer.", list(key_points), [], [])
+
+    if not normalized or normalized.strip(" .!") in NON_ANSWERS:
+        return _result(question_data, 0, "No answer was provided.", [], list(key_points),
+                       ["Attempt the question, even partially, to earn marks."])
+
+    answer_tokens = set(tokenize(student_answer))
+    # A terse answer that still names a key point is left to the LLM
+    covered, missed = key_point_coverage(answer_tokens, key_points)
+    if covered:
+        return None
+
+    if len(answer_tokens) < MIN_ANSWER_TOKENS:
+        return _result(question_data, 0, "The answer is too short to address the question.", [],
+                       missed, ["Explain your answer in full sentences covering the key points."])
+
+    question_tokens = set(tokenize(question_data["question"]))
+    if len(answer_tokens & question_tokens) / len(answer_tokens) >= QUESTION_COPY_OVERLAP:
+        return _result(question_data, 0, "The answer restates the question without answering it.", [],
+                       missed, ["Answer the question instead of repeating it."])
+
+    rubric_tokens = question_tokens | set(tokenize(question_data["sample_answer"]))
+    for point in key_points:
+        rubric_tokens |= set(tokenize(point))
+    if len(answer_tokens & rubric_tokens) / len(answer_tokens) < OFF_TOPIC_OVERLAP:
+        return _result(question_data, 0, "The answer does not address the topic of the question.", [],
+                       missed, ["Focus your answer on the concepts the question asks about."])
+
+    return None
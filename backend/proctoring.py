@@ -8,19 +8,68 @@ from datetime import datetime
 from ultralytics import YOLO
 from PIL import Image
 import pyaudio
-import queue
+
+from storage import open_local_store, open_store
+
+# Concurrent proctoring sessions per process
+PROCTORING_MAX_SESSIONS = int(os.getenv("PROCTORING_MAX_SESSIONS", "32"))
+# Cameras on this host, comma-separated device indexes or stream URLs. A session
+# started without a source gets the first one not in use; requests may name a
+# device index or one of these, nothing else.
+PROCTORING_CAMERA_SOURCES = [
+    source.strip()
+    for source in os.getenv("PROCTORING_CAMERA_SOURCES", os.getenv("PROCTORING_CAMERA_SOURCE", "0")).split(",")
+    if source.strip()
+]
+
+
+class ProctoringCapacityError(Exception):
+    """Raised when a process is already running its maximum number of sessions"""
+    pass
+
+
+class ProctoringSourceError(Exception):
+    """Raised for a camera source that is not allowed"""
+    pass
+
+
+class ProctoringSourceInUseError(Exception):
+    """Raised when a session's camera is already used by another session"""
+    pass
+
+
+def recording_record(path):
+    """Index entry for a saved recording, ordered by when it was written"""
+    info = os.stat(path)
+    return {
+        "filename": os.path.basename(path),
+        "path": path,
+        "size_bytes": info.st_size,
+        "created_at": datetime.fromtimestamp(info.st_mtime).isoformat()
+    }
+
+
+def camera_source(source):
+    """
+    The camera to open for a source: device indexes come in as strings from env
+    and requests (OpenCV wants ints); anything else must be configured
+    """
+    source = str(source).strip()
+    if source.isdigit():
+        return int(source)
+    if source in PROCTORING_CAMERA_SOURCES:
+        return source
+    raise ProctoringSourceError(f"Camera source is not allowed: {source} (see PROCTORING_CAMERA_SOURCES)")
+
 
 class ProctoringSystem:
-    def __init__(self):
-        # Face tracking setup
-        self.mp_face_mesh = mp.solutions.face_mesh
-        self.RIGHT_IRIS = [474, 475, 476, 477]
-        self.LEFT_IRIS = [469, 470, 471, 472]
-        self.L_H_LEFT = [33]
-        self.L_H_RIGHT = [133]
-        self.R_H_LEFT = [362]
-        self.R_H_RIGHT = [263]
-        
+    """
+    Loads the detection models once and runs one ProctoringSession per student
+
+    Sessions share the models (inference is serialized, the models are not
+    thread-safe) and the per-user sample log; everything else is per session.
+    """
+    def __init__(self, max_sessions=PROCTORING_MAX_SESSIONS):
         # YOLO Model Setup (with error handling)
         try:
             self.yolo_model = YOLO('models/yolov8m.pt')
@@ -38,54 +87,55 @@ class ProctoringSystem:
         except Exception as e:
             print(f"Warning: Anti-spoofing model not loaded: {e}")
             self.anti_spoofing_enabled = False
+        self.model_lock = threading.Lock()
         
-        # Proctoring state variables
-        self.eye_cheating = False
-        self.head_cheating = False
-        self.video_feed_active = False
-        self.video_cap = None
-        self.sound_detected = False
-        self.audio_detection_active = False
-        self.stream = None
-        self.audio_thread = None
-        self.multiple_persons_detected = False
-        self.book_detected = False
-        self.phone_detected = False
-        
-        # Recording variables
+        # Defaults for new sessions
         self.RECORDING_DIR = "cheating_recordings"
-        self.is_recording = False
-        self.out = None
         self.MINIMUM_CHEATING_DURATION = 0.7
-        self.current_cheating_start = None
-        self.current_cheating_flags = set()
-        
-        # Timing
         self.total_time = 3600  # Default 1 hour
-        self.start_time = None
         
-        # User data
-        self.user_cheating_data = {}
-        self.current_username = None
+        # Active sessions by username
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
         
-        # Frame queue for video streaming
-        self.frame_queue = queue.Queue(maxsize=2)
+        # User data: per-frame samples, evicted (and archived) once a user has been idle too long
+        self.user_cheating_data = open_local_store(
+            "proctoring_samples", on_evict=lambda username, _: self.user_stats.pop(username, None)
+        )
+        # Running per-user counts, updated with each logged sample
+        self.user_stats = {}
         
         # Create recordings directory
         if not os.path.exists(self.RECORDING_DIR):
             os.makedirs(self.RECORDING_DIR)
+        # Saved recordings by filename, listed a page at a time without scanning the directory
+        self.recordings = open_store("proctoring_recordings", order_by="created_at")
+        self.index_existing_recordings()
+    
+    def index_recording(self, path):
+        self.recordings[os.path.basename(path)] = recording_record(path)
+    
+    def index_existing_recordings(self):
+        """Index recordings already on disk (saved before the index, or by another process)"""
+        with os.scandir(self.RECORDING_DIR) as listing:
+            paths = {entry.name: entry.path for entry in listing if entry.name.endswith('.mp4')}
+        known = self.recordings.get_many(paths)
+        added = self.recordings.add_many({
+            name: recording_record(path) for name, path in paths.items() if name not in known
+        })
+        if added:
+            print(f"---INDEXED {added} EXISTING RECORDINGS---")
     
     def detect_objects(self, frame):
-        """Detect objects using YOLO model"""
+        """Count people and look for books and phones; returns (person_count, book, phone)"""
+        person_count, book_detected, phone_detected = 0, False, False
         if not self.yolo_enabled:
-            return
+            return person_count, book_detected, phone_detected
         
         try:
-            results = self.yolo_model(frame, verbose=False)
-            
-            person_count = 0
-            self.book_detected = False
-            self.phone_detected = False
+            with self.model_lock:
+                results = self.yolo_model(frame, verbose=False)
             
             for result in results:
                 boxes = result.boxes
@@ -96,13 +146,157 @@ class ProctoringSystem:
                     if class_name == 'person':
                         person_count += 1
                     elif class_name == 'book':
-                        self.book_detected = True
+                        book_detected = True
                     elif class_name == 'cell phone':
-                        self.phone_detected = True
-            
-            self.multiple_persons_detected = person_count > 1
+                        phone_detected = True
         except Exception as e:
             print(f"Object detection error: {e}")
+        return person_count, book_detected, phone_detected
+    
+    def predict_anti_spoofing(self, image):
+        """Predict if the image is real or spoofed"""
+        if not self.anti_spoofing_enabled:
+            return "real", 1.0
+        
+        try:
+            with self.model_lock:
+                results = self.anti_spoofing_model(image, verbose=False)
+            for result in results:
+                probs = result.probs
+                if probs is not None:
+                    confidence = probs.top1conf.item()
+                    label = self.anti_spoofing_model.names[probs.top1]
+                    return label, confidence
+        except Exception as e:
+            print(f"Anti-spoofing error: {e}")
+        
+        return "real", 1.0
+    
+    def start_session(self, username, total_time=None, source=None, audio_device=None):
+        """
+        Start proctoring a student; returns their session (the running one if already started)
+        
+        Without a source the student gets the first configured camera no other
+        session is using. Starts the audio thread, so call it off the event loop.
+        """
+        with self.sessions_lock:
+            session = self.sessions.get(username)
+            if session is not None:
+                return session
+            if len(self.sessions) >= self.max_sessions:
+                raise ProctoringCapacityError(
+                    f"Already proctoring {len(self.sessions)} students (PROCTORING_MAX_SESSIONS={self.max_sessions})"
+                )
+            in_use = {s.camera_source for s in self.sessions.values()}
+            if source is None:
+                free = [c for c in map(camera_source, PROCTORING_CAMERA_SOURCES) if c not in in_use]
+                if not free:
+                    raise ProctoringSourceInUseError(
+                        f"All {len(PROCTORING_CAMERA_SOURCES)} cameras are in use (PROCTORING_CAMERA_SOURCES)"
+                    )
+                source = free[0]
+            else:
+                source = camera_source(source)
+                if source in in_use:
+                    raise ProctoringSourceInUseError(f"Camera {source} is already used by another session")
+            session = ProctoringSession(self, username, total_time or self.total_time, source, audio_device)
+            self.sessions[username] = session
+        session.start_proctoring()
+        return session
+    
+    def get_session(self, username):
+        """The student's active session, or None"""
+        return self.sessions.get(username)
+    
+    def stop_session(self, username):
+        """Stop a student's session; returns it, or None if they were not being proctored"""
+        session = self.sessions.get(username)
+        if session is not None:
+            session.stop_proctoring()
+        return session
+    
+    def active_sessions(self):
+        with self.sessions_lock:
+            return list(self.sessions.values())
+    
+    def stop_all(self):
+        for session in self.active_sessions():
+            session.stop_proctoring()
+    
+    def _forget(self, session):
+        with self.sessions_lock:
+            if self.sessions.get(session.username) is session:
+                del self.sessions[session.username]
+    
+    def record_sample(self, username, elapsed_time, is_cheating):
+        """Log one cheating sample and update the user's running counts"""
+        # Written back through the store, so this keeps working if samples move out of memory
+        self.user_cheating_data.add(username, [])
+        self.user_cheating_data.update(username, lambda samples: samples.append((elapsed_time, is_cheating)))
+        stats = self.user_stats.setdefault(username, {"entries": 0, "cheating": 0, "duration": 0.0})
+        stats["entries"] += 1
+        stats["cheating"] += 1 if is_cheating else 0
+        stats["duration"] = elapsed_time
+    
+    def get_user_summary(self, username):
+        """Entry, cheating and duration totals for a user without scanning their samples"""
+        return dict(self.user_stats.get(username, {"entries": 0, "cheating": 0, "duration": 0.0}))
+    
+    def get_user_data(self, username):
+        """Get cheating data for a specific user"""
+        return self.user_cheating_data.get(username, [])
+
+
+class ProctoringSession:
+    """One student's proctoring: camera, audio, detection flags and recordings"""
+    # Face tracking setup
+    mp_face_mesh = mp.solutions.face_mesh
+    RIGHT_IRIS = [474, 475, 476, 477]
+    LEFT_IRIS = [469, 470, 471, 472]
+    L_H_LEFT = [33]
+    L_H_RIGHT = [133]
+    R_H_LEFT = [362]
+    R_H_RIGHT = [263]
+    
+    def __init__(self, system, username, total_time, source, audio_device=None):
+        self.system = system
+        self.username = username
+        self.camera_source = source
+        # Sound is only checked for cameras attached to this host: audio in remote
+        # streams is not decoded, and the host microphone would hear the server room,
+        # not the candidate. audio_device picks the input next to a local camera.
+        self.audio_device = audio_device
+        self.audio_enabled = isinstance(source, int)
+        
+        # Proctoring state variables
+        self.eye_cheating = False
+        self.head_cheating = False
+        self.video_feed_active = False
+        self.video_cap = None
+        self.sound_detected = False
+        self.audio_detection_active = False
+        self.stream = None
+        self.audio_thread = None
+        self.multiple_persons_detected = False
+        self.book_detected = False
+        self.phone_detected = False
+        
+        # Recording variables
+        self.RECORDING_DIR = system.RECORDING_DIR
+        self.is_recording = False
+        self.out = None
+        self.MINIMUM_CHEATING_DURATION = system.MINIMUM_CHEATING_DURATION
+        self.current_cheating_start = None
+        self.current_cheating_flags = set()
+        
+        # Timing
+        self.total_time = total_time
+        self.start_time = None
+    
+    def detect_objects(self, frame):
+        """Detect objects using the shared YOLO model"""
+        person_count, self.book_detected, self.phone_detected = self.system.detect_objects(frame)
+        self.multiple_persons_detected = person_count > 1
     
     def euclidean_distance(self, point1, point2):
         """Calculate Euclidean distance between two points"""
@@ -141,6 +335,7 @@ class ProctoringSystem:
                 channels=CHANNELS,
                 rate=RATE,
                 input=True,
+                input_device_index=self.audio_device,
                 frames_per_buffer=CHUNK,
                 stream_callback=None
             )
@@ -170,7 +365,7 @@ class ProctoringSystem:
     
     def start_audio_detection(self):
         """Start audio detection in a separate thread"""
-        if self.audio_detection_active:
+        if self.audio_detection_active or not self.audio_enabled:
             return
         
         self.audio_detection_active = True
@@ -189,24 +384,6 @@ class ProctoringSystem:
             except:
                 pass
     
-    def predict_anti_spoofing(self, image):
-        """Predict if the image is real or spoofed"""
-        if not self.anti_spoofing_enabled:
-            return "real", 1.0
-        
-        try:
-            results = self.anti_spoofing_model(image, verbose=False)
-            for result in results:
-                probs = result.probs
-                if probs is not None:
-                    confidence = probs.top1conf.item()
-                    label = self.anti_spoofing_model.names[probs.top1]
-                    return label, confidence
-        except Exception as e:
-            print(f"Anti-spoofing error: {e}")
-        
-        return "real", 1.0
-    
     def start_recording(self, frame):
         """Start recording cheating behavior"""
         if not self.is_recording:
@@ -242,7 +419,7 @@ class ProctoringSystem:
                     flags_str = "_".join(sorted(self.current_cheating_flags)) if self.current_cheating_flags else "general"
                     filename = os.path.join(
                         self.RECORDING_DIR,
-                        f"cheating_{self.current_username}_{timestamp}_{duration_str}_{flags_str}.mp4"
+                        f"cheating_{self.username}_{timestamp}_{duration_str}_{flags_str}.mp4"
                     )
 
                     try:
@@ -255,6 +432,7 @@ class ProctoringSystem:
                             for frame in self.out['frames']:
                                 video_writer.write(frame)
                             video_writer.release()
+                            self.system.index_recording(filename)
                             print(f"[Recording] Saved cheating clip: {filename}")
                     except Exception as e:
                         print(f"[Recording ERROR] Saving recording failed: {e}")
@@ -271,13 +449,13 @@ class ProctoringSystem:
             print("[Recording] Recording stopped")
 
     
-    def generate_video_feed(self, username):
+    def generate_video_feed(self):
         """Generate video feed with proctoring analysis"""
+        username = self.username
         if self.video_cap is not None:
             self.video_cap.release()
         
-        self.video_cap = cv.VideoCapture(0)
-        self.current_username = username
+        self.video_cap = cv.VideoCapture(self.camera_source)
         
         # Set camera properties for better performance
         self.video_cap.set(cv.CAP_PROP_FRAME_WIDTH, 640)
@@ -288,10 +466,6 @@ class ProctoringSystem:
             print("Error: Could not open camera")
             return
         
-        # Initialize user data
-        if username not in self.user_cheating_data:
-            self.user_cheating_data[username] = []
-        
         cheating_buffer = []
         buffer_duration = 10  # Reduced buffer for more responsive detection
         frame_count = 0
@@ -326,9 +500,9 @@ class ProctoringSystem:
                 # Anti-spoofing check
                 anti_spoofing_label = "real"
                 confidence = 1.0
-                if self.anti_spoofing_enabled and frame_count % 30 == 0:
+                if self.system.anti_spoofing_enabled and frame_count % 30 == 0:
                     pil_image = Image.fromarray(frame_rgb)
-                    anti_spoofing_label, confidence = self.predict_anti_spoofing(pil_image)
+                    anti_spoofing_label, confidence = self.system.predict_anti_spoofing(pil_image)
                 
                 color = (0, 255, 0) if anti_spoofing_label == "real" else (0, 0, 255)
                 cv.putText(frame, f"Verification: {anti_spoofing_label} ({confidence:.2f})",
@@ -465,7 +639,7 @@ class ProctoringSystem:
                 if len(cheating_buffer) > 0:
                     cheating_count = sum(1 for _, cheating in cheating_buffer if cheating)
                     majority_cheating = cheating_count > len(cheating_buffer) / 2
-                    self.user_cheating_data[username].append((elapsed_time, majority_cheating))
+                    self.system.record_sample(username, elapsed_time, majority_cheating)
                 
                 # Display status
                 status_color = (0, 0, 255) if is_cheating else (0, 255, 0)
@@ -518,17 +692,16 @@ class ProctoringSystem:
             self.video_cap.release()
             self.video_cap = None
     
-    def start_proctoring(self, username):
-        """Start the proctoring system"""
-        print(f"Starting proctoring for {username}")
+    def start_proctoring(self):
+        """Start proctoring this student"""
+        print(f"Starting proctoring for {self.username}")
         self.video_feed_active = True
         self.start_time = time.time()
-        self.current_username = username
         self.start_audio_detection()
     
     def stop_proctoring(self):
-        """Stop the proctoring system"""
-        print("Stopping proctoring...")
+        """Stop proctoring and free the student's slot"""
+        print(f"Stopping proctoring for {self.username}...")
         self.video_feed_active = False
         self.stop_audio_detection()
         
@@ -539,7 +712,7 @@ class ProctoringSystem:
         if self.video_cap is not None:
             self.video_cap.release()
             self.video_cap = None
-
+        self.system._forget(self)
     
     def get_feed_status(self):
         """Get current feed status and time remaining"""
@@ -559,7 +732,3 @@ class ProctoringSystem:
             "active": self.video_feed_active,
             "time_remaining": self.total_time
         }
-    
-    def get_user_data(self, username):
-        """Get cheating data for a specific user"""
-        return self.user_cheating_data.get(username, [])
\ No newline at end of file
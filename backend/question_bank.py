@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from topic_catalog import normalize_topic
+
+# Bank location and sizing (override with environment variables)
+BANK_PATH = os.getenv(
+    "QUESTION_BANK_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "question_bank.db")
+)
+LOW_WATERMARK = int(os.getenv("QUESTION_BANK_LOW_WATERMARK", "15"))
+REFILL_BATCH = int(os.getenv("QUESTION_BANK_REFILL_BATCH", "10"))
+MAX_BANK_SIZE = int(os.getenv("QUESTION_BANK_MAX_SIZE", "200"))
+HISTORY_SIZE = int(os.getenv("QUESTION_BANK_HISTORY_SIZE", "200"))
+
+BankKey = Tuple[str, str, str]
+
+
+def bank_key(subject: Optional[str], topic: str, difficulty: Optional[str] = None) -> BankKey:
+    """Bank partition for a (subject, topic, difficulty) request"""
+    return (subject or "", normalize_topic(topic) or topic.strip().lower(), difficulty or "mixed")
+
+
+def question_id(key: BankKey, question: Dict[str, Any]) -> str:
+    """Stable ID so the same question text is stored once per bank partition"""
+    text = " ".join(question["question"].lower().split())
+    return hashlib.sha1("|".join([*key, text]).encode("utf-8")).hexdigest()
+
+
+class QuestionBank:
+    """
+    Persistent pool of pre-generated quiz questions per (subject, topic, difficulty).
+
+    Backed by SQLite so the bank survives restarts. Each student's recently served
+    question IDs are kept so sampling does not repeat questions within that window.
+    """
+
+    def __init__(self, path: str = BANK_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS questions (
+                id TEXT PRIMARY KEY,
+                subject TEXT NOT NULL,
+                topic_key TEXT NOT NULL,
+                difficulty TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_questions_key ON questions (subject, topic_key, difficulty);
+            CREATE TABLE IF NOT EXISTS student_history (
+                student_id TEXT NOT NULL,
+                question_id TEXT NOT NULL,
+                served_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_history_student ON student_history (student_id, served_at);
+        """)
+        self._conn.commit()
+
+    def count(self, key: BankKey) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM questions WHERE subject = ? AND topic_key = ? AND difficulty = ?",
+                key
+            ).fetchone()
+        return row[0]
+
+    def question_texts(self, subject: Optional[str]) -> List[str]:
+        """Question text of every banked question for a subject"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM questions WHERE subject = ?", (subject or "",)
+            ).fetchall()
+        return [json.loads(row[0])["question"] for row in rows]
+
+    def add(self, key: BankKey, questions: List[Dict[str, Any]]) -> int:
+        """Add generated questions to a partition, ignoring ones already banked. Returns number added."""
+        now = time.time()
+        rows = []
+        for q in questions:
+            qid = q.get("question_id") or question_id(key, q)
+            rows.append((qid, *key, json.dumps({**q, "question_id": qid}), now))
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO questions (id, subject, topic_key, difficulty, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            added = self._conn.total_changes - before
+            # Keep partitions bounded: drop the oldest questions beyond the cap
+            self._conn.execute(
+                "DELETE FROM questions WHERE id IN ("
+                " SELECT id FROM questions WHERE subject = ? AND topic_key = ? AND difficulty = ?"
+                " ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (*key, MAX_BANK_SIZE)
+            )
+            self._conn.commit()
+        return added
+
+    def sample(self, key: BankKey, n: int, student_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Randomly sample up to n questions the student has not seen recently"""
+        with self._lock:
+            if student_id:
+                rows = self._conn.execute(
+                    "SELECT payload FROM questions"
+                    " WHERE subject = ? AND topic_key = ? AND difficulty = ?"
+                    " AND id NOT IN (SELECT question_id FROM student_history WHERE student_id = ?)"
+                    " ORDER BY RANDOM() LIMIT ?",
+                    (*key, student_id, n)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT payload FROM questions"
+                    " WHERE subject = ? AND topic_key = ? AND difficulty = ?"
+                    " ORDER BY RANDOM() LIMIT ?",
+                    (*key, n)
+                ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def record_served(self, student_id: str, question_ids: List[str]):
+        """Remember questions served to a student, keeping only the most recent HISTORY_SIZE"""
+        if not student_id or not question_ids:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO student_history (student_id, question_id, served_at) VALUES (?, ?, ?)",
+                [(student_id, qid, now) for qid in question_ids]
+            )
+            self._conn.execute(
+                "DELETE FROM student_history WHERE student_id = ? AND rowid NOT IN ("
+                " SELECT rowid FROM student_history WHERE student_id = ?"
+                " ORDER BY served_at DESC LIMIT ?)",
+                (student_id, student_id, HISTORY_SIZE)
+            )
+            self._conn.commit()
+
+
+class BankRefiller:
+    """
+    Background worker that tops up bank partitions.
+
+    Refill requests are de-duplicated while pending, so a burst of quizzes on the
+    same topic triggers a single generation call.
+    """
+
+    def __init__(self, bank: QuestionBank, generate_fn: Callable[[BankKey, int], List[Dict[str, Any]]]):
+        self.bank = bank
+        self.generate_fn = generate_fn
+        self._queue: "queue.Queue[BankKey]" = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def schedule(self, key: BankKey):
+        """Queue a refill for a partition unless one is already pending"""
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            self._ensure_started()
+        self._queue.put(key)
+
+    def schedule_if_low(self, key: BankKey):
+        if self.bank.count(key) < LOW_WATERMARK:
+            self.schedule(key)
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            try:
+                print(f"---REFILLING QUESTION BANK: {key}---")
+                questions = self.generate_fn(key, REFILL_BATCH)
+                added = self.bank.add(key, questions)
+                print(f"---BANKED {added} NEW QUESTIONS FOR {key}---")
+            except Exception as e:
+                print(f"---QUESTION BANK REFILL ERROR ({key}): {e}---")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+                self._queue.task_done()
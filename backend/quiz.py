@@ -3,14 +3,18 @@ from langgraph.graph import END, StateGraph
 from typing import Any, Dict, List, TypedDict, Optional
 import os
 import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Langchain imports
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_pinecone import PineconeVectorStore
+from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableSequence
 from pydantic import BaseModel, Field
-from pinecone import Pinecone
+
+from question_bank import QuestionBank, BankRefiller, BankKey, bank_key, question_id
+from topic_context import topic_context, fit_to_budget
+from concurrency import llm_gate
+from near_duplicates import NearDuplicateDetector, MAX_REGEN_ROUNDS, generate_unique, default_embed_fn, format_exclusions
 
 load_dotenv()
 
@@ -28,23 +32,11 @@ class QuizState(TypedDict):
     quiz_config: Optional[dict]
     generation: str
 
-# Initialize components
-embedding = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index(os.environ["INDEX_NAME"])
-
-# Retriever function
-def get_retriever(subject=None):
-    vectorstore = PineconeVectorStore(index=index, embedding=embedding)
-    
-    if subject:
-        retriever = vectorstore.as_retriever(
-            search_kwargs={"filter": {"subject": subject}}
-        )
-    else:
-        retriever = vectorstore.as_retriever()
-    
-    return retriever
+# Token budget for this generator's share of the shared topic context
+CONTEXT_TOKEN_BUDGET = int(os.getenv("QUIZ_CONTEXT_TOKENS", "3000"))
+# A short result is topped up by asking only for the missing questions
+MAX_TOPUP_ATTEMPTS = int(os.getenv("QUIZ_MAX_TOPUP_ATTEMPTS", "2"))
+TOPUP_CONTEXT_TOKENS = int(os.getenv("QUIZ_TOPUP_CONTEXT_TOKENS", "1000"))
 
 # Quiz models
 class QuizQuestion(BaseModel):
@@ -99,6 +91,10 @@ Documents:
 {documents}
 
 Number of questions to generate: {num_questions}
+Difficulty: {difficulty}
+
+Questions already written (do NOT repeat or rephrase these):
+{exclusions}
 
 Please generate quiz questions based on this content.""")
 ])
@@ -111,17 +107,10 @@ def retrieve(state: QuizState) -> Dict[str, Any]:
     topic = state["question"]  # Using question as topic
     subject = state.get("subject")
     
-    # Create a search query from the topic
-    search_query = f"{topic} concepts definitions examples"
+    # Shared (subject, topic) context, trimmed to this generator's token budget
     if subject:
-        search_query = f"{subject} {search_query}"
         print(f"---FILTERING BY SUBJECT: {subject}---")
-        retriever = get_retriever(subject=subject)
-    else:
-        print("---NO SUBJECT FILTER---")
-        retriever = get_retriever()
-    
-    documents = retriever.invoke(search_query)
+    documents = fit_to_budget(topic_context.get(topic, subject), CONTEXT_TOKEN_BUDGET)
     print(f"---RETRIEVED {len(documents)} DOCUMENTS FOR QUIZ GENERATION---")
     
     return {
@@ -140,6 +129,8 @@ def generate_quiz(state: QuizState) -> Dict[str, Any]:
     
     # Default quiz configuration
     num_questions = quiz_config.get("num_questions", 5)
+    difficulty = quiz_config.get("difficulty")
+    exclude = quiz_config.get("exclude", [])
     
     if not documents:
         print("---NO DOCUMENTS AVAILABLE FOR QUIZ GENERATION---")
@@ -153,26 +144,43 @@ def generate_quiz(state: QuizState) -> Dict[str, Any]:
     try:
         # Combine document content
         doc_content = "\n\n".join([doc.page_content for doc in documents])
+        topup_content = "\n\n".join([doc.page_content for doc in fit_to_budget(documents, TOPUP_CONTEXT_TOKENS)])
         
-        # Generate quiz questions
-        quiz_result = quiz_generator_chain.invoke({
-            "documents": doc_content,
-            "topic": topic,
-            "num_questions": num_questions
-        })
-        
-        print(f"---GENERATED {len(quiz_result.questions)} QUIZ QUESTIONS---")
-        
-        # Convert to serializable format
+        # Generate quiz questions, then top up a short result with only the missing ones
         quiz_data = []
-        for q in quiz_result.questions:
-            quiz_data.append({
-                "question": q.question,
-                "options": q.options,
-                "correct_answer": q.correct_answer,
-                "explanation": q.explanation,
-                "difficulty": q.difficulty
-            })
+        for attempt in range(MAX_TOPUP_ATTEMPTS + 1):
+            missing = num_questions - len(quiz_data)
+            if missing <= 0:
+                break
+            try:
+                quiz_result = llm_gate.invoke(quiz_generator_chain, {
+                    "documents": topup_content if attempt else doc_content,
+                    "topic": topic,
+                    "num_questions": missing,
+                    "difficulty": difficulty or "mixed (easy, medium and hard)",
+                    "exclusions": format_exclusions(exclude + [q["question"] for q in quiz_data])
+                })
+            except Exception as e:
+                # A failed top-up keeps the questions already generated
+                if not quiz_data:
+                    raise
+                print(f"---QUIZ TOP-UP ERROR: {e}---")
+                break
+            
+            seen = {q["question"].strip().lower() for q in quiz_data}
+            # Convert to serializable format
+            for q in quiz_result.questions[:missing]:
+                if q.question.strip().lower() in seen:
+                    continue
+                quiz_data.append({
+                    "question": q.question,
+                    "options": q.options,
+                    "correct_answer": q.correct_answer,
+                    "explanation": q.explanation,
+                    "difficulty": difficulty or q.difficulty
+                })
+            label = "TOPPED UP TO" if attempt else "GENERATED"
+            print(f"---{label} {len(quiz_data)}/{num_questions} QUIZ QUESTIONS---")
         
         # Generate summary message
         generation = f"Generated {len(quiz_data)} quiz questions on {topic}. Ready to start quiz!"
@@ -195,6 +203,10 @@ def generate_quiz(state: QuizState) -> Dict[str, Any]:
             "subject": subject
         }
 
+# Streaming generation splits the quiz into small concurrent batches
+STREAM_BATCH_SIZE = int(os.getenv("QUIZ_STREAM_BATCH_SIZE", "2"))
+stream_executor = ThreadPoolExecutor(max_workers=int(os.getenv("QUIZ_STREAM_WORKERS", "4")))
+
 # Build graph
 workflow = StateGraph(QuizState)
 
@@ -214,30 +226,95 @@ app2 = workflow.compile()
 class QuizSystem:
     def __init__(self):
         self.app = app2
-        self.current_quiz = None
         self.quiz_score = 0
         self.quiz_total = 0
+        self.bank = QuestionBank()
+        self.refiller = BankRefiller(self.bank, self._generate_for_bank)
+        # Near-duplicate index per subject, seeded from the bank
+        self.duplicates = NearDuplicateDetector(embed_fn=default_embed_fn(), loader=self.bank.question_texts)
+    
+    def _invoke_graph(self, topic: str, subject: str = None, num_questions: int = 5, difficulty: str = None):
+        return self.app.invoke({
+            "question": topic,  # Using question field as topic
+            "subject": subject,
+            "documents": [],
+            "quiz_data": [],
+            "quiz_config": {"num_questions": num_questions, "difficulty": difficulty},
+            "generation": ""
+        })
     
-    def generate_quiz(self, topic: str, subject: str = None, num_questions: int = 5):
-        """Generate a quiz on a specific topic"""
+    def _generate_unique(self, topic: str, subject: str = None, num_questions: int = 5, difficulty: str = None):
+        """
+        Run the graph, then regenerate only the slots lost to near-duplicates
+        
+        Returns (unique questions, last graph response). Retrieved documents are
+        reused for regeneration rounds.
+        """
+        session = self.duplicates.session(subject)
+        state = {}
+        
+        def generate(n: int) -> List[dict]:
+            if not state:
+                state.update(self._invoke_graph(topic, subject, n, difficulty))
+            else:
+                state.update(generate_quiz({
+                    **state,
+                    "quiz_config": {"num_questions": n, "difficulty": difficulty, "exclude": session.texts}
+                }))
+            return state.get("quiz_data", [])
+        
+        quiz_data = generate_unique(generate, num_questions, session, lambda q: q["question"])
+        session.commit()
+        return quiz_data, state
+    
+    def _generate_for_bank(self, key: BankKey, num_questions: int) -> List[dict]:
+        """Refill callback: generate a batch of questions for a bank partition"""
+        subject, topic, difficulty = key
+        quiz_data, _ = self._generate_unique(
+            topic,
+            subject or None,
+            num_questions,
+            None if difficulty == "mixed" else difficulty
+        )
+        return quiz_data
+    
+    def generate_quiz(self, topic: str, subject: str = None, num_questions: int = 5,
+                      difficulty: str = None, student_id: str = None):
+        """
+        Generate a quiz on a specific topic
+        
+        Serves from the question bank when it holds enough questions the student
+        has not seen recently, otherwise generates synchronously and banks the
+        result. Either way the bank is topped up in the background when low.
+        """
         try:
-            response = self.app.invoke({
-                "question": topic,  # Using question field as topic
-                "subject": subject,
-                "documents": [],
-                "quiz_data": [],
-                "quiz_config": {"num_questions": num_questions},
-                "generation": ""
-            })
+            key = bank_key(subject, topic, difficulty)
             
-            quiz_data = response.get("quiz_data", [])
+            banked = self.bank.sample(key, num_questions, student_id)
+            if len(banked) == num_questions:
+                print(f"---SERVING {num_questions} QUESTIONS FROM BANK: {key}---")
+                self.bank.record_served(student_id, [q["question_id"] for q in banked])
+                self.refiller.schedule_if_low(key)
+                return {
+                    "success": True,
+                    "quiz_data": banked,
+                    "message": f"Generated {len(banked)} questions on {topic}",
+                    "subject": subject,
+                    "source": "bank"
+                }
+            
+            quiz_data, response = self._generate_unique(topic, subject, num_questions, difficulty)
             if quiz_data:
-                self.current_quiz = quiz_data
+                quiz_data = [{**q, "question_id": question_id(key, q)} for q in quiz_data]
+                self.bank.add(key, quiz_data)
+                self.bank.record_served(student_id, [q["question_id"] for q in quiz_data])
+                self.refiller.schedule_if_low(key)
                 return {
                     "success": True,
                     "quiz_data": quiz_data,
                     "message": f"Generated {len(quiz_data)} questions on {topic}",
-                    "subject": response.get("subject")
+                    "subject": response.get("subject"),
+                    "source": "generated"
                 }
             else:
                 return {
@@ -248,19 +325,89 @@ class QuizSystem:
         except Exception as e:
             return {"success": False, "message": f"Error generating quiz: {e}"}
     
-    def take_quiz(self):
-        """Take the current quiz interactively"""
-        if not self.current_quiz:
+    def generate_quiz_stream(self, topic: str, subject: str = None, num_questions: int = 5,
+                             difficulty: str = None, student_id: str = None):
+        """
+        Yield quiz questions one at a time as they become available
+        
+        Unseen banked questions are yielded immediately; the remainder is generated
+        in small concurrent batches over disjoint document slices and banked.
+        Raises ValueError when nothing can be served or retrieved.
+        """
+        key = bank_key(subject, topic, difficulty)
+        session = self.duplicates.session(subject)
+        served = []
+        
+        for q in self.bank.sample(key, num_questions, student_id):
+            served.append(q["question_id"])
+            yield q
+        
+        remaining = num_questions - len(served)
+        if remaining > 0:
+            documents = retrieve({"question": topic, "subject": subject})["documents"]
+            if not documents:
+                if not served:
+                    raise ValueError("No documents available to generate quiz questions.")
+            else:
+                # Near-duplicates are dropped; their slots are regenerated in a further round
+                for attempt in range(MAX_REGEN_ROUNDS + 1):
+                    remaining = num_questions - len(served)
+                    if remaining <= 0:
+                        break
+                    if attempt:
+                        print(f"---REGENERATING {remaining} NEAR-DUPLICATE QUIZ SLOTS---")
+                    batches = [min(STREAM_BATCH_SIZE, remaining - i) for i in range(0, remaining, STREAM_BATCH_SIZE)]
+                    if len(documents) < len(batches):
+                        doc_slices = [documents] * len(batches)
+                    else:
+                        doc_slices = [documents[i::len(batches)] for i in range(len(batches))]
+                    
+                    futures = [
+                        stream_executor.submit(generate_quiz, {
+                            "question": topic,
+                            "subject": subject,
+                            "documents": docs,
+                            "quiz_data": [],
+                            "quiz_config": {"num_questions": size, "difficulty": difficulty, "exclude": session.texts},
+                            "generation": ""
+                        })
+                        for size, docs in zip(batches, doc_slices)
+                    ]
+                    dropped = 0
+                    for future in as_completed(futures):
+                        generated = future.result().get("quiz_data", [])
+                        batch = [
+                            {**q, "question_id": question_id(key, q)}
+                            for q in generated
+                            if session.accept(q["question"])
+                        ]
+                        dropped += len(generated) - len(batch)
+                        self.bank.add(key, batch)
+                        for q in batch:
+                            if q["question_id"] in served or len(served) >= num_questions:
+                                continue
+                            served.append(q["question_id"])
+                            yield q
+                    if not dropped:
+                        break
+        
+        session.commit()
+        self.bank.record_served(student_id, served)
+        self.refiller.schedule_if_low(key)
+    
+    def take_quiz(self, quiz: List[dict]):
+        """Take a generated quiz interactively"""
+        if not quiz:
             print("No quiz available. Generate one first.")
             return
         
-        print(f"\nStarting Quiz - {len(self.current_quiz)} Questions")
+        print(f"\nStarting Quiz - {len(quiz)} Questions")
         print("=" * 50)
         
         self.quiz_score = 0
-        self.quiz_total = len(self.current_quiz)
+        self.quiz_total = len(quiz)
         
-        for i, question_data in enumerate(self.current_quiz, 1):
+        for i, question_data in enumerate(quiz, 1):
             print(f"\nQuestion {i}/{self.quiz_total}")
             print(f"Difficulty: {question_data.get('difficulty', 'Unknown')}")
             print("-" * 40)
@@ -322,6 +469,7 @@ class QuizSystem:
         print("Quiz Generation System")
         print("Available subjects:", ", ".join(AVAILABLE_SUBJECTS))
         print("Commands: 'generate', 'take', 'quit'")
+        quiz = None
         
         while True:
             command = input("\nQuiz command: ").strip().lower()
@@ -357,13 +505,14 @@ class QuizSystem:
                 print(result["message"])
                 
                 if result["success"]:
+                    quiz = result["quiz_data"]
                     take_now = input("Take the quiz now? (y/n): ").strip().lower()
                     if take_now in ['y', 'yes']:
-                        self.take_quiz()
+                        self.take_quiz(quiz)
             
             elif command == 'take':
-                if self.current_quiz:
-                    self.take_quiz()
+                if quiz:
+                    self.take_quiz(quiz)
                 else:
                     print("No quiz available. Generate one first.")
             
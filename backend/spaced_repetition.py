@@ -0,0 +1,152 @@
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from storage import InMemoryStore, Store, open_store
+
+# SM-2 parameters (override with environment variables)
+INITIAL_EASE = float(os.getenv("SRS_INITIAL_EASE", "2.5"))
+MIN_EASE = float(os.getenv("SRS_MIN_EASE", "1.3"))
+MAX_INTERVAL_DAYS = float(os.getenv("SRS_MAX_INTERVAL_DAYS", "365"))
+# Failed cards come back within the same study day
+RELEARN_MINUTES = float(os.getenv("SRS_RELEARN_MINUTES", "10"))
+
+DAY_SECONDS = 24 * 60 * 60
+
+
+def quality_from_rating(difficulty_rating: int) -> int:
+    """Map the API's difficulty rating (1=very easy .. 5=very hard) to SM-2 quality (5 .. 1)"""
+    return 6 - difficulty_rating
+
+
+def new_card_state(now: float) -> Dict[str, Any]:
+    return {
+        "ease": INITIAL_EASE,
+        "interval_days": 0.0,
+        "repetitions": 0,
+        "lapses": 0,
+        "reviews": 0,
+        "due_at": now,
+        "last_reviewed_at": None
+    }
+
+
+def sm2_review(state: Dict[str, Any], difficulty_rating: int, now: float) -> Dict[str, Any]:
+    """
+    Next state of a card after a review (SM-2)
+
+    Quality below 3 is a lapse: the card restarts its repetitions and is due again
+    after RELEARN_MINUTES. Otherwise the interval grows 1 day, 6 days, then by the
+    card's ease factor, which itself moves with each answer's quality.
+    """
+    quality = quality_from_rating(difficulty_rating)
+    ease = max(MIN_EASE, state["ease"] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if quality < 3:
+        repetitions = 0
+        interval_days = 0.0
+        due_at = now + RELEARN_MINUTES * 60
+        lapses = state["lapses"] + 1
+    else:
+        repetitions = state["repetitions"] + 1
+        if repetitions == 1:
+            interval_days = 1.0
+        elif repetitions == 2:
+            interval_days = 6.0
+        else:
+            interval_days = min(MAX_INTERVAL_DAYS, state["interval_days"] * ease)
+        due_at = now + interval_days * DAY_SECONDS
+        lapses = state["lapses"]
+    return {
+        "ease": round(ease, 4),
+        "interval_days": round(interval_days, 4),
+        "repetitions": repetitions,
+        "lapses": lapses,
+        "reviews": state["reviews"] + 1,
+        "due_at": due_at,
+        "last_reviewed_at": now
+    }
+
+
+def public_state(card_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    return {"card_id": card_id, **{k: v for k, v in state.items() if k not in ("student_id", "card_id")}}
+
+
+def schedule_key(student_id: str, card_id: str) -> str:
+    return f"{student_id}:{card_id}"
+
+
+def open_schedule_store(store_factory: Callable[..., Store] = InMemoryStore) -> Store:
+    """Card states keyed by (student, card), indexed by both and ordered by due time"""
+    return store_factory("card_schedules", indexes=("student_id", "card_id"), order_by="due_at")
+
+
+class SpacedRepetitionScheduler:
+    """
+    Per-student review schedule for flashcards.
+
+    Each card's SM-2 state is a record in a store keyed by (student, card) and
+    ordered by due time, so schedules are shared between workers and survive
+    restarts with the sqlite backend. Fetching the k next due cards is a page
+    of the student's records in due order; reviews are optimistic updates, so
+    two workers reviewing the same card do not lose either answer.
+    """
+
+    def __init__(self, store: Optional[Store] = None):
+        self.store = store if store is not None else open_schedule_store()
+
+    def add_cards(self, student_id: str, card_ids: Iterable[str], now: Optional[float] = None) -> int:
+        """Start scheduling cards the student has not seen (due immediately); returns how many were new"""
+        now = time.time() if now is None else now
+        # Only this set's cards are looked up, in one query, and the new ones inserted together
+        keys = {schedule_key(student_id, card_id): card_id for card_id in card_ids}
+        known = self.store.get_many(keys)
+        # Another worker may have scheduled a card meanwhile: add_many keeps its state
+        return self.store.add_many({
+            key: {"student_id": student_id, "card_id": card_id, **new_card_state(now)}
+            for key, card_id in keys.items() if key not in known
+        })
+
+    def review(self, student_id: str, card_id: str, difficulty_rating: int,
+               now: Optional[float] = None) -> Dict[str, Any]:
+        """Record a review and return the card's new schedule"""
+        now = time.time() if now is None else now
+        key = schedule_key(student_id, card_id)
+        def apply(record):
+            record.update(sm2_review(record, difficulty_rating, now))
+        try:
+            state = self.store.update(key, apply)
+        except KeyError:
+            # First review of a card that was never scheduled
+            self.store.add(key, {"student_id": student_id, "card_id": card_id, **new_card_state(now)})
+            state = self.store.update(key, apply)
+        return public_state(card_id, state)
+
+    def due_cards(self, student_id: str, limit: int, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Up to limit cards due at or before now, most overdue first"""
+        now = time.time() if now is None else now
+        return [
+            public_state(state["card_id"], state)
+            for _, state in self.store.page(limit=limit, where={"student_id": student_id})
+            if state["due_at"] <= now
+        ]
+
+    def next_due_at(self, student_id: str) -> Optional[float]:
+        """When the student's earliest card is due, or None"""
+        first = self.store.page(limit=1, where={"student_id": student_id})
+        return first[0][1]["due_at"] if first else None
+
+    def card_states(self, student_id: str, card_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        stored = self.store.get_many(schedule_key(student_id, card_id) for card_id in card_ids)
+        return {state["card_id"]: public_state(state["card_id"], state) for state in stored.values()}
+
+    def remove_cards(self, card_ids: Iterable[str]):
+        """Stop scheduling cards for every student (e.g. their set was deleted)"""
+        for card_id in set(card_ids):
+            for key in self.store.keys_where("card_id", card_id):
+                self.store.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"scheduled_cards": len(self.store), "backend": self.store.backend}
+
+
+scheduler = SpacedRepetitionScheduler(open_schedule_store(open_store))
@@ -0,0 +1,942 @@
+import abc
+import asyncio
+import bisect
+import functools
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from aggregates import Aggregates
+
+# Backend selection (override with environment variables).
+# "memory" keeps everything in this process; "sqlite" shares state between
+# worker processes and survives restarts.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory").lower()
+STORAGE_PATH = os.getenv(
+    "STORAGE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "reviso.db")
+)
+STORAGE_POOL_SIZE = int(os.getenv("STORAGE_POOL_SIZE", "8"))
+STORAGE_BUSY_TIMEOUT_MS = int(os.getenv("STORAGE_BUSY_TIMEOUT_MS", "5000"))
+# How long a store call waits for a pooled connection when every one is in use
+STORAGE_POOL_TIMEOUT_SECONDS = float(os.getenv("STORAGE_POOL_TIMEOUT_SECONDS", "30"))
+
+# Where evicted session records are archived before being dropped ("" to just drop them)
+STORAGE_ARCHIVE_PATH = os.getenv(
+    "STORAGE_ARCHIVE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "archive.db")
+)
+STORAGE_SWEEP_INTERVAL_SECONDS = int(os.getenv("STORAGE_SWEEP_INTERVAL_SECONDS", "60"))
+# Identifies this process in records shared between workers (leases, job owners)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# Attempts at an optimistic update before giving up on a contended record
+STORAGE_UPDATE_RETRIES = int(os.getenv("STORAGE_UPDATE_RETRIES", "8"))
+
+# Retention per session store: (TTL in seconds since last use, maximum records).
+# 0 disables a bound. Stores not listed here keep records until they are deleted.
+RETENTION = {
+    "chat_sessions": (int(os.getenv("CHAT_SESSION_TTL_SECONDS", str(7 * 24 * 3600))),
+                      int(os.getenv("CHAT_SESSION_MAX_ITEMS", "10000"))),
+    "quiz_sessions": (int(os.getenv("QUIZ_SESSION_TTL_SECONDS", str(2 * 24 * 3600))),
+                      int(os.getenv("QUIZ_SESSION_MAX_ITEMS", "20000"))),
+    "study_sessions": (int(os.getenv("STUDY_SESSION_TTL_SECONDS", str(7 * 24 * 3600))),
+                       int(os.getenv("STUDY_SESSION_MAX_ITEMS", "20000"))),
+    "proctoring_samples": (int(os.getenv("PROCTORING_DATA_TTL_SECONDS", str(24 * 3600))),
+                           int(os.getenv("PROCTORING_DATA_MAX_USERS", "500"))),
+    # Finished grading jobs; their results are also kept in evaluation_results
+    "evaluation_jobs": (int(os.getenv("EVALUATION_JOB_TTL_SECONDS", str(7 * 24 * 3600))),
+                        int(os.getenv("EVALUATION_JOB_MAX_ITEMS", "100000"))),
+    # Results of unfinished grading jobs; dropped when a job finishes
+    "evaluation_progress": (int(os.getenv("EVALUATION_JOB_TTL_SECONDS", str(7 * 24 * 3600))), 0),
+    "bulk_grading_jobs": (int(os.getenv("BULK_JOB_TTL_SECONDS", str(30 * 24 * 3600))),
+                          int(os.getenv("BULK_JOB_MAX_ITEMS", "10000"))),
+    # Answers checkpointed by running bulk jobs; dropped when a job finishes
+    "bulk_grading_progress": (int(os.getenv("BULK_JOB_TTL_SECONDS", str(30 * 24 * 3600))), 0),
+}
+
+# Records sampled to estimate an in-memory store's size
+SIZE_SAMPLE = 100
+
+# (encode to a JSON-able value, decode back), for records that are not plain dicts
+Codec = Tuple[Callable[[Any], Any], Callable[[Any], Any]]
+# Called with (key, record) after a record is evicted
+EvictHook = Callable[[str, Any], None]
+
+
+class ConflictError(Exception):
+    """A record kept changing under an update (other workers writing the same session)"""
+    pass
+
+
+class PoolExhaustedError(Exception):
+    """No pooled connection came free in time (every connection held by slow or stuck calls)"""
+    pass
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, array):
+        return {"__array__": value.typecode, "items": value.tolist()}
+    raise TypeError(f"Cannot store {type(value).__name__}")
+
+
+def _json_object_hook(obj: Dict[str, Any]) -> Any:
+    if "__array__" in obj:
+        return array(obj["__array__"], obj["items"])
+    return obj
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, default=_json_default)
+
+
+def loads(text: str) -> Any:
+    return json.loads(text, object_hook=_json_object_hook)
+
+
+class Store(MutableMapping):
+    """
+    A named collection of records keyed by ID, with optional indexed fields.
+
+    Used like the dicts it replaces. Records read from a store may be copies, so
+    after changing one in place write it back (store[key] = record) for other
+    workers and restarts to see the change.
+
+    A store with a TTL or a record cap is swept periodically: records unused for
+    longer than the TTL, then the least recently used beyond the cap, are copied
+    to the archive and dropped.
+
+    A store with an order_by field (e.g. created_at) can be listed a page at a
+    time in (order_by, key) order, filtered on its indexed fields.
+    """
+
+    backend = "memory"
+
+    def __init__(self, name: str, indexes: Iterable[str] = (), codec: Optional[Codec] = None,
+                 ttl_seconds: int = 0, max_items: int = 0, on_evict: Optional[EvictHook] = None,
+                 order_by: Optional[str] = None):
+        self.name = name
+        self.indexes = tuple(indexes)
+        self.order_by = order_by
+        # Fields copied out of each record: the indexes, plus the ordering field
+        self.columns = self.indexes + ((order_by,) if order_by and order_by not in self.indexes else ())
+        self.codec = codec
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self.on_evict = on_evict
+        self.archive: Optional["Store"] = None
+        self.evicted = 0
+        # Set when a write takes the store past max_items, until the overflow is evicted
+        self.overfull = False
+
+    def _encoded(self, record: Any) -> Any:
+        return self.codec[0](record) if self.codec else record
+
+    def _index_values(self, record: Any) -> Dict[str, Any]:
+        data = self._encoded(record)
+        values = {field: data.get(field) for field in self.columns}
+        if self.order_by and values[self.order_by] is None:
+            values[self.order_by] = ""
+        return values
+
+    def order_value(self, record: Any) -> Any:
+        return self._index_values(record)[self.order_by]
+
+    @abc.abstractmethod
+    def page(self, after: Optional[Tuple[Any, str]] = None, limit: int = 50,
+             where: Optional[Dict[str, Any]] = None, since: Any = None,
+             until: Any = None) -> List[Tuple[str, Any]]:
+        """
+        Up to limit (key, record) pairs in (order_by, key) order
+
+        after: the (order value, key) of the last record of the previous page.
+        where: equality filters on indexed fields. since/until: order_by range,
+        inclusive and exclusive.
+        """
+
+    @abc.abstractmethod
+    def keys_where(self, field: str, value: Any) -> List[str]:
+        """Keys of the records whose indexed field equals value"""
+
+    def put_many(self, records: Dict[str, Any]):
+        """Write several records in one transaction"""
+        for key, record in records.items():
+            self[key] = record
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """The records that exist among keys, in one query"""
+        records = {}
+        for key in keys:
+            record = self.get(key)
+            if record is not None:
+                records[key] = record
+        return records
+
+    def add_many(self, records: Dict[str, Any]) -> int:
+        """Insert the records whose keys are free, in one transaction; returns how many were inserted"""
+        return sum(self.add(key, record) for key, record in records.items())
+
+    @abc.abstractmethod
+    def update(self, key: str, mutate: Callable[[Any], None],
+               retries: int = STORAGE_UPDATE_RETRIES) -> Any:
+        """
+        Read a record, change it with mutate(record) and write it back atomically
+
+        The write only succeeds if nobody else wrote the record since it was
+        read; otherwise mutate runs again on a fresh copy, so it must not have
+        side effects. mutate may raise to abort (check before changing
+        anything). Returns the updated record; KeyError if it does not exist.
+        """
+
+    @abc.abstractmethod
+    def add(self, key: str, record: Any) -> bool:
+        """Insert a record only if the key is free; returns whether it was inserted"""
+
+    @abc.abstractmethod
+    def discard(self, key: str, check: Callable[[Any], bool],
+                retries: int = STORAGE_UPDATE_RETRIES) -> bool:
+        """
+        Delete a record if check(record) holds, atomically (nobody wrote it
+        since check saw it); returns whether it was deleted
+        """
+
+    @contextmanager
+    def batch(self):
+        """Collect writes made through the yielded dict and apply them together on exit"""
+        pending: Dict[str, Any] = {}
+        yield pending
+        if pending:
+            self.put_many(pending)
+
+    @abc.abstractmethod
+    def expired_keys(self, cutoff: float) -> List[str]:
+        """Keys of records last used before cutoff"""
+
+    @abc.abstractmethod
+    def overflow_keys(self) -> List[str]:
+        """Least recently used keys beyond max_items"""
+
+    @abc.abstractmethod
+    def estimated_bytes(self) -> int:
+        """Approximate size of the stored records"""
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Archive and drop expired records, then any beyond the cap; returns how many"""
+        now = time.time() if now is None else now
+        keys = self.expired_keys(now - self.ttl_seconds) if self.ttl_seconds else []
+        if self.max_items:
+            self.overfull = False
+            expired = set(keys)
+            keys += [key for key in self.overflow_keys() if key not in expired]
+        return self.evict(keys)
+
+    def evict(self, keys: List[str]) -> int:
+        records = {}
+        for key in keys:
+            record = self.get(key)
+            if record is not None:
+                records[key] = record
+        if not records:
+            return 0
+        if self.archive is not None:
+            self.archive.put_many(records)
+        for key, record in records.items():
+            self.pop(key, None)
+            if self.on_evict:
+                self.on_evict(key, record)
+        self.evicted += len(records)
+        print(f"---EVICTED {len(records)} RECORDS FROM {self.name.upper()}---")
+        return len(records)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "backend": self.backend,
+            "items": len(self),
+            "estimated_bytes": self.estimated_bytes(),
+            "ttl_seconds": self.ttl_seconds or None,
+            "max_items": self.max_items or None,
+            "evicted": self.evicted,
+            "archived": self.archive is not None
+        }
+
+
+class InMemoryStore(Store):
+    """Process-local store: a dict plus per-field index dicts (the default, single worker)"""
+
+    def __init__(self, name: str, indexes: Iterable[str] = (), codec: Optional[Codec] = None,
+                 ttl_seconds: int = 0, max_items: int = 0, on_evict: Optional[EvictHook] = None,
+                 order_by: Optional[str] = None):
+        super().__init__(name, indexes, codec, ttl_seconds, max_items, on_evict, order_by)
+        self._records: Dict[str, Any] = {}
+        self._index: Dict[str, Dict[Any, set]] = {field: {} for field in self.indexes}
+        # Indexed values as last written, since records may be mutated in place
+        self._indexed: Dict[str, Dict[str, Any]] = {}
+        # Sorted (order value, key) pairs, when the store has an order_by field:
+        # of every record, and per indexed field and value (for filtered pages)
+        self._order: List[Tuple[Any, str]] = []
+        self._value_order: Dict[str, Dict[Any, List[Tuple[Any, str]]]] = {field: {} for field in self.indexes}
+        # key -> last use, least recently used first
+        self._used: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _touch(self, key: str):
+        self._used[key] = time.time()
+        self._used.move_to_end(key)
+
+    def __getitem__(self, key: str) -> Any:
+        with self._lock:
+            record = self._records[key]
+            self._touch(key)
+            return record
+
+    def _moves(self, previous: Optional[Dict[str, Any]], values: Optional[Dict[str, Any]],
+               field: Optional[str] = None) -> bool:
+        """Whether a rewrite changes the record's place in an order list (field's, or the store's)"""
+        if previous is None or values is None:
+            return True
+        return previous[self.order_by] != values[self.order_by] or (field is not None and previous[field] != values[field])
+
+    def __setitem__(self, key: str, record: Any):
+        with self._lock:
+            values = self._index_values(record)
+            previous = self._indexed.get(key)
+            self._unindex(key, values)
+            self._records[key] = record
+            self._touch(key)
+            self._indexed[key] = values
+            for field in self.indexes:
+                self._index[field].setdefault(values[field], set()).add(key)
+                if self.order_by and self._moves(previous, values, field):
+                    bisect.insort(self._value_order[field].setdefault(values[field], []), (values[self.order_by], key))
+            if self.order_by and self._moves(previous, values):
+                bisect.insort(self._order, (values[self.order_by], key))
+            if self.max_items and len(self._records) > self.max_items:
+                # Evicted after the call that wrote it (see run_storage) or at the next sweep,
+                # so on_evict hooks never run inside a writer's update
+                self.overfull = True
+
+    def update(self, key: str, mutate: Callable[[Any], None],
+               retries: int = STORAGE_UPDATE_RETRIES) -> Any:
+        # One process: holding the lock for the read-modify-write is enough
+        with self._lock:
+            record = self[key]
+            mutate(record)
+            self[key] = record
+            return record
+
+    def add(self, key: str, record: Any) -> bool:
+        with self._lock:
+            if key in self._records:
+                return False
+            self[key] = record
+            return True
+
+    def discard(self, key: str, check: Callable[[Any], bool],
+                retries: int = STORAGE_UPDATE_RETRIES) -> bool:
+        with self._lock:
+            record = self._records.get(key)
+            if record is None or not check(record):
+                return False
+            del self[key]
+            return True
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            del self._records[key]
+            self._used.pop(key, None)
+            self._unindex(key)
+
+    def _unindex(self, key: str, replacement: Optional[Dict[str, Any]] = None):
+        """Drop key from the indexes; order entries that replacement (its new values) keeps stay"""
+        values = self._indexed.pop(key, None)
+        if values is None:
+            return
+        entry = (values[self.order_by], key) if self.order_by else None
+        for field in self.indexes:
+            keys = self._index[field].get(values[field])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[field][values[field]]
+            if self.order_by and self._moves(values, replacement, field):
+                order = self._value_order[field].get(values[field])
+                if order is not None:
+                    _remove_sorted(order, entry)
+                    if not order:
+                        del self._value_order[field][values[field]]
+        if self.order_by and self._moves(values, replacement):
+            _remove_sorted(self._order, entry)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._records))
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._records
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """All records, without counting as a use of each"""
+        with self._lock:
+            return list(self._records.items())
+
+    def values(self) -> List[Any]:
+        with self._lock:
+            return list(self._records.values())
+
+    def keys_where(self, field: str, value: Any) -> List[str]:
+        return list(self._index[field].get(value, ()))
+
+    def page(self, after: Optional[Tuple[Any, str]] = None, limit: int = 50,
+             where: Optional[Dict[str, Any]] = None, since: Any = None,
+             until: Any = None) -> List[Tuple[str, Any]]:
+        where = where or {}
+        results = []
+        with self._lock:
+            order = self._order
+            if where:
+                # Walk the records of the most selective filter value rather than every record
+                order = min((self._value_order[field].get(value, []) for field, value in where.items()), key=len)
+            start = 0
+            if after is not None:
+                start = bisect.bisect_right(order, tuple(after))
+            if since is not None:
+                start = max(start, bisect.bisect_left(order, (since, "")))
+            for position in range(start, len(order)):
+                value, key = order[position]
+                if until is not None and value >= until:
+                    break
+                indexed = self._indexed[key]
+                if all(indexed[field] == wanted for field, wanted in where.items()):
+                    results.append((key, self._records[key]))
+                    if len(results) >= limit:
+                        break
+        return results
+
+    def expired_keys(self, cutoff: float) -> List[str]:
+        keys = []
+        with self._lock:
+            for key, used in self._used.items():
+                if used >= cutoff:
+                    break
+                keys.append(key)
+        return keys
+
+    def overflow_keys(self) -> List[str]:
+        with self._lock:
+            excess = len(self._used) - self.max_items
+            return [key for key, _ in zip(self._used, range(excess))]
+
+    def estimated_bytes(self) -> int:
+        """Encoded size of a sample of records, scaled to the whole store"""
+        with self._lock:
+            sample = [record for record, _ in zip(self._records.values(), range(SIZE_SAMPLE))]
+            total = len(self._records)
+        if not sample:
+            return 0
+        sample_bytes = sum(len(dumps(self._encoded(record))) for record in sample)
+        return sample_bytes * total // len(sample)
+
+
+def _remove_sorted(order: List[Tuple[Any, str]], entry: Tuple[Any, str]):
+    position = bisect.bisect_left(order, entry)
+    if position < len(order) and order[position] == entry:
+        del order[position]
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections in WAL mode, shared by the stores of one process"""
+
+    def __init__(self, path: str, size: int = STORAGE_POOL_SIZE, timeout: float = STORAGE_POOL_TIMEOUT_SECONDS):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=STORAGE_BUSY_TIMEOUT_MS / 1000)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={STORAGE_BUSY_TIMEOUT_MS}")
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolExhaustedError(
+                f"All {self.size} connections to {self.path} stayed in use for {self.timeout:g}s "
+                "(raise STORAGE_POOL_SIZE, or look for store calls nested inside a transaction)"
+            ) from None
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """A connection for one transaction: committed on success, rolled back on error"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            conn = self._connect() if create else self._checkout()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+
+class SQLiteStore(Store):
+    """
+    Store persisted in a SQLite table, safe to share between worker processes.
+
+    Each record is a JSON document; indexed fields are copied into their own
+    indexed columns so keys_where is an index lookup. Expiry and the record cap
+    go by when a record was last written, since reads do not touch the row.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, name: str, pool: ConnectionPool, indexes: Iterable[str] = (),
+                 codec: Optional[Codec] = None, ttl_seconds: int = 0, max_items: int = 0,
+                 on_evict: Optional[EvictHook] = None, order_by: Optional[str] = None):
+        super().__init__(name, indexes, codec, ttl_seconds, max_items, on_evict, order_by)
+        self.pool = pool
+        self.table = f"store_{name}"
+        with pool.connection() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                " key TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_updated_at ON {self.table} (updated_at)")
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({self.table})")}
+            # Bumped on every write, for optimistic updates
+            if "version" not in columns:
+                conn.execute(f"ALTER TABLE {self.table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            for field in self.columns:
+                if f"idx_{field}" not in columns:
+                    # New indexed field: fill it in for the records already stored
+                    conn.execute(f"ALTER TABLE {self.table} ADD COLUMN idx_{field}")
+                    extracted = f"json_extract(data, '$.{field}')"
+                    if field == order_by:
+                        extracted = f"COALESCE({extracted}, '')"
+                    conn.execute(f"UPDATE {self.table} SET idx_{field} = {extracted}")
+            for field in self.columns:
+                if order_by and field != order_by:
+                    # Filtered pages read (field, order_by, key) in index order; also serves keys_where
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS {self.table}_{field}_{order_by}"
+                        f" ON {self.table} (idx_{field}, idx_{order_by}, key)"
+                    )
+                    conn.execute(f"DROP INDEX IF EXISTS {self.table}_{field}")
+                else:
+                    ordering = ", key" if field == order_by else ""
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS {self.table}_{field} ON {self.table} (idx_{field}{ordering})"
+                    )
+
+    def _encode(self, record: Any) -> str:
+        return dumps(self._encoded(record))
+
+    def _decode(self, text: str) -> Any:
+        data = loads(text)
+        return self.codec[1](data) if self.codec else data
+
+    def _row(self, key: str, record: Any) -> tuple:
+        values = self._index_values(record)
+        return (key, self._encode(record), time.time(), *(values[field] for field in self.columns))
+
+    def put_many(self, records: Dict[str, Any]):
+        if not records:
+            return
+        columns = ["key", "data", "updated_at", *(f"idx_{field}" for field in self.columns)]
+        updates = ", ".join([*(f"{column} = excluded.{column}" for column in columns[1:]), "version = version + 1"])
+        with self.pool.connection() as conn:
+            conn.executemany(
+                f"INSERT INTO {self.table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                f" ON CONFLICT(key) DO UPDATE SET {updates}",
+                [self._row(key, record) for key, record in records.items()]
+            )
+
+    def __getitem__(self, key: str) -> Any:
+        with self.pool.connection() as conn:
+            row = conn.execute(f"SELECT data FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self._decode(row[0])
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        records = {}
+        with self.pool.connection() as conn:
+            # Within SQLite's limit on query parameters
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT key, data FROM {self.table} WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                records.update((key, self._decode(data)) for key, data in rows)
+        return records
+
+    def __setitem__(self, key: str, record: Any):
+        self.put_many({key: record})
+
+    def update(self, key: str, mutate: Callable[[Any], None],
+               retries: int = STORAGE_UPDATE_RETRIES) -> Any:
+        assignments = ", ".join(["data = ?", "updated_at = ?", *(f"idx_{field} = ?" for field in self.columns)])
+        for attempt in range(retries):
+            with self.pool.connection() as conn:
+                row = conn.execute(f"SELECT data, version FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                raise KeyError(key)
+            record = self._decode(row[0])
+            mutate(record)
+            _, data, updated_at, *values = self._row(key, record)
+            with self.pool.connection() as conn:
+                swapped = conn.execute(
+                    f"UPDATE {self.table} SET {assignments}, version = version + 1 WHERE key = ? AND version = ?",
+                    (data, updated_at, *values, key, row[1])
+                ).rowcount
+            if swapped:
+                return record
+            # Lost the race to another writer: back off briefly and retry on fresh data
+            time.sleep(0.001 * (attempt + 1))
+        raise ConflictError(f"{self.name} record {key} is being updated concurrently, please retry")
+
+    def add(self, key: str, record: Any) -> bool:
+        return self.add_many({key: record}) == 1
+
+    def add_many(self, records: Dict[str, Any]) -> int:
+        if not records:
+            return 0
+        columns = ["key", "data", "updated_at", *(f"idx_{field}" for field in self.columns)]
+        with self.pool.connection() as conn:
+            return conn.executemany(
+                f"INSERT INTO {self.table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                " ON CONFLICT(key) DO NOTHING",
+                [self._row(key, record) for key, record in records.items()]
+            ).rowcount
+
+    def discard(self, key: str, check: Callable[[Any], bool],
+                retries: int = STORAGE_UPDATE_RETRIES) -> bool:
+        for attempt in range(retries):
+            with self.pool.connection() as conn:
+                row = conn.execute(f"SELECT data, version FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None or not check(self._decode(row[0])):
+                return False
+            with self.pool.connection() as conn:
+                if conn.execute(f"DELETE FROM {self.table} WHERE key = ? AND version = ?", (key, row[1])).rowcount:
+                    return True
+            time.sleep(0.001 * (attempt + 1))
+        raise ConflictError(f"{self.name} record {key} is being updated concurrently, please retry")
+
+    def __delitem__(self, key: str):
+        with self.pool.connection() as conn:
+            deleted = conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount
+        if not deleted:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        with self.pool.connection() as conn:
+            return iter([row[0] for row in conn.execute(f"SELECT key FROM {self.table}")])
+
+    def __len__(self) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def __contains__(self, key: object) -> bool:
+        with self.pool.connection() as conn:
+            return conn.execute(f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone() is not None
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """All records in one query"""
+        with self.pool.connection() as conn:
+            rows = conn.execute(f"SELECT key, data FROM {self.table}").fetchall()
+        return [(key, self._decode(data)) for key, data in rows]
+
+    def values(self) -> List[Any]:
+        return [record for _, record in self.items()]
+
+    def keys_where(self, field: str, value: Any) -> List[str]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(f"SELECT key FROM {self.table} WHERE idx_{field} = ?", (value,)).fetchall()
+        return [row[0] for row in rows]
+
+    def page(self, after: Optional[Tuple[Any, str]] = None, limit: int = 50,
+             where: Optional[Dict[str, Any]] = None, since: Any = None,
+             until: Any = None) -> List[Tuple[str, Any]]:
+        order = f"idx_{self.order_by}"
+        clauses, params = [], []
+        if after is not None:
+            clauses.append(f"({order}, key) > (?, ?)")
+            params.extend(after)
+        if since is not None:
+            clauses.append(f"{order} >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append(f"{order} < ?")
+            params.append(until)
+        for field, value in (where or {}).items():
+            clauses.append(f"idx_{field} = ?")
+            params.append(value)
+        condition = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT key, data FROM {self.table}{condition} ORDER BY {order}, key LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+        return [(key, self._decode(data)) for key, data in rows]
+
+    def expired_keys(self, cutoff: float) -> List[str]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(f"SELECT key FROM {self.table} WHERE updated_at < ?", (cutoff,)).fetchall()
+        return [row[0] for row in rows]
+
+    def overflow_keys(self) -> List[str]:
+        with self.pool.connection() as conn:
+            excess = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.max_items
+            if excess <= 0:
+                return []
+            rows = conn.execute(
+                f"SELECT key FROM {self.table} ORDER BY updated_at LIMIT ?", (excess,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def estimated_bytes(self) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute(f"SELECT COALESCE(SUM(LENGTH(data)), 0) FROM {self.table}").fetchone()[0]
+
+
+class SQLiteAggregates(Aggregates):
+    """Aggregates kept in SQLite and updated atomically, so all workers share one set of totals"""
+
+    def __init__(self, scope: str, pool: ConnectionPool):
+        super().__init__()
+        self.scope = scope
+        self.pool = pool
+        with pool.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS aggregates ("
+                " scope TEXT NOT NULL, name TEXT NOT NULL, kind TEXT NOT NULL,"
+                " observations INTEGER NOT NULL, total REAL NOT NULL,"
+                " PRIMARY KEY (scope, name))"
+            )
+
+    def _add(self, name: str, kind: str, observations: int, total: float):
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO aggregates (scope, name, kind, observations, total) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(scope, name) DO UPDATE SET"
+                " observations = MAX(0, observations + excluded.observations),"
+                " total = CASE WHEN observations + excluded.observations <= 0 AND kind = 'mean'"
+                " THEN 0 ELSE total + excluded.total END",
+                (self.scope, name, kind, observations, total)
+            )
+
+    def _read(self, name: str) -> Tuple[int, float]:
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT observations, total FROM aggregates WHERE scope = ? AND name = ?", (self.scope, name)
+            ).fetchone()
+        return row or (0, 0.0)
+
+    def incr(self, name: str, by: float = 1):
+        self._add(name, "counter", 0, by)
+
+    def observe(self, name: str, value: float, count: int = 1):
+        self._add(name, "mean", count, value)
+
+    def unobserve(self, name: str, value: float, count: int = 1):
+        self._add(name, "mean", -count, -value)
+
+    def count(self, name: str) -> float:
+        return self._read(name)[1]
+
+    def mean(self, name: str) -> float:
+        observations, total = self._read(name)
+        return total / observations if observations else 0
+
+    def observations(self, name: str) -> int:
+        return self._read(name)[0]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT name, kind, observations, total FROM aggregates WHERE scope = ?", (self.scope,)
+            ).fetchall()
+        return {
+            "counters": {name: total for name, kind, _, total in rows if kind == "counter"},
+            "means": {name: (total / n if n else 0) for name, kind, n, total in rows if kind == "mean"}
+        }
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+# Every store opened in this process, for sweeping and diagnostics
+_stores: List[Store] = []
+
+
+def get_pool(path: str = STORAGE_PATH) -> ConnectionPool:
+    with _pools_lock:
+        if path not in _pools:
+            _pools[path] = ConnectionPool(path)
+        return _pools[path]
+
+
+def _register(store: Store) -> Store:
+    if (store.ttl_seconds or store.max_items) and STORAGE_ARCHIVE_PATH:
+        store.archive = SQLiteStore(f"archive_{store.name}", get_pool(STORAGE_ARCHIVE_PATH), codec=store.codec)
+    _stores.append(store)
+    return store
+
+
+def open_store(name: str, indexes: Iterable[str] = (), codec: Optional[Codec] = None,
+               on_evict: Optional[EvictHook] = None, order_by: Optional[str] = None) -> Store:
+    """The configured backend's store for a collection, with its RETENTION bounds"""
+    ttl_seconds, max_items = RETENTION.get(name, (0, 0))
+    if STORAGE_BACKEND == "sqlite":
+        return _register(SQLiteStore(name, get_pool(), indexes, codec, ttl_seconds, max_items, on_evict, order_by))
+    return _register(InMemoryStore(name, indexes, codec, ttl_seconds, max_items, on_evict, order_by))
+
+
+def open_local_store(name: str, on_evict: Optional[EvictHook] = None) -> Store:
+    """An in-memory store whatever the backend, for records mutated in place on hot paths"""
+    ttl_seconds, max_items = RETENTION.get(name, (0, 0))
+    return _register(InMemoryStore(name, ttl_seconds=ttl_seconds, max_items=max_items, on_evict=on_evict))
+
+
+def sweep_stores() -> int:
+    """Sweep every store with retention bounds; returns how many records were evicted"""
+    evicted = 0
+    for store in list(_stores):
+        if store.ttl_seconds or store.max_items:
+            try:
+                evicted += store.sweep()
+            except Exception as e:
+                print(f"---SWEEP OF {store.name.upper()} FAILED: {e}---")
+    return evicted
+
+
+def evict_overflow() -> int:
+    """Evict the least recently used records of stores written past max_items; returns how many"""
+    evicted = 0
+    for store in list(_stores):
+        if store.overfull:
+            store.overfull = False
+            try:
+                evicted += store.evict(store.overflow_keys())
+            except Exception as e:
+                print(f"---EVICTION FROM {store.name.upper()} FAILED: {e}---")
+    return evicted
+
+
+async def run_sweeper(interval: int = STORAGE_SWEEP_INTERVAL_SECONDS):
+    """Background task: sweep the stores every interval seconds (off the event loop)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        await loop.run_in_executor(None, sweep_stores)
+
+
+# Threads that run store calls for async code, one per pooled connection
+storage_executor = ThreadPoolExecutor(max_workers=STORAGE_POOL_SIZE, thread_name_prefix="storage")
+
+
+async def run_storage(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run store calls from async code without blocking the event loop
+
+    With the sqlite backend, fn runs on the storage pool, so queries, waits on
+    a busy database and update()'s retries stall one thread rather than every
+    request. In-memory stores never block, so with the memory backend fn runs
+    inline. Stores fn wrote past their cap are trimmed once it returns.
+    """
+    if STORAGE_BACKEND != "sqlite":
+        return _run_and_evict(fn, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(storage_executor, functools.partial(_run_and_evict, fn, *args, **kwargs))
+
+
+def _run_and_evict(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        evict_overflow()
+
+
+# One thread for writes queued from async code without waiting, so they apply in order
+storage_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-writer")
+
+
+def _write(store: MutableMapping, key: str, record: Any):
+    try:
+        store[key] = record
+    except Exception as e:
+        print(f"---WRITE TO {getattr(store, 'name', 'STORE').upper()} FAILED: {e}---")
+        raise
+
+
+def write_behind(store: MutableMapping, key: str, record: Any) -> Future:
+    """
+    Write a record from async code (e.g. a progress callback) without waiting
+
+    Writes to a sqlite store run on one writer thread in the order they were
+    queued, so the last one made wins; record must not change afterwards (pass
+    a copy). Other stores are written right away. Await the returned future
+    (asyncio.wrap_future) where the write has to have landed.
+    """
+    if getattr(store, "backend", "memory") != "sqlite":
+        done: Future = Future()
+        store[key] = record
+        done.set_result(None)
+        return done
+    return storage_writer.submit(_write, store, key, record)
+
+
+def off_loop(handler: Callable[..., Any]) -> Callable[..., Any]:
+    """Make a synchronous route handler that works on stores a coroutine run through run_storage"""
+    @functools.wraps(handler)
+    async def run(*args, **kwargs):
+        return await run_storage(handler, *args, **kwargs)
+    return run
+
+
+def store_stats() -> List[Dict[str, Any]]:
+    return [store.stats() for store in _stores]
+
+
+def open_aggregates(scope: str) -> Aggregates:
+    """The configured backend's running statistics for a scope"""
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteAggregates(scope, get_pool())
+    return Aggregates()
+
+
+def storage_info() -> Dict[str, Any]:
+    return {
+        "backend": STORAGE_BACKEND,
+        "path": STORAGE_PATH if STORAGE_BACKEND == "sqlite" else None,
+        "pool_size": STORAGE_POOL_SIZE if STORAGE_BACKEND == "sqlite" else None,
+        "archive_path": STORAGE_ARCHIVE_PATH or None,
+        "sweep_interval_seconds": STORAGE_SWEEP_INTERVAL_SECONDS
+    }
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+import concurrency
+from concurrency import GENERATION_WORKERS, run_blocking
+
+
+def test_chat_is_not_queued_behind_generations():
+    release = threading.Event()
+
+    async def scenario():
+        # Fill every generation thread with a call that waits for the test
+        blocked = [
+            asyncio.get_running_loop().run_in_executor(concurrency.generation_executor, release.wait)
+            for _ in range(GENERATION_WORKERS)
+        ]
+        try:
+            await asyncio.sleep(0.05)
+            return await asyncio.wait_for(run_blocking("chat", lambda: "answer"), timeout=2)
+        finally:
+            release.set()
+            await asyncio.gather(*blocked)
+
+    assert asyncio.run(scenario()) == "answer"
+
+
+def test_streaming_producers_take_an_endpoint_slot():
+    from api.streaming import stream_from_producer
+    release = threading.Event()
+    started = []
+
+    def produce(emit):
+        started.append(1)
+        release.wait()
+        emit("complete", {})
+
+    async def scenario():
+        limit = concurrency.ENDPOINT_LIMITS["exam"]
+        streams = [await stream_from_producer("exam", produce) for _ in range(limit)]
+        waiting = asyncio.ensure_future(stream_from_producer("exam", produce))
+        await asyncio.sleep(0.1)
+        assert not waiting.done() and len(started) == limit
+        release.set()
+        streams.append(await asyncio.wait_for(waiting, timeout=2))
+        return [list(stream) for stream in streams]
+
+    frames = asyncio.run(scenario())
+    assert all(stream == ["event: complete\ndata: {}\n\n"] for stream in frames)
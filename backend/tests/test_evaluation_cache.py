@@ -0,0 +1,60 @@
+import evaluation_cache
+from evaluation_cache import EvaluationCache
+from storage import ConnectionPool, SQLiteAggregates
+
+
+def make_question(number, question):
+    return {
+        "question_number": number,
+        "question": question,
+        "marks": 5,
+        "key_points": ["routing table lookup"],
+        "sample_answer": "Routers forward packets by looking up the routing table."
+    }
+
+
+def evaluation(feedback):
+    return {"question_number": 1, "score": 4, "max_marks": 5, "feedback": feedback, "success": True}
+
+
+def test_questions_sharing_a_rubric_do_not_share_feedback(tmp_path):
+    cache = EvaluationCache(str(tmp_path / "cache.db"))
+    routers = make_question(1, "How do routers forward packets?")
+    switches = make_question(2, "How do switches forward frames?")
+    cache.put(routers, "They look up the routing table", evaluation("routers"))
+
+    assert cache.get(switches, "They look up the routing table") is None
+    hit = cache.get(routers, "they look  up the ROUTING table")
+    assert hit["feedback"] == "routers" and hit["question_number"] == 1 and hit["cached"]
+
+
+def test_hit_counts_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / "cache.db")
+    pool = ConnectionPool(str(tmp_path / "reviso.db"))
+    first = EvaluationCache(path, SQLiteAggregates("evaluation_cache", pool))
+    second = EvaluationCache(path, SQLiteAggregates("evaluation_cache", pool))
+    question = make_question(1, "How do routers forward packets?")
+    first.put(question, "By table lookup", evaluation("lookup"))
+
+    first.get(question, "By table lookup")
+    second.get_many([(question, "by TABLE lookup"), (question, "By flooding")])
+
+    stats = first.stats()
+    assert (stats["lookups"], stats["exact_hits"], stats["near_exact_hits"]) == (3, 1, 1)
+    assert stats["hit_rate"] == round(2 / 3, 4)
+
+
+def test_cache_is_trimmed_to_its_cap_every_few_inserts(monkeypatch, tmp_path):
+    monkeypatch.setattr(evaluation_cache, "MAX_CACHE_ENTRIES", 5)
+    monkeypatch.setattr(evaluation_cache, "CACHE_TRIM_EVERY", 4)
+    cache = EvaluationCache(str(tmp_path / "cache.db"))
+    question = make_question(1, "How do routers forward packets?")
+
+    for i in range(7):
+        cache.put(question, f"answer {i}", evaluation(f"feedback {i}"))
+    assert cache.stats()["entries"] == 7  # Over the cap until the next trim
+
+    cache.put(question, "answer 7", evaluation("feedback 7"))
+    assert cache.stats()["entries"] == 5
+    assert cache.get(question, "answer 7")["feedback"] == "feedback 7"
+    assert cache.get(question, "answer 0") is None
@@ -0,0 +1,40 @@
+import asyncio
+
+from evaluation_jobs import EvaluationJobQueue
+from storage import InMemoryStore
+
+
+def test_finished_jobs_leave_memory_and_partial_results_are_stored():
+    store = {}
+    progress = InMemoryStore("evaluation_progress", indexes=("job_id",))
+    seen_partial = []
+
+    async def runner(job, on_result):
+        for n in (1, 2):
+            on_result({"question_number": n, "score": n})
+            # Each result is stored on its own; the job record only carries the counts
+            assert "evaluations" not in store[job["job_id"]]
+            seen_partial.append(store[job["job_id"]]["questions_completed"])
+            # Another worker sees the results so far
+            remote = EvaluationJobQueue(runner, store, progress)
+            seen_partial.append([e["score"] for e in remote.get(job["job_id"])["evaluations"]])
+        return {"success": True, "total_score": 3}
+
+    async def scenario():
+        queue = EvaluationJobQueue(runner, store, progress, workers=2)
+        jobs = [queue.submit({"session_id": f"s{i}", "_exam": {"big": "x" * 1000}, "_answers": []})
+                for i in range(5)]
+        results = [await queue.wait(job["job_id"]) for job in jobs]
+        await queue.stop()
+        return queue, jobs, results
+
+    queue, jobs, results = asyncio.run(scenario())
+    assert seen_partial == [1, [1], 2, [1, 2]] * 5
+    assert len(progress) == 0
+    assert store[jobs[0]["job_id"]]["evaluations"] == [{"question_number": 1, "score": 1}, {"question_number": 2, "score": 2}]
+    assert queue.jobs == {} and queue._done == {}
+    assert all(job.get("_exam") is None for job in jobs)
+    assert all(r["status"] == "complete" and r["total_score"] == 3 for r in results)
+    assert "_exam" not in store[jobs[0]["job_id"]]
+    assert queue.get(jobs[0]["job_id"])["questions_completed"] == 2
+    assert queue.stats()["jobs"] == {"complete": 5}
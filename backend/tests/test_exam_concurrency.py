@@ -0,0 +1,133 @@
+import asyncio
+import os
+import random
+import re
+import tempfile
+
+import pytest
+
+# ExamSystem needs an API key to build its chains and a private evaluation cache
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ["EVALUATION_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "evaluation_cache.db")
+
+import exam
+from evaluation_cache import EvaluationCache
+
+NUM_EXAMS = 30
+QUESTIONS_PER_EXAM = 6
+SUBMISSIONS = 300
+
+
+class StubEvaluationChain:
+    """Echoes each question back as feedback so results can be traced to their exam"""
+
+    def __init__(self, batch: bool):
+        self.batch = batch
+
+    def _evaluation(self, cls, question: str, **extra):
+        return cls(
+            score=1,
+            feedback=question,
+            strengths=[],
+            improvements=[],
+            key_points_covered=[],
+            key_points_missed=[],
+            **extra
+        )
+
+    async def ainvoke(self, inputs):
+        await asyncio.sleep(random.uniform(0, 0.003))
+        return self._respond(inputs)
+
+    def _respond(self, inputs):
+        if not self.batch:
+            return self._evaluation(exam.AnswerEvaluation, inputs["question"])
+        blocks = re.findall(r"### Question (\d+)\nQuestion: (.*)\n", inputs["answers"])
+        return exam.BatchEvaluation(evaluations=[
+            self._evaluation(exam.NumberedAnswerEvaluation, question, question_number=int(number))
+            for number, question in blocks
+        ])
+
+
+def make_exam(exam_index: int) -> dict:
+    exam_data = [
+        {
+            "question_number": n,
+            "question": f"Exam {exam_index} question {n}: explain concept c{exam_index}x{n}",
+            "question_type": "conceptual",
+            "difficulty": "medium",
+            "marks": 5,
+            "key_points": [f"concept c{exam_index}x{n} definition"],
+            "sample_answer": f"Concept c{exam_index}x{n} is defined as follows."
+        }
+        for n in range(1, QUESTIONS_PER_EXAM + 1)
+    ]
+    return {"exam_data": exam_data, "topic": f"Topic {exam_index}", "subject": "DataMining", "total_marks": 30}
+
+
+@pytest.mark.parametrize("batch_mode", [False, True])
+def test_interleaved_submissions_are_graded_against_their_own_exam(monkeypatch, batch_mode):
+    monkeypatch.setattr(exam, "evaluation_chain", StubEvaluationChain(batch=False))
+    monkeypatch.setattr(exam, "batch_evaluation_chain", StubEvaluationChain(batch=True))
+    exam_system = exam.ExamSystem()
+    exams = [make_exam(i) for i in range(NUM_EXAMS)]
+
+    async def submit_all():
+        submissions = []
+        for s in range(SUBMISSIONS):
+            exam_index = random.randrange(NUM_EXAMS)
+            answers = [
+                {
+                    "question_number": q["question_number"],
+                    "answer": f"{q['key_points'][0]} explained by student {s} in mode {batch_mode}"
+                }
+                for q in exams[exam_index]["exam_data"]
+            ]
+            submissions.append((exam_index, exam_system.evaluate_exam_async(
+                f"exam-{exam_index}", exams[exam_index], answers, batch_mode=batch_mode
+            )))
+        results = await asyncio.gather(*[coro for _, coro in submissions])
+        return [(exam_index, result) for (exam_index, _), result in zip(submissions, results)]
+
+    results = asyncio.run(submit_all())
+
+    assert len(results) == SUBMISSIONS
+    for exam_index, result in results:
+        assert result["success"]
+        assert result["exam_id"] == f"exam-{exam_index}"
+        assert result["topic"] == f"Topic {exam_index}"
+        expected = {q["question_number"]: q["question"] for q in exams[exam_index]["exam_data"]}
+        assert [e["question_number"] for e in result["evaluations"]] == sorted(expected)
+        for evaluation in result["evaluations"]:
+            assert evaluation["success"]
+            assert evaluation["feedback"] == expected[evaluation["question_number"]]
+
+
+def test_resumed_bulk_grading_skips_answers_already_graded(monkeypatch, tmp_path):
+    chain = StubEvaluationChain(batch=False)
+    calls = []
+    original = chain.ainvoke
+    async def counting(inputs):
+        calls.append(inputs["question"])
+        return await original(inputs)
+    chain.ainvoke = counting
+    monkeypatch.setattr(exam, "evaluation_chain", chain)
+    exam_system = exam.ExamSystem()
+    exam_system.evaluation_cache = EvaluationCache(str(tmp_path / "cache.db"))
+    exam_def = make_exam(900)
+    submissions = {
+        f"s{s}": [{"question_number": q["question_number"], "answer": f"resumed answer by student {s} to {q['question']}"}
+                  for q in exam_def["exam_data"]]
+        for s in range(2)
+    }
+    earlier = {"question_number": 1, "score": 5, "max_marks": 5, "feedback": "graded before the restart", "success": True}
+    graded = {"s0": {"1": earlier}}
+
+    result = asyncio.run(exam_system.grade_submissions_async(
+        "exam-900", exam_def, submissions, batch_mode=False, graded=graded
+    ))
+
+    assert len(calls) == 2 * QUESTIONS_PER_EXAM - 1
+    assert result["answers_resumed"] == 1
+    assert result["results"]["s0"]["evaluations"][0]["feedback"] == "graded before the restart"
+    assert len(result["results"]["s0"]["evaluations"]) == QUESTIONS_PER_EXAM
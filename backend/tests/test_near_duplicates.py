@@ -0,0 +1,65 @@
+from near_duplicates import MinHasher, NearDuplicateDetector, SignatureIndex, generate_unique
+
+HANDSHAKE = "What is the purpose of the TCP three-way handshake?"
+
+
+def test_paraphrased_question_is_a_duplicate_distinct_ones_are_not():
+    detector = NearDuplicateDetector(loader=lambda subject: [HANDSHAKE] if subject == "Network" else [])
+    session = detector.session("Network")
+
+    assert not session.accept("Explain the purpose of the TCP three-way handshake.")
+    assert session.accept("What is the purpose of the TCP sliding window?")
+    assert session.accept("How does a DNS resolver cache responses?")
+    # Items in the same set are checked against each other too
+    assert not session.accept("How does a DNS resolver cache its responses?")
+    # Other subjects have their own index
+    assert detector.session("Distributed").accept("Explain the purpose of the TCP three-way handshake.")
+    assert detector.stats()["duplicates"] == 2
+
+
+def test_embeddings_confirm_rewordings_below_the_minhash_threshold():
+    reworded = "What is the purpose of the three-way handshake in TCP?"
+    vectors = {HANDSHAKE: [1.0, 0.0], reworded: [0.99, 0.05]}
+    embedded = []
+
+    def embed(texts):
+        embedded.extend(texts)
+        return [vectors[text] for text in texts]
+
+    assert NearDuplicateDetector(loader=lambda _: [HANDSHAKE]).session(None).accept(reworded)
+    detector = NearDuplicateDetector(embed_fn=embed, loader=lambda _: [HANDSHAKE])
+    assert not detector.session(None).accept(reworded)
+    assert sorted(embedded) == sorted([HANDSHAKE, reworded])
+
+
+def test_index_evicts_oldest_items_beyond_max_items():
+    hasher = MinHasher()
+    index = SignatureIndex(max_items=2)
+    texts = [HANDSHAKE, "How does a DNS resolver cache responses?", "What does ARP map addresses to?"]
+    for text in texts:
+        index.add(hasher.signature(text), text)
+
+    assert len(index) == 2
+    assert index.candidates(hasher.signature(texts[0])) == []
+    assert [item["text"] for item in index.candidates(hasher.signature(texts[2]))] == [texts[2]]
+
+
+def test_only_slots_lost_to_duplicates_are_regenerated():
+    session = NearDuplicateDetector().session("Network")
+    batches = [
+        [HANDSHAKE, "Explain the purpose of the TCP three-way handshake.", "How does a DNS resolver cache responses?"],
+        ["What does ARP map addresses to?"],
+    ]
+    requested = []
+
+    def generate(n):
+        requested.append(n)
+        return batches[len(requested) - 1]
+
+    items = generate_unique(generate, 3, session, lambda text: text)
+    assert requested == [3, 1]
+    assert items == [HANDSHAKE, "How does a DNS resolver cache responses?", "What does ARP map addresses to?"]
+    # Nothing reaches the subject index until the set is committed
+    assert session.detector.stats()["indexed"] == {"Network": 0}
+    session.commit()
+    assert session.detector.stats()["indexed"] == {"Network": 3}
@@ -0,0 +1,40 @@
+import pytest
+
+from pre_grader import pre_grade
+
+QUESTION = {
+    "question_number": 3,
+    "question": "Explain how TCP establishes a connection between two hosts.",
+    "marks": 6,
+    "key_points": ["three-way handshake", "SYN and ACK flags", "sequence numbers synchronised"],
+    "sample_answer": "TCP uses a three-way handshake: SYN, SYN-ACK and ACK, synchronising sequence numbers."
+}
+
+
+def test_sample_answer_gets_full_marks_ignoring_case_and_spacing():
+    result = pre_grade(QUESTION, "  tcp uses a THREE-WAY handshake: SYN, SYN-ACK and ACK, synchronising sequence numbers.")
+    assert result["score"] == 6 and result["pre_graded"]
+    assert result["key_points_covered"] == QUESTION["key_points"]
+
+
+@pytest.mark.parametrize("answer, feedback", [
+    ("", "No answer was provided."),
+    ("I don't know.", "No answer was provided."),
+    ("Packets", "The answer is too short to address the question."),
+    ("TCP establishes a connection between two hosts", "The answer restates the question without answering it."),
+    ("Photosynthesis converts sunlight into chemical energy inside chloroplasts",
+     "The answer does not address the topic of the question."),
+])
+def test_clear_cut_wrong_answers_get_zero(answer, feedback):
+    result = pre_grade(QUESTION, answer)
+    assert result["score"] == 0 and result["feedback"] == feedback
+    assert result["key_points_covered"] == []
+
+
+@pytest.mark.parametrize("answer", [
+    "Three-way handshake",  # Short, but names a key point
+    "The client sends SYN, the server answers, then a three-way handshake completes the setup",
+    "The hosts exchange packets and agree on settings before sending data",  # On topic, no key point
+])
+def test_other_answers_are_left_to_the_llm(answer):
+    assert pre_grade(QUESTION, answer) is None
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+for module in ("cv2", "mediapipe", "ultralytics", "pyaudio"):
+    pytest.importorskip(module)
+
+import proctoring
+from proctoring import (
+    ProctoringCapacityError, ProctoringSession, ProctoringSourceError, ProctoringSourceInUseError, ProctoringSystem
+)
+import api.proctoring as api
+from storage import ConnectionPool, SQLiteStore
+
+
+@pytest.fixture
+def make_system(monkeypatch, tmp_path):
+    # Recordings land in the working directory; keep audio threads off the test host's microphone
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ProctoringSession, "detect_sound", lambda self: None)
+    monkeypatch.setattr(proctoring, "PROCTORING_CAMERA_SOURCES", ["0", "1", "rtsp://cameras/room-2"])
+    systems = []
+
+    def make(max_sessions=4):
+        systems.append(ProctoringSystem(max_sessions=max_sessions))
+        return systems[-1]
+    yield make
+    for system in systems:
+        system.stop_all()
+
+
+def test_students_get_their_own_session_camera_and_samples(make_system):
+    system = make_system()
+    alice = system.start_session("alice", 60)
+    bob = system.start_session("bob", 60)
+
+    assert alice is not bob
+    assert (alice.camera_source, bob.camera_source) == (0, 1)
+    assert system.start_session("alice", 60) is alice
+
+    system.record_sample("alice", 1.5, True)
+    system.record_sample("alice", 2.0, False)
+    assert system.get_user_data("alice") == [(1.5, True), (2.0, False)]
+    assert system.get_user_data("bob") == []
+    assert system.get_user_summary("alice") == {"entries": 2, "cheating": 1, "duration": 2.0}
+
+    system.stop_session("bob")
+    assert [s.username for s in system.active_sessions()] == ["alice"]
+    assert alice.video_feed_active
+
+
+def test_sessions_are_capped_and_only_allowed_free_cameras_open(make_system):
+    full = make_system(max_sessions=1)
+    full.start_session("alice", 60)
+    with pytest.raises(ProctoringCapacityError):
+        full.start_session("bob", 60)
+
+    system = make_system()
+    system.start_session("carol", 60, "1")
+    with pytest.raises(ProctoringSourceInUseError):
+        system.start_session("dave", 60, "1")
+    for source in ("/etc/passwd", "http://attacker.example/stream"):
+        with pytest.raises(ProctoringSourceError):
+            system.start_session("dave", 60, source)
+    assert system.start_session("dave", 60, "rtsp://cameras/room-2").camera_source == "rtsp://cameras/room-2"
+    # The only configured camera left is device 0
+    assert system.start_session("erin", 60).camera_source == 0
+    with pytest.raises(ProctoringSourceInUseError):
+        system.start_session("frank", 60)
+
+
+def test_lease_passes_to_another_worker_once_released_or_stale(monkeypatch, tmp_path):
+    monkeypatch.setattr(api, "proctoring_state", SQLiteStore("proctoring_state", ConnectionPool(str(tmp_path / "state.db"))))
+
+    monkeypatch.setattr(api, "WORKER_ID", "worker-a")
+    assert api.claim_session("alice", 60) is None
+    monkeypatch.setattr(api, "WORKER_ID", "worker-b")
+    assert api.claim_session("alice", 60)["owner"] == "worker-a"
+    api.release_session("alice")  # Not worker-b's to release
+    assert api.remote_lease("alice")["owner"] == "worker-a"
+
+    monkeypatch.setattr(api, "WORKER_ID", "worker-a")
+    api.release_session("alice")
+    assert "alice" not in api.proctoring_state
+
+    monkeypatch.setattr(api, "WORKER_ID", "worker-b")
+    assert api.claim_session("alice", 60) is None
+    api.proctoring_state.update("alice", lambda lease: lease.update(heartbeat_at=time.time() - 3600))
+    monkeypatch.setattr(api, "WORKER_ID", "worker-a")
+    assert api.claim_session("alice", 60) is None
+    assert api.proctoring_state["alice"]["owner"] == "worker-a"
+
+
+def test_recordings_are_paged_from_the_index_not_the_directory(make_system, monkeypatch, tmp_path):
+    # A recording saved before this process started is indexed at startup
+    os.makedirs(tmp_path / "cheating_recordings")
+    (tmp_path / "cheating_recordings" / "cheating_alice_old.mp4").write_bytes(b"x" * 10)
+    system = make_system()
+    monkeypatch.setattr(api, "proctoring_system", system)
+    path = os.path.join(system.RECORDING_DIR, "cheating_bob_new.mp4")
+    with open(path, "wb") as clip:
+        clip.write(b"y")
+    os.utime(path, (time.time() + 60, time.time() + 60))
+    system.index_recording(path)
+
+    monkeypatch.setattr(os, "scandir", lambda *args: pytest.fail("listing scanned the directory"))
+
+    def listing(cursor=None):
+        response = asyncio.run(api.list_recordings(
+            cursor=cursor, limit=1, created_after=None, created_before=None, fields=None
+        ))
+        return json.loads(response.body)
+    first = listing()
+    assert [r["filename"] for r in first["recordings"]] == ["cheating_alice_old.mp4"] and first["total"] == 2
+    second = listing(first["next_cursor"])
+    assert [r["filename"] for r in second["recordings"]] == ["cheating_bob_new.mp4"]
+    assert second["next_cursor"] is None
+
+    asyncio.run(api.delete_recording("cheating_bob_new.mp4"))
+    assert listing()["total"] == 1
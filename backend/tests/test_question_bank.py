@@ -0,0 +1,111 @@
+import os
+import threading
+
+import pytest
+
+# QuizSystem builds its chains at import
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import question_bank
+import quiz
+from question_bank import BankRefiller, QuestionBank, bank_key, question_id
+
+KEY = bank_key("Network", "TCP handshake", None)
+
+
+def make_questions(n, start=0):
+    return [
+        {
+            "question": f"Question {i} about the TCP handshake?",
+            "options": ["A. SYN", "B. ACK", "C. FIN", "D. RST"],
+            "correct_answer": "A",
+            "explanation": "The client opens with SYN.",
+            "difficulty": "easy"
+        }
+        for i in range(start, start + n)
+    ]
+
+
+@pytest.fixture
+def bank(tmp_path):
+    return QuestionBank(str(tmp_path / "bank.db"))
+
+
+@pytest.fixture
+def quiz_system(monkeypatch, tmp_path):
+    monkeypatch.setattr(quiz, "QuestionBank", lambda: QuestionBank(str(tmp_path / "bank.db")))
+    system = quiz.QuizSystem()
+    scheduled = []
+    monkeypatch.setattr(system.refiller, "schedule", scheduled.append)
+    return system, scheduled
+
+
+def test_students_are_not_served_questions_they_saw_recently(bank):
+    assert bank.add(KEY, make_questions(6)) == 6
+    assert bank.add(KEY, make_questions(2)) == 0  # Same text, same ID
+
+    first = bank.sample(KEY, 4, "alice")
+    bank.record_served("alice", [q["question_id"] for q in first])
+    rest = bank.sample(KEY, 4, "alice")
+    assert len(rest) == 2
+    assert not {q["question_id"] for q in rest} & {q["question_id"] for q in first}
+    assert len(bank.sample(KEY, 4, "bob")) == 4
+
+
+def test_history_keeps_only_the_most_recent_questions(monkeypatch, bank):
+    monkeypatch.setattr(question_bank, "HISTORY_SIZE", 3)
+    questions = make_questions(5)
+    bank.add(KEY, questions)
+    ids = [question_id(KEY, q) for q in questions]
+    for i, qid in enumerate(ids):
+        monkeypatch.setattr(question_bank.time, "time", lambda i=i: 1000.0 + i)
+        bank.record_served("alice", [qid])
+
+    # The two served first have left the window and can be served again
+    assert sorted(q["question_id"] for q in bank.sample(KEY, 5, "alice")) == sorted(ids[:2])
+
+
+def test_low_partitions_are_refilled_once_while_a_refill_is_pending(monkeypatch, bank):
+    monkeypatch.setattr(question_bank, "LOW_WATERMARK", 5)
+    monkeypatch.setattr(question_bank, "REFILL_BATCH", 4)
+    release = threading.Event()
+    calls = []
+
+    def generate(key, n):
+        calls.append(key)
+        release.wait(5)
+        return make_questions(n, start=len(calls) * n)
+    refiller = BankRefiller(bank, generate)
+
+    refiller.schedule_if_low(KEY)
+    refiller.schedule_if_low(KEY)
+    release.set()
+    refiller._queue.join()
+    assert calls == [KEY] and bank.count(KEY) == 4
+
+    refiller.schedule_if_low(KEY)
+    refiller._queue.join()
+    assert bank.count(KEY) == 8
+    # At the watermark nothing more is generated
+    refiller.schedule_if_low(KEY)
+    refiller._queue.join()
+    assert len(calls) == 2
+
+
+def test_quizzes_come_from_the_bank_until_the_student_has_seen_it(monkeypatch, quiz_system):
+    system, scheduled = quiz_system
+    system.bank.add(KEY, make_questions(8))
+    monkeypatch.setattr(system, "_generate_unique", lambda *args: pytest.fail("generated with a stocked bank"))
+
+    first = system.generate_quiz("TCP handshake", "Network", 4, student_id="alice")
+    second = system.generate_quiz("TCP handshake", "Network", 4, student_id="alice")
+    assert first["source"] == second["source"] == "bank"
+    assert len({q["question_id"] for q in first["quiz_data"] + second["quiz_data"]}) == 8
+    # Eight banked questions are below the watermark: each quiz asks for a refill
+    assert scheduled == [KEY, KEY]
+
+    monkeypatch.setattr(system, "_generate_unique", lambda *args: (make_questions(4, start=100), {"subject": "Network"}))
+    third = system.generate_quiz("TCP handshake", "Network", 4, student_id="alice")
+    assert third["source"] == "generated"
+    assert system.bank.count(KEY) == 12
+    assert system.bank.sample(KEY, 4, "alice") == []
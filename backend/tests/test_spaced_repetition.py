@@ -0,0 +1,54 @@
+from spaced_repetition import DAY_SECONDS, SpacedRepetitionScheduler, open_schedule_store
+
+NOW = 1_000_000.0
+
+
+def test_intervals_grow_and_lapses_reset():
+    scheduler = SpacedRepetitionScheduler()
+    scheduler.add_cards("alice", ["c1"], now=NOW)
+
+    first = scheduler.review("alice", "c1", difficulty_rating=2, now=NOW)
+    second = scheduler.review("alice", "c1", difficulty_rating=2, now=first["due_at"])
+    third = scheduler.review("alice", "c1", difficulty_rating=2, now=second["due_at"])
+    assert (first["interval_days"], second["interval_days"]) == (1.0, 6.0)
+    assert third["interval_days"] > 6.0
+
+    lapse = scheduler.review("alice", "c1", difficulty_rating=5, now=third["due_at"])
+    assert lapse["repetitions"] == 0 and lapse["lapses"] == 1
+    assert lapse["due_at"] - third["due_at"] < DAY_SECONDS
+    assert lapse["ease"] < third["ease"]
+
+
+def test_due_cards_are_most_overdue_first_and_skip_rescheduled():
+    scheduler = SpacedRepetitionScheduler()
+    cards = [f"c{i}" for i in range(20_000)]
+    scheduler.add_cards("bob", cards, now=NOW)
+    # Review every card but the last ten; they move a day or more into the future
+    for card in cards[:-10]:
+        scheduler.review("bob", card, difficulty_rating=1, now=NOW + 1)
+
+    due = scheduler.due_cards("bob", limit=50, now=NOW + 60)
+    assert [d["card_id"] for d in due] == cards[-10:]
+    # Peeking does not consume the queue, and other students are separate
+    assert len(scheduler.due_cards("bob", limit=50, now=NOW + 60)) == 10
+    assert scheduler.due_cards("carol", limit=50, now=NOW + 60) == []
+    assert scheduler.next_due_at("bob") == NOW
+    assert scheduler.stats()["scheduled_cards"] == len(cards)
+
+
+def test_removed_cards_are_no_longer_due():
+    scheduler = SpacedRepetitionScheduler()
+    scheduler.add_cards("dan", ["set1:0", "set1:1", "set2:0"], now=NOW)
+    scheduler.remove_cards(["set1:0", "set1:1"])
+    assert [d["card_id"] for d in scheduler.due_cards("dan", limit=10, now=NOW)] == ["set2:0"]
+
+
+def test_schedules_live_in_the_store():
+    store = open_schedule_store()
+    SpacedRepetitionScheduler(store).add_cards("erin", ["c1", "c2"], now=NOW)
+    SpacedRepetitionScheduler(store).review("erin", "c1", difficulty_rating=2, now=NOW)
+    # A new scheduler over the same store (another worker, or after a restart) sees both
+    restarted = SpacedRepetitionScheduler(store)
+    assert [d["card_id"] for d in restarted.due_cards("erin", limit=10, now=NOW)] == ["c2"]
+    assert restarted.card_states("erin", ["c1"])["c1"]["repetitions"] == 1
+    assert restarted.add_cards("erin", ["c1", "c2", "c3"], now=NOW) == 1
@@ -0,0 +1,204 @@
+import asyncio
+import threading
+import time
+from array import array
+
+import pytest
+
+import storage
+from storage import (
+    ConnectionPool, InMemoryStore, PoolExhaustedError, SQLiteAggregates, SQLiteStore, Store, off_loop, write_behind
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    pool = ConnectionPool(str(tmp_path / "test.db"))
+
+    def make(name, indexes=()):
+        if request.param == "sqlite":
+            return SQLiteStore(name, pool, indexes)
+        return InMemoryStore(name, indexes)
+    return make
+
+
+def test_records_round_trip_and_indexes_follow_writes(make_store):
+    sessions = make_store("sessions", indexes=("exam_id",))
+    sessions["s1"] = {"exam_id": "e1", "ratings": array("B", [1, 5])}
+    sessions["s2"] = {"exam_id": "e1", "ratings": array("B")}
+    with sessions.batch() as batch:
+        batch["s3"] = {"exam_id": "e2", "ratings": array("B", [3])}
+
+    assert sessions["s1"]["ratings"] == array("B", [1, 5])
+    assert sorted(sessions.keys_where("exam_id", "e1")) == ["s1", "s2"]
+
+    moved = sessions["s2"]
+    moved["exam_id"] = "e2"
+    sessions["s2"] = moved
+    del sessions["s1"]
+    assert sessions.keys_where("exam_id", "e1") == []
+    assert sorted(sessions.keys_where("exam_id", "e2")) == ["s2", "s3"]
+    assert len(sessions) == 2 and "s1" not in sessions
+
+
+def test_discard_deletes_only_records_that_pass_the_check(make_store):
+    leases = make_store("leases")
+    leases["alice"] = {"owner": "worker-a"}
+    assert not leases.discard("alice", lambda lease: lease["owner"] == "worker-b")
+    assert not leases.discard("bob", lambda lease: True)
+    assert leases.discard("alice", lambda lease: lease["owner"] == "worker-a")
+    assert "alice" not in leases
+
+
+def test_batched_reads_and_inserts_keep_existing_records(make_store):
+    cards = make_store("cards")
+    cards["c1"] = {"interval": 6}
+    assert cards.get_many(["c1", "c2"]) == {"c1": {"interval": 6}}
+    assert cards.add_many({"c1": {"interval": 0}, "c2": {"interval": 0}, "c3": {"interval": 0}}) == 2
+    assert cards.get_many(["c1", "c2", "c3"]) == {"c1": {"interval": 6}, "c2": {"interval": 0}, "c3": {"interval": 0}}
+    assert cards.add_many({}) == 0
+
+
+def test_sqlite_stores_share_state_between_instances(tmp_path):
+    path = str(tmp_path / "shared.db")
+    first = SQLiteStore("exams", ConnectionPool(path))
+    second = SQLiteStore("exams", ConnectionPool(path))
+    first["e1"] = {"status": "complete"}
+    assert second["e1"] == {"status": "complete"}
+
+    totals = SQLiteAggregates("exam", ConnectionPool(path))
+    other = SQLiteAggregates("exam", ConnectionPool(path))
+    totals.observe("percentage", 80)
+    other.observe("percentage", 60)
+    other.incr("submitted_sessions")
+    assert totals.mean("percentage") == 70
+    assert totals.count("submitted_sessions") == 1
+    totals.unobserve("percentage", 80)
+    other.unobserve("percentage", 60)
+    assert totals.snapshot()["means"]["percentage"] == 0
+
+
+def test_concurrent_updates_from_two_workers_keep_every_append(tmp_path):
+    path = str(tmp_path / "shared.db")
+    workers = [SQLiteStore("chat", ConnectionPool(path)) for _ in range(2)]
+    assert workers[0].add("c1", {"messages": []})
+    assert not workers[1].add("c1", {"messages": ["lost"]})
+
+    def append(store, worker):
+        for i in range(25):
+            store.update("c1", lambda session: session["messages"].append(f"{worker}-{i}"), retries=100)
+
+    threads = [threading.Thread(target=append, args=(store, n)) for n, store in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(workers[0]["c1"]["messages"]) == 50
+
+    with pytest.raises(KeyError):
+        workers[1].update("missing", lambda session: None)
+
+
+def test_sweep_archives_idle_records_then_least_recently_used(make_store, tmp_path):
+    sessions = make_store("chats")
+    sessions.archive = SQLiteStore("archive_chats", ConnectionPool(str(tmp_path / "archive.db")))
+    sessions.ttl_seconds = 60
+    for key in ("a", "b", "c"):
+        sessions[key] = {"messages": [key]}
+    assert sessions.sweep() == 0
+
+    evicted = []
+    sessions.on_evict = lambda key, record: evicted.append(key)
+    assert sessions.sweep(now=time.time() + 120) == 3
+    assert len(sessions) == 0 and sorted(evicted) == ["a", "b", "c"]
+    assert sessions.archive["b"] == {"messages": ["b"]}
+
+    sessions.ttl_seconds = 0
+    sessions.max_items = 2
+    for key in ("d", "e", "f"):
+        sessions[key] = {"messages": []}
+        time.sleep(0.01)
+    sessions.sweep()
+    assert sorted(sessions) == ["e", "f"]
+    assert "d" in sessions.archive
+
+
+def test_memory_store_cap_evicts_least_recently_read_after_the_write(monkeypatch):
+    monkeypatch.setattr(storage, "_stores", [])
+    monkeypatch.setattr(storage, "STORAGE_ARCHIVE_PATH", "")
+    evicted = []
+    sessions = storage._register(InMemoryStore("quizzes", max_items=2, on_evict=lambda key, _: evicted.append(key)))
+    sessions["a"] = {}
+    sessions["b"] = {}
+
+    def write():
+        sessions["a"]
+        sessions["c"] = {}
+        # Still over the cap inside the call: nothing is evicted mid-write
+        assert len(sessions) == 3 and sessions.overfull
+    asyncio.run(storage.run_storage(write))
+    assert sorted(sessions) == ["a", "c"] and evicted == ["b"]
+    assert not sessions.overfull
+    assert sessions.stats()["estimated_bytes"] > 0
+
+
+def test_pages_follow_creation_order_with_filters(tmp_path):
+    for store in (InMemoryStore("sets", ("subject",), order_by="created_at"),
+                  SQLiteStore("sets", ConnectionPool(str(tmp_path / "pages.db")), ("subject",),
+                              order_by="created_at")):
+        # Inserted out of order; two records share a timestamp
+        for i in (3, 1, 4, 0, 2):
+            store[f"k{i}"] = {"created_at": f"2024-01-0{1 + i // 2}", "subject": "Network" if i % 2 else "Energy"}
+
+        first = store.page(limit=2)
+        assert [key for key, _ in first] == ["k0", "k1"]
+        after = (store.order_value(first[-1][1]), first[-1][0])
+        assert [key for key, _ in store.page(after, limit=10)] == ["k2", "k3", "k4"]
+        assert [key for key, _ in store.page(where={"subject": "Network"})] == ["k1", "k3"]
+        assert [key for key, _ in store.page(since="2024-01-02", until="2024-01-03")] == ["k2", "k3"]
+
+        del store["k2"]
+        assert [key for key, _ in store.page(after, limit=10)] == ["k3", "k4"]
+
+        # Changing an indexed value moves the record between filtered pages
+        store["k0"] = {"created_at": "2024-01-01", "subject": "Network"}
+        assert [key for key, _ in store.page(where={"subject": "Network"})] == ["k0", "k1", "k3"]
+        assert [key for key, _ in store.page(where={"subject": "Energy"})] == ["k4"]
+
+
+def test_backends_must_implement_every_store_method():
+    with pytest.raises(TypeError):
+        Store("incomplete")
+
+
+def test_sqlite_calls_from_async_code_run_off_the_event_loop(monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", "sqlite")
+    jobs = SQLiteStore("jobs", ConnectionPool(str(tmp_path / "test.db")))
+
+    @off_loop
+    def handler(job_id):
+        jobs[job_id] = {"thread": threading.current_thread().name}
+        return jobs[job_id]
+
+    async def scenario():
+        record = await handler("j1")
+        # Queued writes land in order
+        for n in range(5):
+            saved = write_behind(jobs, "j2", {"n": n})
+        await asyncio.wrap_future(saved)
+        return threading.current_thread().name, record
+
+    loop_thread, record = asyncio.run(scenario())
+    assert record["thread"].startswith("storage") and record["thread"] != loop_thread
+    assert jobs["j2"] == {"n": 4}
+
+
+def test_pool_gives_up_when_every_connection_stays_busy(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=1, timeout=0.05)
+    with pool.connection():
+        with pytest.raises(PoolExhaustedError):
+            with pool.connection():
+                pass
+    # The held connection went back to the pool
+    with pool.connection() as conn:
+        assert conn.execute("SELECT 1").fetchone() == (1,)
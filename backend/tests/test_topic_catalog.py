@@ -0,0 +1,71 @@
+import json
+
+from storage import ConnectionPool, InMemoryStore, SQLiteStore
+from topic_catalog import TopicCatalog, has_material, topic_suggestions, tokenize
+
+CHUNK = """Training Neural Networks
+
+Gradient descent updates the weights of a neural network by stepping against the
+gradient of the loss. The learning rate controls the step size; a learning rate that
+is too large makes gradient descent diverge. Stochastic gradient descent estimates the
+gradient from mini-batches, and momentum smooths the gradient descent updates.
+"""
+
+
+def make_catalog(tmp_path, store=None):
+    store = store if store is not None else InMemoryStore("topic_catalog", order_by="created_at")
+    catalog = TopicCatalog(store, str(tmp_path / "none.json"))
+    catalog.add_chunks("ML", [("c1", CHUNK)])
+    return catalog
+
+
+def test_topics_phrased_differently_from_catalogue_keys_are_known(tmp_path):
+    catalog = make_catalog(tmp_path)
+    for topic in ["gradient descent", "neural network training",
+                  "gradient descent for neural networks", "learning rate"]:
+        coverage = catalog.match(topic, "ML")
+        assert coverage["known"], topic
+        assert coverage["coverage"] == 1.0
+
+
+def test_partly_covered_topics_generate_with_suggestions(tmp_path):
+    catalog = make_catalog(tmp_path)
+    coverage = catalog.match("gradient boosting trees", "ML")
+    assert coverage["known"] is False and 0 < coverage["coverage"] < 0.5
+    assert has_material(coverage)
+    assert topic_suggestions(coverage)
+
+    unknown = catalog.match("photosynthesis", "ML")
+    assert unknown["coverage"] == 0 and not has_material(unknown)
+
+
+def test_workers_sharing_a_store_see_each_others_topics(tmp_path):
+    def shared_store():
+        return SQLiteStore("topic_catalog", ConnectionPool(str(tmp_path / "reviso.db")), order_by="created_at")
+
+    first = make_catalog(tmp_path, shared_store())
+    second = TopicCatalog(shared_store(), str(tmp_path / "none.json"))
+    assert second.match("learning rate", "ML")["known"]
+
+    first.add_chunks("DB", [("c2", "Hash Tables\n\nA hash table maps keys to buckets; hash table lookups take constant time.")])
+    assert not second.has_subject("DB")
+    assert second.refresh() == 1 and second.refresh() == 0
+    assert second.match("hash tables", "DB")["known"]
+    assert second.match("learning rate", "ML")["chunk_count"] == first.match("learning rate", "ML")["chunk_count"]
+
+
+def test_catalogue_file_from_earlier_versions_is_imported_once(tmp_path):
+    legacy = make_catalog(tmp_path)
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps({"subjects": legacy._subjects, "vocabulary": legacy._vocabulary}))
+    store = InMemoryStore("topic_catalog", order_by="created_at")
+
+    TopicCatalog(store, str(path))
+    restarted = TopicCatalog(store, str(path))
+    assert len(store) == 1
+    assert restarted.match("learning rate", "ML")["chunk_count"] == 1
+
+
+def test_domain_words_are_not_stopwords():
+    assert tokenize("Introduction to Databases") == ["introduction", "database"]
+    assert tokenize("Hash Tables") == ["hash", "table"]
@@ -0,0 +1,425 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import Counter
+from difflib import get_close_matches
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from storage import InMemoryStore, Store, open_store
+
+# Catalogue file written by earlier versions; imported into the store once (override with TOPIC_CATALOG_PATH)
+CATALOG_PATH = os.getenv(
+    "TOPIC_CATALOG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "topic_catalog.json")
+)
+# How often each worker picks up topics catalogued by the others
+TOPIC_CATALOG_REFRESH_SECONDS = int(os.getenv("TOPIC_CATALOG_REFRESH_SECONDS", "10"))
+# Updates are re-read this far back, so one committed late by another worker is not skipped
+CATALOG_REFRESH_WINDOW_SECONDS = 60
+CATALOG_REFRESH_PAGE = 500
+
+MAX_REPRESENTATIVE_CHUNKS = 5
+KEYPHRASES_PER_CHUNK = 8
+MAX_HEADING_WORDS = 8
+# Share of a topic's words that must appear in the catalogue for it to count as known.
+# Topics below this (but above zero) still generate, with suggestions attached.
+TOPIC_MATCH_THRESHOLD = float(os.getenv("TOPIC_MATCH_THRESHOLD", "0.5"))
+
+STOPWORDS = {
+    "a", "about", "above", "after", "again", "all", "also", "an", "and", "any", "are", "as", "at",
+    "be", "because", "been", "before", "being", "between", "both", "but", "by", "can", "could",
+    "did", "do", "does", "doing", "each", "etc", "for", "from", "further", "had", "has", "have",
+    "having", "here", "how", "however", "if", "in", "into", "is", "it", "its", "itself", "just",
+    "may", "more", "most", "must", "no", "nor", "not", "of", "on", "once", "one", "only", "or",
+    "other", "our", "out", "over", "own", "same", "shall", "should", "so", "some", "such", "than",
+    "that", "the", "their", "them", "then", "there", "these", "they", "this", "those", "through",
+    "to", "too", "two", "under", "until", "up", "use", "used", "using", "very", "was", "we", "were",
+    "what", "when", "where", "which", "while", "who", "why", "will", "with", "would", "you", "your",
+    # Document furniture only: words like "table" or "introduction" name real topics
+    "chapter", "page", "fig",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9\-]*")
+_SENTENCE_SPLIT_RE = re.compile(r"[.;:!?,()\n]+")
+_NUMBERED_HEADING_RE = re.compile(r"^(\d+(\.\d+)*|[ivxlc]+\.|[a-z]\))\s+\S", re.IGNORECASE)
+
+
+def _singular(token: str) -> str:
+    """Cheap plural folding so 'trees' and 'tree' share a catalogue entry"""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase content tokens with stopwords removed and plurals folded"""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        token = token.strip("-")
+        if len(token) < 2 or token in STOPWORDS or token.isdigit():
+            continue
+        tokens.append(_singular(token))
+    return tokens
+
+
+def normalize_topic(text: str) -> str:
+    """Canonical catalogue key for a free-text topic"""
+    return " ".join(tokenize(text))
+
+
+def extract_headings(text: str) -> List[str]:
+    """Pick out heading-like lines (numbered, title case or upper case, short, no sentence end)"""
+    headings = []
+    for line in text.splitlines():
+        line = line.strip().strip(":").strip()
+        words = line.split()
+        if not words or len(words) > MAX_HEADING_WORDS or len(line) > 80:
+            continue
+        if line.endswith((".", ",", ";", "?")):
+            continue
+
+        alpha_words = [w for w in words if w[0].isalpha()]
+        if not alpha_words:
+            continue
+
+        numbered = bool(_NUMBERED_HEADING_RE.match(line))
+        upper = line.isupper() and len(line) > 3
+        capitalized = sum(1 for w in alpha_words if w[0].isupper()) / len(alpha_words) >= 0.6
+
+        if numbered or upper or (capitalized and len(alpha_words) >= 2):
+            heading = _NUMBERED_HEADING_RE.sub(lambda m: m.group(0)[-1], line) if numbered else line
+            if normalize_topic(heading):
+                headings.append(heading)
+    return headings
+
+
+def extract_keyphrases(text: str, limit: int = KEYPHRASES_PER_CHUNK) -> List[str]:
+    """Most frequent content unigrams and adjacent bigrams in a chunk"""
+    counts: Counter = Counter()
+    for sentence in _SENTENCE_SPLIT_RE.split(text.lower()):
+        previous = None
+        for raw in _TOKEN_RE.findall(sentence):
+            raw = raw.strip("-")
+            if len(raw) < 2 or raw in STOPWORDS or raw.isdigit():
+                previous = None
+                continue
+            token = _singular(raw)
+            if len(token) >= 4:
+                counts[token] += 1
+            if previous:
+                # Bigrams carry more topical signal than single words
+                counts[f"{previous} {token}"] += 2
+            previous = token
+
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], -len(item[0]), item[0]))
+    return [phrase for phrase, count in ranked if count > 1][:limit]
+
+
+class TopicCatalog:
+    """
+    Per-subject catalogue of topics found in ingested chunks.
+
+    Each entry maps a normalized topic key to its display label, the number of
+    chunks mentioning it and a few representative chunk IDs. A per-subject
+    vocabulary counts the chunks each content word appears in, so topics that
+    are not a catalogue key can still be matched word by word. Lookups are served
+    from sorted in-memory indexes so autocomplete and validation never touch the
+    vector store or an LLM.
+
+    Each ingestion batch is stored as one record of what it adds (its topics
+    and word counts), so saving costs O(batch) whatever the catalogue's size,
+    and workers sharing the store pick up each other's batches in refresh().
+    """
+
+    def __init__(self, store: Optional[Store] = None, legacy_path: str = CATALOG_PATH):
+        self.store = store if store is not None else InMemoryStore("topic_catalog", order_by="created_at")
+        self._lock = threading.Lock()
+        self._subjects: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # subject -> token -> number of chunks containing it
+        self._vocabulary: Dict[str, Dict[str, int]] = {}
+        # subject -> sorted [(search_term, key)] where search terms are word-boundary suffixes of keys
+        self._prefix_index: Dict[str, List[Tuple[str, str]]] = {}
+        # subject -> token -> keys containing it
+        self._token_index: Dict[str, Dict[str, set]] = {}
+        # Stored updates already applied, and the newest one's time
+        self._applied: set = set()
+        self._seen_until = 0.0
+        self._import_legacy(legacy_path)
+        self.refresh()
+        if self._subjects:
+            print(f"---LOADED TOPIC CATALOGUE: {len(self._subjects)} SUBJECTS---")
+
+    # Persistence
+    def _import_legacy(self, path: str):
+        """Store a catalogue file from before the catalogue was kept in the store (once, whichever worker wins)"""
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            subjects, vocabulary = (data["subjects"], data["vocabulary"]) if "vocabulary" in data else (data, {})
+            for subject, entries in subjects.items():
+                self.store.add(f"legacy:{subject}", {
+                    "subject": subject, "created_at": 0.0,
+                    "entries": entries, "vocabulary": vocabulary.get(subject, {})
+                })
+        except Exception as e:
+            print(f"Warning: topic catalogue file not imported: {e}")
+
+    def refresh(self) -> int:
+        """Apply updates stored since the last refresh (by any worker); returns how many"""
+        since = self._seen_until - CATALOG_REFRESH_WINDOW_SECONDS if self._seen_until else None
+        applied = 0
+        after = None
+        while True:
+            page = self.store.page(after, limit=CATALOG_REFRESH_PAGE, since=since)
+            for key, update in page:
+                with self._lock:
+                    if key not in self._applied:
+                        self._apply(key, update)
+                        applied += 1
+            if len(page) < CATALOG_REFRESH_PAGE:
+                return applied
+            after = (self.store.order_value(page[-1][1]), page[-1][0])
+
+    def _apply(self, key: str, update: Dict[str, Any]):
+        """Merge one stored update into the in-memory catalogue. Call with the lock held."""
+        subject = update["subject"]
+        entries = self._subjects.setdefault(subject, {})
+        vocabulary = self._vocabulary.setdefault(subject, {})
+        for token, chunk_count in update["vocabulary"].items():
+            vocabulary[token] = vocabulary.get(token, 0) + chunk_count
+        new_keys = []
+        for topic_key, added in update["entries"].items():
+            entry = entries.get(topic_key)
+            if entry is None:
+                entry = entries[topic_key] = {"topic": added["topic"], "chunk_count": 0, "chunk_ids": []}
+                new_keys.append(topic_key)
+            entry["chunk_count"] += added["chunk_count"]
+            entry["chunk_ids"].extend(added["chunk_ids"][:MAX_REPRESENTATIVE_CHUNKS - len(entry["chunk_ids"])])
+        self._index(subject, new_keys)
+        self._applied.add(key)
+        self._seen_until = max(self._seen_until, update["created_at"])
+
+    def _index(self, subject: str, keys: List[str]):
+        """Add new catalogue keys to the subject's lookup indexes"""
+        prefix_index = self._prefix_index.setdefault(subject, [])
+        token_index = self._token_index.setdefault(subject, {})
+        for key in keys:
+            words = key.split()
+            for i, word in enumerate(words):
+                prefix_index.append((" ".join(words[i:]), key))
+                token_index.setdefault(word, set()).add(key)
+        if keys:
+            prefix_index.sort()  # Mostly sorted already: close to linear
+
+    # Building
+    def add_chunks(self, subject: str, chunks: Iterable[Tuple[str, str]]) -> int:
+        """
+        Record topics for ingested chunks
+
+        Args:
+            subject: Subject the chunks were ingested under
+            chunks: (chunk_id, text) pairs
+
+        Returns:
+            Number of distinct topics in the subject after the update
+        """
+        # Only this batch's topics and words are extracted and stored
+        entries: Dict[str, Dict[str, Any]] = {}
+        vocabulary: Counter = Counter()
+        for chunk_id, text in chunks:
+            vocabulary.update(set(tokenize(text)))
+            labels = extract_headings(text) + extract_keyphrases(text)
+            seen = set()
+            for label in labels:
+                key = normalize_topic(label)
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                entry = entries.setdefault(key, {"topic": label, "chunk_count": 0, "chunk_ids": []})
+                entry["chunk_count"] += 1
+                if len(entry["chunk_ids"]) < MAX_REPRESENTATIVE_CHUNKS:
+                    entry["chunk_ids"].append(chunk_id)
+
+        key = uuid.uuid4().hex
+        update = {"subject": subject, "created_at": time.time(), "entries": entries, "vocabulary": dict(vocabulary)}
+        self.store[key] = update
+        with self._lock:
+            self._apply(key, update)
+            return len(self._subjects[subject])
+
+    # Lookups
+    def subjects(self) -> List[str]:
+        return list(self._subjects.keys())
+
+    def has_subject(self, subject: str) -> bool:
+        return bool(self._subjects.get(subject))
+
+    def _entry(self, subject: str, key: str) -> Dict[str, Any]:
+        entry = self._subjects[subject][key]
+        return {
+            "topic": entry["topic"],
+            "key": key,
+            "subject": subject,
+            "chunk_count": entry["chunk_count"],
+            "chunk_ids": list(entry["chunk_ids"]),
+        }
+
+    def suggest(self, subject: str, prefix: str = "", limit: int = 10) -> List[Dict[str, Any]]:
+        """Autocomplete topics whose key (or any word-suffix of it) starts with prefix"""
+        with self._lock:
+            if subject not in self._subjects:
+                return []
+
+            needle = normalize_topic(prefix) if prefix.strip() else ""
+            if prefix and not needle:
+                # Prefix was only a stopword or a partial word; fall back to raw lowercase text
+                needle = prefix.strip().lower()
+
+            keys = set()
+            if needle:
+                index = self._prefix_index.get(subject, [])
+                pos = bisect_left(index, (needle, ""))
+                while pos < len(index) and index[pos][0].startswith(needle):
+                    keys.add(index[pos][1])
+                    pos += 1
+            else:
+                keys = set(self._subjects[subject].keys())
+
+            ranked = sorted(
+                keys,
+                key=lambda k: (-self._subjects[subject][k]["chunk_count"], len(k), k)
+            )
+            return [self._entry(subject, key) for key in ranked[:limit]]
+
+    def _score(self, subject: str, tokens: List[str]) -> Tuple[float, List[Tuple[int, str]]]:
+        """
+        Share of the topic's words found in a subject, and the keys sharing words with it
+
+        Keys come back as (words shared, key), best first. Call with the lock held.
+        """
+        token_index = self._token_index.get(subject, {})
+        vocabulary = self._vocabulary.get(subject, {})
+        overlap: Counter = Counter()
+        found = 0
+        for token in tokens:
+            keys = token_index.get(token, ())
+            overlap.update(keys)
+            if keys or token in vocabulary:
+                found += 1
+        entries = self._subjects[subject]
+        ranked = sorted(overlap.items(), key=lambda item: (-item[1], -entries[item[0]]["chunk_count"], item[0]))
+        return found / len(tokens), [(shared, key) for key, shared in ranked]
+
+    def match(self, topic: str, subject: Optional[str] = None, limit: int = 5) -> Dict[str, Any]:
+        """
+        Check whether a free-text topic is covered by ingested material
+
+        Returns a dict with:
+            known: True when at least TOPIC_MATCH_THRESHOLD of the topic's words are
+                covered, False otherwise, None when no catalogue exists for the subject(s)
+            coverage: Share of the topic's words found in the material (0 to 1)
+            chunk_count: Estimated number of chunks covering the topic
+            chunk_ids: Representative chunk IDs
+            suggestions: Closest catalogue topics when the topic is not fully matched
+        """
+        subjects = [subject] if subject else self.subjects()
+        subjects = [s for s in subjects if self.has_subject(s)]
+        if not subjects:
+            return {"known": None, "coverage": 0.0, "chunk_count": 0, "chunk_ids": [], "suggestions": []}
+
+        tokens = tokenize(topic)
+        best = (0.0, None, False)  # (coverage, best entry, exact match)
+        suggestions: List[Dict[str, Any]] = []
+        seen = set()
+        for subj in subjects:
+            if not tokens:
+                continue
+            with self._lock:
+                coverage, keys = self._score(subj, tokens)
+                entry = self._entry(subj, keys[0][1]) if keys else None
+                # Keys containing every word of the topic are exact matches
+                exact = bool(keys) and keys[0][0] == len(tokens)
+                if exact:
+                    coverage = 1.0
+                for shared, key in keys[:limit]:
+                    if shared < len(tokens) and (subj, key) not in seen:
+                        seen.add((subj, key))
+                        suggestions.append(self._entry(subj, key))
+            if (coverage, entry["chunk_count"] if entry else 0) > (best[0], best[1]["chunk_count"] if best[1] else 0):
+                best = (coverage, entry, exact)
+
+        coverage, entry, exact = best
+        if exact:
+            suggestions = []
+        elif not suggestions:
+            # Nothing shares a word: suggest catalogue entries sharing a word prefix, then close spellings
+            for subj in subjects:
+                for token in tokens or [topic]:
+                    for suggestion in self.suggest(subj, token, limit):
+                        if (subj, suggestion["key"]) not in seen:
+                            seen.add((subj, suggestion["key"]))
+                            suggestions.append(suggestion)
+                if not suggestions and tokens:
+                    with self._lock:
+                        close = get_close_matches(" ".join(tokens), list(self._subjects[subj].keys()), n=limit, cutoff=0.75)
+                        for key in close:
+                            seen.add((subj, key))
+                            suggestions.append(self._entry(subj, key))
+        suggestions.sort(key=lambda e: -e["chunk_count"])
+
+        result = {
+            "known": coverage >= TOPIC_MATCH_THRESHOLD,
+            "coverage": round(coverage, 2),
+            "chunk_count": entry["chunk_count"] if entry else 0,
+            "chunk_ids": entry["chunk_ids"] if entry else [],
+            "suggestions": suggestions[:limit],
+        }
+        if entry:
+            result["matched_topic"] = entry["topic"]
+            result["subject"] = entry["subject"]
+        return result
+
+
+def has_material(coverage: Dict[str, Any]) -> bool:
+    """Whether generation should go ahead: some of the topic's words were found (or nothing is catalogued)"""
+    return coverage["known"] is not False or coverage["coverage"] > 0
+
+
+def topic_suggestions(coverage: Dict[str, Any]) -> List[str]:
+    """Closest catalogue topics to offer when a topic is only partly covered"""
+    if coverage["known"]:
+        return []
+    return [suggestion["topic"] for suggestion in coverage["suggestions"]]
+
+
+def unknown_topic_message(topic: str, coverage: Dict[str, Any]) -> str:
+    """User-facing rejection message for a topic with no indexed material"""
+    message = f"No indexed material matches topic '{topic}'."
+    if coverage.get("suggestions"):
+        names = ", ".join(s["topic"] for s in coverage["suggestions"])
+        message += f" Try one of: {names}"
+    return message
+
+
+async def follow_catalog(catalog: "TopicCatalog", interval: int = TOPIC_CATALOG_REFRESH_SECONDS):
+    """Background task: pick up topics other workers catalogue (off the event loop)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(None, catalog.refresh)
+        except Exception as e:
+            print(f"Error refreshing topic catalogue: {e}")
+
+
+# Shared catalogue instance (shared between workers with STORAGE_BACKEND=sqlite)
+topic_catalog = TopicCatalog(open_store("topic_catalog", order_by="created_at"))
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from topic_catalog import normalize_topic
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+# One retrieval per (subject, topic) feeds quiz, flashcard and exam generation
+CONTEXT_TTL_SECONDS = int(os.getenv("TOPIC_CONTEXT_TTL_SECONDS", "900"))
+CONTEXT_K = int(os.getenv("TOPIC_CONTEXT_K", "20"))
+MAX_CACHED_TOPICS = int(os.getenv("TOPIC_CONTEXT_MAX_TOPICS", "500"))
+
+ContextKey = Tuple[str, str]
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count with tiktoken when available, ~4 characters per token otherwise"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def fit_to_budget(documents: list, max_tokens: int) -> list:
+    """Take documents in relevance order until the token budget is spent"""
+    selected = []
+    used = 0
+    for doc in documents:
+        cost = estimate_tokens(doc.page_content)
+        if selected and used + cost > max_tokens:
+            break
+        selected.append(doc)
+        used += cost
+    return selected
+
+
+class TopicContextService:
+    """
+    Shared, TTL-cached retrieval context keyed by (subject, topic).
+
+    Generators draw from the same chunk set with their own token budgets, so a
+    student making flashcards and then a quiz on one topic pays for one retrieval.
+    Entries for a subject are invalidated when new material is ingested for it.
+    """
+
+    def __init__(self, retriever_factory: Callable[..., Any], ttl: int = CONTEXT_TTL_SECONDS, k: int = CONTEXT_K):
+        self.retriever_factory = retriever_factory
+        self.ttl = ttl
+        self.k = k
+        self._cache: Dict[ContextKey, Tuple[float, list]] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[ContextKey, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, topic: str, subject: Optional[str]) -> ContextKey:
+        return (subject or "", normalize_topic(topic) or topic.strip().lower())
+
+    def _cached(self, key: ContextKey) -> Optional[list]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] > time.time():
+                return entry[1]
+        return None
+
+    def get(self, topic: str, subject: Optional[str] = None) -> list:
+        """Retrieved documents for a topic, most relevant first"""
+        key = self._key(topic, subject)
+        documents = self._cached(key)
+        if documents is not None:
+            self.hits += 1
+            print(f"---TOPIC CONTEXT CACHE HIT: {key}---")
+            return documents
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Only one thread retrieves a given topic; the others wait and reuse it
+        with key_lock:
+            documents = self._cached(key)
+            if documents is not None:
+                self.hits += 1
+                return documents
+
+            self.misses += 1
+            search_query = f"{topic} concepts definitions theory applications examples"
+            if subject:
+                search_query = f"{subject} {search_query}"
+            documents = self.retriever_factory(subject=subject, k=self.k).invoke(search_query)
+            print(f"---TOPIC CONTEXT RETRIEVED {len(documents)} DOCUMENTS: {key}---")
+
+            with self._lock:
+                if len(self._cache) >= MAX_CACHED_TOPICS:
+                    oldest = min(self._cache, key=lambda k: self._cache[k][0])
+                    del self._cache[oldest]
+                self._cache[key] = (time.time() + self.ttl, documents)
+                self._key_locks.pop(key, None)
+            return documents
+
+    def invalidate(self, subject: Optional[str] = None):
+        """Drop cached contexts for a subject (plus unfiltered ones), or everything"""
+        with self._lock:
+            if subject is None:
+                self._cache.clear()
+                return
+            for key in [k for k in self._cache if k[0] in (subject, "")]:
+                del self._cache[key]
+
+
+def _default_retriever_factory(subject=None, k=None):
+    from ingestion import get_retriever
+    return get_retriever(subject=subject, k=k)
+
+
+# Shared context service instance
+topic_context = TopicContextService(_default_retriever_factory)
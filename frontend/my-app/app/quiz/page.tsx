@@ -65,7 +65,7 @@ export default function ProctoredQuizPage() {
 
     const interval = setInterval(async () => {
       try {
-        const response = await fetch(`${API_BASE}/proctoring/status`)
+        const response = await fetch(`${API_BASE}/proctoring/status/${username.trim()}`)
         const data = await response.json()
         setStatus(data)
 
@@ -143,7 +143,7 @@ export default function ProctoredQuizPage() {
 
   const handleStopProctoring = async () => {
     try {
-      await fetch(`${API_BASE}/proctoring/stop`, { method: "POST" })
+      await fetch(`${API_BASE}/proctoring/stop/${username.trim()}`, { method: "POST" })
       setProctoringActive(false)
     } catch (err) {
       console.error("[v0] Error stopping proctoring:", err)